@@ -0,0 +1,112 @@
+import array
+import math
+import os
+import struct
+import threading
+
+EMBEDDING_DIM = 128
+EMBEDDING_DTYPES = {"float32": "f", "float16": "e"}
+
+RECORD = struct.Struct(f"<32s{EMBEDDING_DIM}f")
+
+
+class EmbeddingStore:
+    """Append-only file of face encodings keyed by the photo's SHA-256.
+
+    Every record is the 32-byte digest followed by 128 little-endian float32
+    values, so a face costs 544 bytes on disk and 512 in memory. Photos in
+    which no face was found are stored with NaN values. The last record for a
+    digest wins; ``compact`` rewrites the file without superseded records or
+    photos that no longer exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.embeddings = {}
+        self.records = 0
+        self.load()
+
+    def load(self):
+        try:
+            f = open(self.path, "r+b")
+        except FileNotFoundError:
+            return
+
+        with f:
+            while True:
+                chunk = f.read(RECORD.size)
+                if len(chunk) < RECORD.size:
+                    break
+
+                digest, *values = RECORD.unpack(chunk)
+                if math.isnan(values[0]):
+                    self.embeddings[digest.hex()] = None
+                else:
+                    self.embeddings[digest.hex()] = array.array("f", values)
+                self.records += 1
+
+            # Drop a record torn by a crash mid-append so later appends stay aligned
+            f.truncate(self.records * RECORD.size)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.embeddings)
+
+    def __contains__(self, content_hash):
+        with self.lock:
+            return content_hash in self.embeddings
+
+    def get(self, content_hash):
+        """Return the encoding, or None for a photo without a face."""
+        with self.lock:
+            return self.embeddings.get(content_hash)
+
+    def put(self, content_hash, embedding):
+        if embedding is None:
+            values = array.array("f", [math.nan] * EMBEDDING_DIM)
+        else:
+            values = array.array("f", (float(v) for v in embedding))
+        if len(values) != EMBEDDING_DIM:
+            raise ValueError(
+                f"Expected {EMBEDDING_DIM} values, got {len(values)} for {content_hash}"
+            )
+
+        record = RECORD.pack(bytes.fromhex(content_hash), *values)
+        with self.lock:
+            with open(self.path, "ab") as f:
+                f.write(record)
+            self.embeddings[content_hash] = None if embedding is None else values
+            self.records += 1
+
+    def pack(self, content_hash, dtype="float32"):
+        """Return the encoding as little-endian bytes of ``dtype``."""
+        embedding = self.get(content_hash)
+        if embedding is None:
+            return None
+        return struct.pack(f"<{EMBEDDING_DIM}{EMBEDDING_DTYPES[dtype]}", *embedding)
+
+    def needs_compaction(self, live_count):
+        with self.lock:
+            return self.records > 2 * max(live_count, 16)
+
+    def compact(self, keep_hashes):
+        keep_hashes = set(keep_hashes)
+        tmp_path = f"{self.path}.tmp"
+
+        with self.lock:
+            embeddings = {
+                content_hash: embedding
+                for content_hash, embedding in self.embeddings.items()
+                if content_hash in keep_hashes
+            }
+
+            with open(tmp_path, "wb") as f:
+                for content_hash, embedding in embeddings.items():
+                    if embedding is None:
+                        embedding = [math.nan] * EMBEDDING_DIM
+                    f.write(RECORD.pack(bytes.fromhex(content_hash), *embedding))
+            os.replace(tmp_path, self.path)
+
+            self.embeddings = embeddings
+            self.records = len(embeddings)
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+
+SLOT_DIR = "slots"
+
+
+class IntruderStore:
+    """Fixed ring of intruder photo slots per device, indexed in SQLite.
+
+    Upload number ``seq`` of a device always goes to slot ``seq % max_photos``,
+    so storing a photo is one file write (tmp file + rename) and one index
+    row update, and the oldest photo is overwritten in place instead of
+    renaming and deleting files. The n-th newest photo is found from the
+    device's latest committed sequence number without listing the
+    directory. Uploads of one device are stored one at a time, and the
+    sequence number only advances once the index row is committed, so a
+    failed upload leaves no gap and readers never see a photo in flight.
+    """
+
+    def __init__(self, db_path, max_photos):
+        self.max_photos = max_photos
+        self.lock = threading.Lock()
+        self.latest_seq = {}
+        self.device_locks = {}
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS intruder_photos (
+                    device_id TEXT NOT NULL,
+                    slot INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    uploaded_at REAL NOT NULL,
+                    detected_at TEXT,
+                    PRIMARY KEY (device_id, slot)
+                )
+                """)
+            self.conn.commit()
+
+    def slot_path(self, intruder_dir, slot):
+        return os.path.join(intruder_dir, SLOT_DIR, f"slot{slot:03d}.jpg")
+
+    def _latest_seq(self, device_id):
+        if device_id not in self.latest_seq:
+            row = self.conn.execute(
+                "SELECT MAX(seq) FROM intruder_photos WHERE device_id = ?",
+                (device_id,),
+            ).fetchone()
+            self.latest_seq[device_id] = -1 if row[0] is None else row[0]
+        return self.latest_seq[device_id]
+
+    def add(
+        self, device_id, intruder_dir, image_data, detected_at=None, uploaded_at=None
+    ):
+        with self.lock:
+            device_lock = self.device_locks.setdefault(device_id, threading.Lock())
+
+        with device_lock:
+            with self.lock:
+                seq = self._latest_seq(device_id) + 1
+
+            slot = seq % self.max_photos
+            path = self.slot_path(intruder_dir, slot)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_data)
+            os.replace(tmp_path, path)
+
+            with self.lock:
+                # Commits the row, or rolls it back if it cannot be written
+                with self.conn:
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO intruder_photos "
+                        "(device_id, slot, seq, uploaded_at, detected_at) VALUES (?, ?, ?, ?, ?)",
+                        (device_id, slot, seq, uploaded_at or time.time(), detected_at),
+                    )
+                self.latest_seq[device_id] = seq
+        return seq
+
+    def newest(self, device_id, intruder_dir, rank=1):
+        """Return ``(path, row)`` of the ``rank``-th newest photo, or None."""
+        if rank < 1 or rank > self.max_photos:
+            return None
+
+        with self.lock:
+            seq = self._latest_seq(device_id) - (rank - 1)
+            if seq < 0:
+                return None
+
+            slot = seq % self.max_photos
+            row = self.conn.execute(
+                "SELECT seq, uploaded_at, detected_at FROM intruder_photos "
+                "WHERE device_id = ? AND slot = ?",
+                (device_id, slot),
+            ).fetchone()
+
+        # The oldest slot is overwritten before the new upload is committed
+        if row is None or row[0] != seq:
+            return None
+        return self.slot_path(intruder_dir, slot), row
+
+    def has_photos(self, device_id):
+        with self.lock:
+            return self._latest_seq(device_id) >= 0
+
+    def list(self, device_id):
+        """Return ``(rank, seq, uploaded_at, detected_at)``, newest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, uploaded_at, detected_at FROM intruder_photos "
+                "WHERE device_id = ? ORDER BY seq DESC",
+                (device_id,),
+            ).fetchall()
+        return [(rank, *row) for rank, row in enumerate(rows, 1)]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
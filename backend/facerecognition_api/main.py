@@ -1,20 +1,61 @@
-from flask import Flask, request, jsonify, send_from_directory, render_template
+from flask import (
+    Flask,
+    Response,
+    request,
+    jsonify,
+    send_file,
+    send_from_directory,
+    render_template,
+    stream_with_context,
+)
 import os
 import base64
+import json
+import uuid
 import re
-import shutil
+import hashlib
+import queue
+import threading
+from urllib.parse import quote
 from werkzeug.utils import secure_filename
 import glob
 
+from embedding_store import EMBEDDING_DIM, EMBEDDING_DTYPES, EmbeddingStore
+from intruder_store import IntruderStore
+
+try:
+    import face_recognition
+except ImportError:
+    # Without dlib here, encodings are computed by the face recognition
+    # workers and posted back to /<device_id>/knownface_embeddings/.
+    face_recognition = None
+
 app = Flask(__name__)
 
 BASE_DIR = "photo_storage"
 MAX_INTRUDER_PHOTOS = 30
+MAX_KNOWNFACE_PAGE_SIZE = 1000
+EMBEDDING_STORE_FILE = "knownface_embeddings.bin"
+INTRUDER_INDEX_FILE = "intruder_index.sqlite3"
+INTRUDER_PHOTO_PATTERN = re.compile(r"^intruder(\d+)\.jpg$")
 PORT = 4998
 HOST = "0.0.0.0"
 
 os.makedirs(BASE_DIR, exist_ok=True)
 
+intruder_store = IntruderStore(
+    os.path.join(BASE_DIR, INTRUDER_INDEX_FILE), MAX_INTRUDER_PHOTOS
+)
+
+# path -> (size, mtime_ns, sha256), so unchanged photos are not re-hashed
+file_hashes = {}
+file_hashes_lock = threading.Lock()
+
+embedding_stores = {}
+embedding_stores_lock = threading.Lock()
+encoding_queue = queue.Queue()
+queued_hashes = set()
+
 
 def ensure_id_folders(device_id):
     device_id = secure_filename(device_id)
@@ -30,13 +71,23 @@ def ensure_id_folders(device_id):
     return device_dir, intruder_dir, knownface_dir
 
 
-def save_base64_image(base64_data, folder, filename):
+def decode_base64_image(base64_data):
     if "," in base64_data:
         base64_data = base64_data.split(",", 1)[1]
 
     try:
-        image_data = base64.b64decode(base64_data)
+        return base64.b64decode(base64_data)
+    except Exception as e:
+        print(f"Error decoding image: {str(e)}")
+        return None
+
 
+def save_base64_image(base64_data, folder, filename):
+    image_data = decode_base64_image(base64_data)
+    if image_data is None:
+        return False
+
+    try:
         filepath = os.path.join(folder, filename)
         with open(filepath, "wb") as f:
             f.write(image_data)
@@ -46,28 +97,161 @@ def save_base64_image(base64_data, folder, filename):
         return False
 
 
-def reorganize_intruder_photos(intruder_folder):
-    files = glob.glob(os.path.join(intruder_folder, "intruder*.jpg"))
+def file_sha256(path, stat):
+    with file_hashes_lock:
+        cached = file_hashes.get(path)
+    if cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+        return cached[2]
 
-    latest_path = os.path.join(intruder_folder, "latest.jpg")
-    if os.path.exists(latest_path) and latest_path in files:
-        files.remove(latest_path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
 
-    files.sort(key=os.path.getmtime, reverse=True)
+    with file_hashes_lock:
+        file_hashes[path] = (stat.st_size, stat.st_mtime_ns, content_hash)
+    return content_hash
+
+
+def knownface_manifest_entries(device_id, knownface_dir):
+    entries = []
+    with os.scandir(knownface_dir) as it:
+        for entry in it:
+            if not entry.is_file() or not entry.name.lower().endswith(
+                (".jpg", ".jpeg", ".png")
+            ):
+                continue
+
+            stat = entry.stat()
+            entries.append(
+                {
+                    "filename": entry.name,
+                    "size": stat.st_size,
+                    "sha256": file_sha256(entry.path, stat),
+                    "mtime": stat.st_mtime,
+                    "url": f"/{device_id}/knownface_photo/{quote(entry.name)}",
+                }
+            )
+
+    entries.sort(key=lambda e: e["filename"])
+    return entries
+
+
+def get_embedding_store(device_id):
+    device_dir, _, _ = ensure_id_folders(device_id)
+    with embedding_stores_lock:
+        store = embedding_stores.get(device_dir)
+        if store is None:
+            store = EmbeddingStore(os.path.join(device_dir, EMBEDDING_STORE_FILE))
+            embedding_stores[device_dir] = store
+    return store
+
+
+def compact_embedding_store(device_id, store, knownface_dir, live_hashes=None):
+    """Rewrite the store without superseded encodings once they dominate it.
+
+    Called after writes only, so serving embeddings never rewrites the file.
+    The photos are hashed only when the store is due for compaction.
+    """
+    if live_hashes is None:
+        live_count = sum(
+            1
+            for name in os.listdir(knownface_dir)
+            if name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        if not store.needs_compaction(live_count):
+            return
+        live_hashes = {
+            entry["sha256"]
+            for entry in knownface_manifest_entries(device_id, knownface_dir)
+        }
+
+    if store.needs_compaction(len(live_hashes)):
+        store.compact(live_hashes)
+        print(f"Compacted face encodings of {device_id} to {len(store)} records")
+
+
+def encode_knownface(path):
+    image = face_recognition.load_image_file(path)
+    face_locations = face_recognition.face_locations(image, model="hog")
+    if not face_locations:
+        return None
+    return face_recognition.face_encodings(image, face_locations)[0]
+
+
+def encoding_worker():
+    while True:
+        device_id, path, content_hash = encoding_queue.get()
+        try:
+            store = get_embedding_store(device_id)
+            if content_hash not in store:
+                store.put(content_hash, encode_knownface(path))
+                print(f"Stored face encoding for {path}")
+                compact_embedding_store(device_id, store, os.path.dirname(path))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error encoding {path}: {str(e)}")
+        finally:
+            with embedding_stores_lock:
+                queued_hashes.discard((device_id, content_hash))
+
+
+def queue_knownface_encoding(device_id, path, content_hash):
+    """Queue a photo for encoding on this server. Returns False when the
+    server cannot encode and the photo has to wait for a worker."""
+    if face_recognition is None:
+        return False
 
-    for i, file_path in enumerate(files, 2):
-        new_name = os.path.join(intruder_folder, f"intruder{i}.jpg")
+    with embedding_stores_lock:
+        if (device_id, content_hash) in queued_hashes:
+            return True
+        queued_hashes.add((device_id, content_hash))
+    encoding_queue.put((device_id, path, content_hash))
+    return True
 
-        if file_path != new_name:
-            if os.path.exists(new_name):
-                os.remove(new_name)
-            os.rename(file_path, new_name)
 
-    all_files = glob.glob(os.path.join(intruder_folder, "intruder*.jpg"))
-    all_files.sort(key=os.path.getmtime, reverse=True)
-    for old_file in all_files[MAX_INTRUDER_PHOTOS - 1 :]:
-        if os.path.exists(old_file):
-            os.remove(old_file)
+def migrate_legacy_intruder_photos():
+    """Move photos from before the slot index (latest.jpg, intruderN.jpg) into
+    the ring, oldest first, and delete the old files so they are never served
+    in place of newer uploads. Devices that already use the ring are skipped.
+    """
+    for device_id in os.listdir(BASE_DIR):
+        intruder_dir = os.path.join(BASE_DIR, device_id, "intruder_photo")
+        if not os.path.isdir(intruder_dir):
+            continue
+
+        legacy = [
+            os.path.join(intruder_dir, name)
+            for name in os.listdir(intruder_dir)
+            if INTRUDER_PHOTO_PATTERN.match(name)
+        ]
+        latest_path = os.path.join(intruder_dir, "latest.jpg")
+        if not legacy and os.path.exists(latest_path):
+            legacy.append(latest_path)
+        if not legacy:
+            continue
+
+        if not intruder_store.has_photos(device_id):
+            legacy.sort(key=os.path.getmtime)
+            for path in legacy[-MAX_INTRUDER_PHOTOS:]:
+                with open(path, "rb") as f:
+                    intruder_store.add(
+                        device_id,
+                        intruder_dir,
+                        f.read(),
+                        uploaded_at=os.path.getmtime(path),
+                    )
+            print(f"Migrated {len(legacy)} legacy intruder photos of {device_id}")
+
+        # latest.jpg was a copy of intruder1.jpg
+        for path in legacy + [latest_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+migrate_legacy_intruder_photos()
 
 
 @app.route("/<device_id>/upload_intruder/", methods=["POST"])
@@ -77,24 +261,26 @@ def upload_intruder(device_id):
 
     _, intruder_dir, _ = ensure_id_folders(device_id)
 
-    base64_data = request.json["image"]
-
-    if save_base64_image(base64_data, intruder_dir, "latest.jpg"):
-        shutil.copy2(
-            os.path.join(intruder_dir, "latest.jpg"),
-            os.path.join(intruder_dir, "intruder1.jpg"),
-        )
+    image_data = decode_base64_image(request.json["image"])
+    if image_data is None:
+        return jsonify({"error": "Failed to save image"}), 500
 
-        reorganize_intruder_photos(intruder_dir)
-        return (
-            jsonify(
-                {"success": True, "message": "Intruder photo uploaded successfully"}
-            ),
-            200,
+    try:
+        intruder_store.add(
+            secure_filename(device_id),
+            intruder_dir,
+            image_data,
+            request.json.get("detected_at"),
         )
-    else:
+    except Exception as e:
+        print(f"Error saving intruder photo: {str(e)}")
         return jsonify({"error": "Failed to save image"}), 500
 
+    return (
+        jsonify({"success": True, "message": "Intruder photo uploaded successfully"}),
+        200,
+    )
+
 
 @app.route("/<device_id>/upload_knownface/", methods=["POST"])
 def upload_knownface(device_id):
@@ -110,9 +296,17 @@ def upload_knownface(device_id):
         name = name + ".jpg"
 
     if save_base64_image(base64_data, knownface_dir, name):
+        path = os.path.join(knownface_dir, name)
+        content_hash = file_sha256(path, os.stat(path))
+        queued = queue_knownface_encoding(secure_filename(device_id), path, content_hash)
         return (
             jsonify(
-                {"success": True, "message": "Known face photo uploaded successfully"}
+                {
+                    "success": True,
+                    "message": "Known face photo uploaded successfully",
+                    "sha256": content_hash,
+                    "embedding_status": "queued" if queued else "pending",
+                }
             ),
             200,
         )
@@ -124,9 +318,10 @@ def upload_knownface(device_id):
 def list_intruder_photos(device_id):
     _, intruder_dir, _ = ensure_id_folders(device_id)
 
-    files = glob.glob(os.path.join(intruder_dir, "*.jpg"))
-    files = [os.path.basename(f) for f in files]
-    files.sort()
+    entries = intruder_store.list(secure_filename(device_id))
+    files = []
+    if entries:
+        files = ["latest.jpg"] + [f"intruder{entry[0]}.jpg" for entry in entries]
 
     html = f"""
     <html>
@@ -202,23 +397,202 @@ def list_knownface_photos(device_id):
     return html
 
 
+def read_knownface_photos(knownface_dir, filenames):
+    for fname in filenames:
+        try:
+            with open(os.path.join(knownface_dir, fname), "rb") as f:
+                yield fname, f.read()
+        except FileNotFoundError:
+            # Deleted after the directory was listed
+            continue
+
+
 @app.route("/<device_id>/knownface_json/", methods=["GET"])
 def list_knownface_json(device_id):
+    """Stream known-face photos one at a time.
+
+    Without parameters the body is the original JSON array of
+    ``{"filename", "data"}`` objects with base64 data. ``limit`` and
+    ``cursor`` page through the photos in filename order; when more remain
+    the next cursor is sent in the ``X-Next-Cursor`` header. ``format=multipart``
+    sends the raw image bytes as ``multipart/mixed`` parts instead of base64.
+    """
     _, _, knownface_dir = ensure_id_folders(device_id)
-    entries = []
-    for fname in os.listdir(knownface_dir):
-        if fname.lower().endswith((".jpg", ".png")):
-            path = os.path.join(knownface_dir, fname)
-            with open(path, "rb") as f:
-                b64 = base64.b64encode(f.read()).decode("utf-8")
-            entries.append({"filename": fname, "data": b64})
-    return jsonify(entries)
+
+    cursor = request.args.get("cursor", "")
+    limit = request.args.get("limit", type=int)
+    output_format = request.args.get("format", "json")
+
+    filenames = sorted(
+        fname
+        for fname in os.listdir(knownface_dir)
+        if fname.lower().endswith((".jpg", ".png")) and fname > cursor
+    )
+
+    next_cursor = None
+    if limit is not None:
+        limit = min(max(limit, 1), MAX_KNOWNFACE_PAGE_SIZE)
+        if len(filenames) > limit:
+            filenames = filenames[:limit]
+            next_cursor = filenames[-1]
+
+    if output_format == "multipart":
+        boundary = uuid.uuid4().hex
+
+        def generate():
+            for fname, image_data in read_knownface_photos(knownface_dir, filenames):
+                mimetype = "image/png" if fname.lower().endswith(".png") else "image/jpeg"
+                yield (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {mimetype}\r\n"
+                    f'Content-Disposition: attachment; filename="{fname}"\r\n'
+                    f"Content-Length: {len(image_data)}\r\n\r\n"
+                ).encode("utf-8") + image_data + b"\r\n"
+            yield f"--{boundary}--\r\n".encode("utf-8")
+
+        mimetype = f"multipart/mixed; boundary={boundary}"
+    else:
+
+        def generate():
+            yield "["
+            separator = ""
+            for fname, image_data in read_knownface_photos(knownface_dir, filenames):
+                b64 = base64.b64encode(image_data).decode("utf-8")
+                yield separator + json.dumps({"filename": fname, "data": b64})
+                separator = ","
+            yield "]"
+
+        mimetype = "application/json"
+
+    response = Response(stream_with_context(generate()), mimetype=mimetype)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return response
+
+
+@app.route("/<device_id>/knownface_manifest/", methods=["GET"])
+def knownface_manifest(device_id):
+    _, _, knownface_dir = ensure_id_folders(device_id)
+    device_id = secure_filename(device_id)
+    entries = knownface_manifest_entries(device_id, knownface_dir)
+
+    # The ETag changes whenever a photo is added, removed or replaced, so a
+    # client that already applied this manifest gets a 304.
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(f"{entry['filename']}:{entry['sha256']}\n".encode("utf-8"))
+
+    response = jsonify(
+        {
+            "device_id": device_id,
+            "count": len(entries),
+            "faces": entries,
+            "embeddings_url": f"/{device_id}/knownface_embeddings/",
+        }
+    )
+    response.set_etag(digest.hexdigest())
+    return response.make_conditional(request)
+
+
+@app.route("/<device_id>/knownface_embeddings/", methods=["GET"])
+def list_knownface_embeddings(device_id):
+    """Serve the stored 128-d encoding of every known-face photo.
+
+    Each face has a ``status`` of ``ready`` (with a base64 ``embedding`` of
+    little-endian ``dtype`` values, float32 by default or float16), ``no_face``,
+    or ``queued``/``pending`` while it waits for this server's encoder or for
+    a worker to post it back.
+    """
+    _, _, knownface_dir = ensure_id_folders(device_id)
+    device_id = secure_filename(device_id)
+
+    dtype = request.args.get("dtype", "float32")
+    if dtype not in EMBEDDING_DTYPES:
+        return jsonify({"error": f"dtype must be one of {sorted(EMBEDDING_DTYPES)}"}), 400
+
+    store = get_embedding_store(device_id)
+    faces = []
+    for entry in knownface_manifest_entries(device_id, knownface_dir):
+        content_hash = entry["sha256"]
+        face = {"filename": entry["filename"], "sha256": content_hash}
+
+        if content_hash not in store:
+            path = os.path.join(knownface_dir, entry["filename"])
+            queued = queue_knownface_encoding(device_id, path, content_hash)
+            face["status"] = "queued" if queued else "pending"
+        elif store.get(content_hash) is None:
+            face["status"] = "no_face"
+        else:
+            face["status"] = "ready"
+            face["embedding"] = base64.b64encode(
+                store.pack(content_hash, dtype)
+            ).decode("utf-8")
+        faces.append(face)
+
+    return jsonify(
+        {
+            "device_id": device_id,
+            "dim": EMBEDDING_DIM,
+            "dtype": dtype,
+            "count": len(faces),
+            "faces": faces,
+        }
+    )
+
+
+@app.route("/<device_id>/knownface_embeddings/", methods=["POST"])
+def store_knownface_embeddings(device_id):
+    """Accept encodings computed by a face recognition worker.
+
+    Body: ``{"faces": [{"sha256": ..., "embedding": [128 floats] or null}]}``.
+    Only photos that currently exist and have no stored encoding are updated.
+    """
+    faces = (request.get_json(silent=True) or {}).get("faces")
+    if not isinstance(faces, list):
+        return jsonify({"error": "No faces provided"}), 400
+
+    _, _, knownface_dir = ensure_id_folders(device_id)
+    device_id = secure_filename(device_id)
+    store = get_embedding_store(device_id)
+    live_hashes = {
+        entry["sha256"] for entry in knownface_manifest_entries(device_id, knownface_dir)
+    }
+
+    stored = 0
+    for face in faces:
+        content_hash = face.get("sha256") if isinstance(face, dict) else None
+        if content_hash not in live_hashes or content_hash in store:
+            continue
+        try:
+            store.put(content_hash, face.get("embedding"))
+            stored += 1
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": f"Invalid embedding for {content_hash}: {e}"}), 400
+
+    if stored:
+        compact_embedding_store(device_id, store, knownface_dir, live_hashes)
+
+    return jsonify({"success": True, "stored": stored})
 
 
 @app.route("/<device_id>/intruder_photo/<filename>")
 def serve_intruder_photo(device_id, filename):
     _, intruder_dir, _ = ensure_id_folders(device_id)
-    return send_from_directory(intruder_dir, filename)
+
+    # latest.jpg and intruderN.jpg (N-th newest) are resolved through the
+    # slot index; legacy files were moved into it at startup.
+    rank = 1 if filename == "latest.jpg" else None
+    match = INTRUDER_PHOTO_PATTERN.match(filename)
+    if match:
+        rank = int(match.group(1))
+
+    if rank is not None:
+        found = intruder_store.newest(secure_filename(device_id), intruder_dir, rank)
+        if found is not None:
+            path, _ = found
+            return send_file(os.path.abspath(path), mimetype="image/jpeg")
+
+    return jsonify({"error": "Photo not found"}), 404
 
 
 @app.route("/<device_id>/knownface_photo/<filename>")
@@ -316,12 +690,24 @@ Content-Type: application/json
             <ul>
                 <li>Intruder photos: <code>/{DEVICE_ID}/intruder_photo/latest.jpg</code></li>
                 <li>Known face photos: <code>/{DEVICE_ID}/knownface_photo/{name}.jpg</code></li>
+                <li>Known face manifest (filename, size, sha256, mtime): <code>/{DEVICE_ID}/knownface_manifest/</code></li>
+                <li>Known face encodings: <code>GET /{DEVICE_ID}/knownface_embeddings/?dtype=float16</code>, workers post missing ones back to the same URL</li>
+                <li>Known face photos as JSON: <code>/{DEVICE_ID}/knownface_json/?limit=100&amp;cursor={LAST_FILENAME}</code> (next cursor in the <code>X-Next-Cursor</code> header, add <code>format=multipart</code> for raw image parts)</li>
             </ul>
         </body>
     </html>
     """
 
 
+if face_recognition is not None:
+    threading.Thread(target=encoding_worker, daemon=True).start()
+else:
+    print(
+        "face_recognition is not installed; known face photos wait for the "
+        "face recognition workers to post their encodings"
+    )
+
+
 if __name__ == "__main__":
     print(f"Starting server on http://{HOST}:{PORT}")
     app.run(host=HOST, port=PORT, debug=True)
@@ -0,0 +1,118 @@
+import hashlib
+import os
+import struct
+
+import pytest
+
+from embedding_store import EMBEDDING_DIM, RECORD, EmbeddingStore
+
+
+def digest(name):
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+def embedding(seed):
+    return [((seed * 31 + i) % 97) / 97.0 for i in range(EMBEDDING_DIM)]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    store = EmbeddingStore(path)
+    store.put(digest("a"), embedding(1))
+    store.put(digest("b"), embedding(2))
+
+    loaded = EmbeddingStore(path)
+    assert len(loaded) == 2
+    assert digest("a") in loaded
+    assert list(loaded.get(digest("a"))) == pytest.approx(embedding(1), abs=1e-6)
+    assert list(loaded.get(digest("b"))) == pytest.approx(embedding(2), abs=1e-6)
+    assert os.path.getsize(path) == 2 * RECORD.size
+
+
+def test_photo_without_a_face_is_a_nan_record(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    EmbeddingStore(path).put(digest("empty"), None)
+
+    loaded = EmbeddingStore(path)
+    assert digest("empty") in loaded
+    assert loaded.get(digest("empty")) is None
+    assert loaded.pack(digest("empty")) is None
+
+
+def test_last_record_wins(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    store = EmbeddingStore(path)
+    store.put(digest("a"), embedding(1))
+    store.put(digest("a"), None)
+    store.put(digest("a"), embedding(3))
+
+    loaded = EmbeddingStore(path)
+    assert len(loaded) == 1
+    assert loaded.records == 3
+    assert list(loaded.get(digest("a"))) == pytest.approx(embedding(3), abs=1e-6)
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    EmbeddingStore(path).put(digest("a"), embedding(1))
+    with open(path, "ab") as f:
+        f.write(b"\x00" * (RECORD.size // 2))
+
+    store = EmbeddingStore(path)
+    assert len(store) == 1
+    assert os.path.getsize(path) == RECORD.size
+
+    # Appends after the crash stay aligned
+    store.put(digest("b"), embedding(2))
+    assert len(EmbeddingStore(path)) == 2
+
+
+def test_put_rejects_wrong_dimension(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.bin"))
+    with pytest.raises(ValueError):
+        store.put(digest("a"), [0.0] * (EMBEDDING_DIM - 1))
+    assert digest("a") not in store
+
+
+def test_pack(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.bin"))
+    store.put(digest("a"), embedding(1))
+
+    as_float32 = struct.unpack(f"<{EMBEDDING_DIM}f", store.pack(digest("a")))
+    as_float16 = struct.unpack(f"<{EMBEDDING_DIM}e", store.pack(digest("a"), "float16"))
+    assert list(as_float32) == pytest.approx(embedding(1), abs=1e-6)
+    assert list(as_float16) == pytest.approx(embedding(1), abs=1e-3)
+
+
+def test_needs_compaction(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "embeddings.bin"))
+    for i in range(32):
+        store.put(digest(str(i)), embedding(i))
+
+    # Small galleries get a floor of 16 live records
+    assert not store.needs_compaction(1)
+    store.put(digest("32"), embedding(32))
+    assert store.needs_compaction(1)
+    assert not store.needs_compaction(20)
+
+
+def test_compact_keeps_only_live_records(tmp_path):
+    path = str(tmp_path / "embeddings.bin")
+    store = EmbeddingStore(path)
+    for i in range(10):
+        store.put(digest(str(i)), embedding(i))
+    store.put(digest("empty"), None)
+    store.put(digest("3"), embedding(30))
+
+    keep = [digest("3"), digest("7"), digest("empty")]
+    store.compact(keep)
+
+    assert store.records == 3
+    assert os.path.getsize(path) == 3 * RECORD.size
+    assert not os.path.exists(f"{path}.tmp")
+
+    loaded = EmbeddingStore(path)
+    assert sorted(loaded.embeddings) == sorted(keep)
+    assert list(loaded.get(digest("3"))) == pytest.approx(embedding(30), abs=1e-6)
+    assert loaded.get(digest("empty")) is None
+    assert digest("0") not in loaded
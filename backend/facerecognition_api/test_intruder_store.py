@@ -0,0 +1,59 @@
+import pytest
+
+from intruder_store import IntruderStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = IntruderStore(str(tmp_path / "intruders.db"), max_photos=3)
+    yield store
+    store.close()
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_ranks_follow_the_ring(store, tmp_path):
+    intruder_dir = str(tmp_path / "dev")
+    for i in range(5):
+        assert store.add("dev", intruder_dir, b"photo %d" % i) == i
+
+    assert [read(store.newest("dev", intruder_dir, rank)[0]) for rank in (1, 2, 3)] == [
+        b"photo 4",
+        b"photo 3",
+        b"photo 2",
+    ]
+    assert store.newest("dev", intruder_dir, 4) is None
+    assert [seq for _, seq, _, _ in store.list("dev")] == [4, 3, 2]
+
+
+def test_failed_upload_does_not_shift_ranks(store, tmp_path):
+    intruder_dir = str(tmp_path / "dev")
+    store.add("dev", intruder_dir, b"photo 0")
+    store.add("dev", intruder_dir, b"photo 1")
+
+    with pytest.raises(TypeError):
+        store.add("dev", intruder_dir, "not bytes")
+
+    assert read(store.newest("dev", intruder_dir)[0]) == b"photo 1"
+    assert store.add("dev", intruder_dir, b"photo 2") == 2
+    assert read(store.newest("dev", intruder_dir, 2)[0]) == b"photo 1"
+    assert read(store.newest("dev", intruder_dir, 3)[0]) == b"photo 0"
+
+
+def test_sequence_survives_a_restart(tmp_path):
+    db_path = str(tmp_path / "intruders.db")
+    intruder_dir = str(tmp_path / "dev")
+    store = IntruderStore(db_path, max_photos=3)
+    for i in range(4):
+        store.add("dev", intruder_dir, b"photo %d" % i)
+    store.close()
+
+    store = IntruderStore(db_path, max_photos=3)
+    assert store.has_photos("dev")
+    assert not store.has_photos("other")
+    assert store.add("dev", intruder_dir, b"photo 4") == 4
+    assert read(store.newest("dev", intruder_dir)[0]) == b"photo 4"
+    store.close()
@@ -21,10 +21,42 @@ DROWSINESS_DETECTION_SERVICE = os.getenv(
 )
 
 
-def forward_request(url, data, results, service_name):
+def read_forward_body():
+    """Build the ``requests.post`` arguments that re-send this upload.
+
+    Raw ``image/*`` bodies and multipart ``image`` parts are forwarded as a
+    raw ``image/jpeg`` body with the query string and form fields as query
+    parameters, so the frame is never base64-encoded. JSON bodies are
+    forwarded unchanged. Returns ``None`` when the request has no image.
+    """
+    mimetype = request.mimetype
+    params = request.args.to_dict()
+
+    if mimetype == "multipart/form-data":
+        image_file = request.files.get("image")
+        image_data = image_file.read() if image_file else b""
+        params.update(request.form.to_dict())
+    elif mimetype.startswith("image/") or mimetype == "application/octet-stream":
+        image_data = request.get_data(cache=False)
+    else:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or "image" not in data:
+            return None
+        return {"json": data, "params": params}
+
+    if not image_data:
+        return None
+    return {
+        "data": image_data,
+        "headers": {"Content-Type": "image/jpeg"},
+        "params": params,
+    }
+
+
+def forward_request(url, body, results, service_name):
     try:
         start_time = time.time()
-        response = requests.post(url, json=data, timeout=10)
+        response = requests.post(url, timeout=10, **body)
         elapsed_time = time.time() - start_time
 
         if response.status_code == 200:
@@ -54,9 +86,9 @@ def forward_request(url, data, results, service_name):
 @app.route("/process", methods=["POST"])
 def process_image():
     try:
-        data = request.get_json()
+        body = read_forward_body()
 
-        if not data or "image" not in data:
+        if body is None:
             return jsonify({"error": "Missing image data in request"}), 400
 
         results = {}
@@ -64,13 +96,13 @@ def process_image():
         threads = [
             threading.Thread(
                 target=forward_request,
-                args=(FACE_RECOGNITION_SERVICE, data, results, "face_recognition"),
+                args=(FACE_RECOGNITION_SERVICE, body, results, "face_recognition"),
             ),
             threading.Thread(
                 target=forward_request,
                 args=(
                     DROWSINESS_DETECTION_SERVICE,
-                    data,
+                    body,
                     results,
                     "drowsiness_detection",
                 ),
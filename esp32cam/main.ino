@@ -1,7 +1,6 @@
 #include "esp_camera.h"
 #include <WiFi.h>
 #include <HTTPClient.h>
-#include <base64.h>
 #include <ArduinoJson.h>
 #include <WiFiManager.h>
 
@@ -248,24 +247,16 @@ void sendImageToServer(camera_fb_t *fb) {
     return;
   }
   
-  String base64Image = base64::encode(fb->buf, fb->len);
-  
   HTTPClient http;
   
   http.begin(serverUrl);
   http.setTimeout(20000);
   
-  http.addHeader("Content-Type", "application/json");
-  
-  DynamicJsonDocument jsonDoc(20000);
-  jsonDoc["image"] = base64Image;
-  
-  String payload;
-  serializeJson(jsonDoc, payload);
+  http.addHeader("Content-Type", "image/jpeg");
   
-  Serial.printf("Image size: %d bytes, Base64 size: %d bytes\n", fb->len, base64Image.length());
+  Serial.printf("Image size: %d bytes\n", fb->len);
   
-  int httpResponseCode = http.POST(payload);
+  int httpResponseCode = http.POST(fb->buf, fb->len);
   
   if (httpResponseCode > 0) {
     String response = http.getString();
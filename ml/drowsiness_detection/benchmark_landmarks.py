@@ -0,0 +1,130 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from landmarks import landmark_metrics
+
+try:
+    from scipy.spatial.distance import euclidean
+except ImportError:
+    # SciPy is no longer a service dependency; fall back to the same formula
+    def euclidean(a, b):
+        return float(np.linalg.norm(np.asarray(a, dtype=np.float64) - b))
+
+
+# The per-face functions drowsiness.py used before landmark_metrics
+def eye_aspect_ratio(eye):
+    A = euclidean(eye[1], eye[5])
+    B = euclidean(eye[2], eye[4])
+    C = euclidean(eye[0], eye[3])
+    return (A + B) / (2.0 * C)
+
+
+def final_ear(shape):
+    return (eye_aspect_ratio(shape[42:48]) + eye_aspect_ratio(shape[36:42])) / 2.0
+
+
+def lip_distance(shape):
+    top_lip = np.concatenate((shape[50:53], shape[61:64]))
+    low_lip = np.concatenate((shape[56:59], shape[65:68]))
+    return abs(np.mean(top_lip, axis=0)[1] - np.mean(low_lip, axis=0)[1])
+
+
+def per_face_metrics(shapes):
+    ears = [final_ear(shape) for shape in shapes]
+    distances = [lip_distance(shape) for shape in shapes]
+    return np.array(ears), np.array(distances)
+
+
+EYE_OUTLINE = np.array([[0, 0], [10, -5], [20, -5], [30, 0], [20, 5], [10, 5]])
+
+
+def make_shapes(faces, rng):
+    # Landmark-like integer points: a face box plus jitter, as shape_to_np returns
+    origin = rng.integers(0, 300, size=(faces, 1, 2))
+    shapes = origin + rng.integers(0, 120, size=(faces, 68, 2))
+    # Eyes follow the p1..p6 outline so the EAR denominator is never zero
+    for start in (36, 42):
+        shapes[:, start : start + 6] = (
+            shapes[:, start : start + 1]
+            + EYE_OUTLINE
+            + rng.integers(-2, 3, size=(faces, 6, 2))
+        )
+    return shapes.astype(np.int32)
+
+
+def time_calls(func, batches):
+    latencies = []
+    for shapes in batches:
+        t0 = time.perf_counter()
+        func(shapes)
+        latencies.append((time.perf_counter() - t0) * 1e6)
+    return np.array(latencies)
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    for faces in args.faces:
+        batches = [make_shapes(faces, rng) for _ in range(args.iterations)]
+
+        expected = [per_face_metrics(shapes) for shapes in batches]
+        actual = [landmark_metrics(shapes) for shapes in batches]
+        max_error = max(
+            float(np.max(np.abs(np.concatenate(a) - np.concatenate(b))))
+            for a, b in zip(expected, actual)
+        )
+
+        configs = [
+            ("per_face", time_calls(per_face_metrics, batches)),
+            ("vectorized", time_calls(landmark_metrics, batches)),
+        ]
+        baseline = float(np.median(configs[0][1]))
+        for name, latencies in configs:
+            results.append(
+                {
+                    "faces": faces,
+                    "implementation": name,
+                    "p50_us": round(float(np.percentile(latencies, 50)), 2),
+                    "p95_us": round(float(np.percentile(latencies, 95)), 2),
+                    "speedup": round(baseline / float(np.median(latencies)), 2),
+                    "max_abs_error": max_error,
+                }
+            )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-face vs vectorized EAR and lip distance benchmark"
+    )
+    parser.add_argument("--faces", type=int, nargs="+", default=[1, 2, 4, 16])
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+        return
+
+    print(
+        f"{'faces':>6} {'implementation':<14} {'p50 us':>9} {'p95 us':>9} "
+        f"{'speedup':>8} {'max err':>10}"
+    )
+    for row in results:
+        print(
+            f"{row['faces']:>6} {row['implementation']:<14} {row['p50_us']:>9.2f} "
+            f"{row['p95_us']:>9.2f} {row['speedup']:>8.2f} {row['max_abs_error']:>10.2e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from flask import Flask, request, jsonify
 import base64
+import binascii
 import numpy as np
 import cv2
 import dlib
@@ -7,15 +8,21 @@ import time
 import ntplib
 import pytz
 from datetime import datetime
-from scipy.spatial import distance as dist
 from imutils import face_utils
 import imutils
 import threading
 import os
+import re
+import sys
 import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
+from landmarks import EYE_IDXS, MOUTH_IDXS, landmark_metrics
+from scoring import DrowsinessScorer
 
 app = Flask(__name__)
 
@@ -37,8 +44,31 @@ FIREBASE_TOPIC = f"vehicle/{VEHICLE_ID}/detection/drowsiness"
 FIREBASE_CRED_PATH = os.environ.get("FIREBASE_CRED_PATH", "./serviceAccountKey.json")
 
 EYE_AR_THRESH = 0.3
-EYE_AR_CONSEC_FRAMES = 5  
 YAWN_THRESH = 20
+# Closed eyes alert after EYE_AR_CONSEC_FRAMES frames in a row, as before the
+# time-based scores; EYE_CLOSED_ALERT_SECONDS > 0 also alerts on their duration
+EYE_AR_CONSEC_FRAMES = int(os.environ.get('EYE_AR_CONSEC_FRAMES', 5))
+EYE_CLOSED_ALERT_SECONDS = float(os.environ.get('EYE_CLOSED_ALERT_SECONDS', 0))
+PERCLOS_THRESH = float(os.environ.get('PERCLOS_THRESH', 0.25))
+PERCLOS_MIN_SECONDS = float(os.environ.get('PERCLOS_MIN_SECONDS', 10))
+PERCLOS_WINDOW = float(os.environ.get('PERCLOS_WINDOW', 60))
+BLINK_WINDOW = float(os.environ.get('BLINK_WINDOW', 60))
+YAWN_WINDOW = float(os.environ.get('YAWN_WINDOW', 300))
+SCORE_BUFFER_SIZE = int(os.environ.get('SCORE_BUFFER_SIZE', 256))
+SCORE_MAX_GAP = float(os.environ.get('SCORE_MAX_GAP', 2.0))
+STATUS_REFRESH_INTERVAL = 3
+
+SESSION_TTL = float(os.environ.get('SESSION_TTL', 300))
+SESSION_MAX_SESSIONS = int(os.environ.get('SESSION_MAX_SESSIONS', 4096))
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get('SESSION_MEMORY_BUDGET_MB', 16))
+ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+BATCH_MAX_FRAMES = int(os.environ.get('BATCH_MAX_FRAMES', 32))
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', 4))
+
+FACE_ROI_TRACKING = os.environ.get('FACE_ROI_TRACKING', 'true').lower() in ('1', 'true', 'yes')
+FACE_ROI_MARGIN = float(os.environ.get('FACE_ROI_MARGIN', 0.5))
+FACE_REDETECT_INTERVAL = int(os.environ.get('FACE_REDETECT_INTERVAL', 10))
 
 NTP_SERVER = "id.pool.ntp.org"
 WIB_TIMEZONE = pytz.timezone('Asia/Jakarta')
@@ -49,10 +79,86 @@ print("-> Loading the predictor and detector...")
 detector = cv2.CascadeClassifier("haarcascade_frontalface_default.xml")
 predictor = dlib.shape_predictor('shape_predictor_68_face_landmarks.dat')
 
-frame_counter = 0
-status = "normal"
-last_status = "normal"
-status_changed_time = time.time()
+class DrowsinessSession:
+    """Drowsiness scores and publish state of one vehicle camera."""
+
+    __slots__ = ('topic', 'scorer', 'last_status', 'status_changed_time',
+                 'last_seen', 'face_box', 'face_size', 'tracked_frames', 'lock')
+
+    def __init__(self, topic, now):
+        self.topic = topic
+        self.scorer = DrowsinessScorer(EYE_AR_THRESH, YAWN_THRESH, perclos_window=PERCLOS_WINDOW,
+                                       blink_window=BLINK_WINDOW, yawn_window=YAWN_WINDOW,
+                                       capacity=SCORE_BUFFER_SIZE, max_gap=SCORE_MAX_GAP)
+        self.face_box = None
+        self.face_size = 0
+        self.tracked_frames = 0
+        self.last_status = "normal"
+        self.status_changed_time = now
+        self.last_seen = now
+        self.lock = threading.Lock()
+
+    def memory_usage(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.topic) + self.scorer.nbytes
+
+    def should_publish(self, status, now):
+        """Record ``status`` and tell whether it has to be sent to Firebase."""
+        if status != self.last_status or now - self.status_changed_time > STATUS_REFRESH_INTERVAL:
+            self.last_status = status
+            self.status_changed_time = now
+            return True
+        return False
+
+class SessionStore:
+    """Sessions keyed by (vehicle id, camera id), least recently used first.
+
+    Sessions idle for more than ``ttl`` seconds are dropped, and the oldest
+    ones are evicted while there are more than ``max_sessions`` or their
+    combined ``memory_usage()`` exceeds ``memory_budget`` bytes.
+    """
+
+    def __init__(self, ttl, max_sessions, memory_budget):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.memory_budget = memory_budget
+        self.sessions = OrderedDict()
+        self.memory = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.sessions)
+
+    def get(self, vehicle_id, camera_id):
+        key = (vehicle_id, camera_id)
+        now = time.time()
+
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                session = DrowsinessSession(f"vehicle/{vehicle_id}/detection/drowsiness", now)
+                self.sessions[key] = session
+                self.memory += session.memory_usage()
+            else:
+                self.sessions.move_to_end(key)
+            session.last_seen = now
+            self._evict(now)
+        return session
+
+    def _evict(self, now):
+        # The most recently used session is at the end and is never evicted
+        while len(self.sessions) > 1:
+            oldest = next(iter(self.sessions.values()))
+            if (now - oldest.last_seen <= self.ttl
+                    and len(self.sessions) <= self.max_sessions
+                    and self.memory <= self.memory_budget):
+                break
+            _, oldest = self.sessions.popitem(last=False)
+            self.memory -= oldest.memory_usage()
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_DECODE_WORKERS)
+sessions = SessionStore(SESSION_TTL, SESSION_MAX_SESSIONS,
+                        SESSION_MEMORY_BUDGET_MB * 1024 * 1024)
 
 def sync_ntp_time():
     global time_offset
@@ -89,9 +195,9 @@ def init_firebase():
     except Exception as e:
         print(f"Firebase connection error: {e}")
 
-def publish_to_firebase(status_code):
+def publish_to_firebase(status_code, topic=FIREBASE_TOPIC):
     try:
-        ref = db.reference(FIREBASE_TOPIC)
+        ref = db.reference(topic)
         timestamp = get_wib_timestamp()
         readable_time = datetime.fromtimestamp(timestamp, WIB_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z')
         
@@ -105,135 +211,350 @@ def publish_to_firebase(status_code):
     except Exception as e:
         print(f"Error sending to Firebase: {e}")
 
-def eye_aspect_ratio(eye):
-    A = dist.euclidean(eye[1], eye[5])
-    B = dist.euclidean(eye[2], eye[4])
-    C = dist.euclidean(eye[0], eye[3])
-    ear = (A + B) / (2.0 * C)
-    return ear
+def read_upload_image():
+    """Return the uploaded image bytes from a raw image/jpeg body, a
+    multipart/form-data "image" file, or the JSON {"image": "<base64>"} body."""
+    mimetype = request.mimetype
+
+    if mimetype == 'multipart/form-data':
+        image_file = request.files.get('image')
+        return image_file.read() if image_file else b''
+
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        return request.get_data(cache=False)
 
-def final_ear(shape):
-    (lStart, lEnd) = face_utils.FACIAL_LANDMARKS_IDXS["left_eye"]
-    (rStart, rEnd) = face_utils.FACIAL_LANDMARKS_IDXS["right_eye"]
+    content = request.get_json(silent=True) or {}
+    base64_image = content.get('image', '')
+    return base64.b64decode(base64_image) if base64_image else b''
 
-    leftEye = shape[lStart:lEnd]
-    rightEye = shape[rStart:rEnd]
+def haar_detect(gray, min_size=(30, 30)):
+    return detector.detectMultiScale(gray, scaleFactor=1.1,
+                                     minNeighbors=5, minSize=min_size,
+                                     flags=cv2.CASCADE_SCALE_IMAGE)
 
-    leftEAR = eye_aspect_ratio(leftEye)
-    rightEAR = eye_aspect_ratio(rightEye)
+def detect_faces(gray, session):
+    """Find the faces of a session's frame, searching near the last ones first.
 
-    ear = (leftEAR + rightEAR) / 2.0
-    return (ear, leftEye, rightEye)
+    While a face is tracked only the box around the last faces, grown by
+    FACE_ROI_MARGIN on every side, is searched for faces at least half the
+    size of the smallest of them. The whole
+    frame is searched when nothing was tracked, the face was lost in the
+    region, or FACE_REDETECT_INTERVAL frames were tracked in a row.
+    Returns ``(x, y, w, h)`` boxes in frame coordinates.
+    """
+    with session.lock:
+        face_box, face_size, tracked_frames = session.face_box, session.face_size, session.tracked_frames
 
-def lip_distance(shape):
-    top_lip = shape[50:53]
-    top_lip = np.concatenate((top_lip, shape[61:64]))
+    rects = ()
+    if FACE_ROI_TRACKING and face_box is not None and tracked_frames < FACE_REDETECT_INTERVAL:
+        x, y, w, h = face_box
+        height, width = gray.shape[:2]
+        x0, y0 = max(0, int(x - w * FACE_ROI_MARGIN)), max(0, int(y - h * FACE_ROI_MARGIN))
+        x1, y1 = min(width, int(x + w * (1 + FACE_ROI_MARGIN))), min(height, int(y + h * (1 + FACE_ROI_MARGIN)))
 
-    low_lip = shape[56:59]
-    low_lip = np.concatenate((low_lip, shape[65:68]))
+        min_side = max(30, face_size // 2)
+        if x1 - x0 >= min_side and y1 - y0 >= min_side:
+            rects = haar_detect(gray[y0:y1, x0:x1], min_size=(min_side, min_side))
+            rects = [(rx + x0, ry + y0, rw, rh) for (rx, ry, rw, rh) in rects]
+    tracked = len(rects) > 0
 
-    top_mean = np.mean(top_lip, axis=0)
-    low_mean = np.mean(low_lip, axis=0)
+    if not tracked:
+        rects = haar_detect(gray)
 
-    distance = abs(top_mean[1] - low_mean[1])
-    return distance
+    # Track the box around every face so the region keeps all of them in view
+    face_box, face_size = None, 0
+    if len(rects) > 0:
+        x0 = min(x for (x, y, w, h) in rects)
+        y0 = min(y for (x, y, w, h) in rects)
+        x1 = max(x + w for (x, y, w, h) in rects)
+        y1 = max(y + h for (x, y, w, h) in rects)
+        face_box = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+        face_size = int(min(min(w, h) for (x, y, w, h) in rects))
+
+    with session.lock:
+        session.face_box = face_box
+        session.face_size = face_size
+        session.tracked_frames = tracked_frames + 1 if tracked else 0
+    return rects
+
+def request_option(name, default=None):
+    """Read an option from the JSON body, the form fields or the query string."""
+    content = request.get_json(silent=True) if request.is_json else None
+    if isinstance(content, dict) and name in content:
+        return content[name]
+    if name in request.form:
+        return request.form[name]
+    return request.args.get(name, default)
+
+class BatchFrameError(ValueError):
+    """A frame of an upload batch that cannot be read; ``index`` is its position."""
+    def __init__(self, index, message):
+        super().__init__(f"Frame {index}: {message}")
+        self.index = index
+
+def parse_timestamp(index, ts):
+    if ts in (None, ''):
+        return None
+    try:
+        ts = float(ts)
+    except (TypeError, ValueError):
+        raise BatchFrameError(index, f"invalid timestamp {ts!r}")
+    if not math.isfinite(ts):
+        raise BatchFrameError(index, f"invalid timestamp {ts!r}")
+    return ts
+
+def decode_base64_image(index, data):
+    try:
+        return base64.b64decode(data or '')
+    except (TypeError, ValueError, binascii.Error):
+        raise BatchFrameError(index, "image is not valid base64")
+
+def read_upload_batch():
+    """Return ``(images, timestamps)`` of a burst of frames.
+
+    Accepts multipart/form-data with one "image" file part per frame and a
+    "timestamp" field per frame in the same order, or a JSON body that is an
+    array of {"image": "<base64>", "timestamp": <seconds>} objects or an
+    object with such a "frames" array. Timestamps are capture times in
+    seconds on the camera's clock; missing ones are None. Raises
+    BatchFrameError for a frame whose image or timestamp cannot be parsed.
+    """
+    if request.mimetype == 'multipart/form-data':
+        images = [image_file.read() for image_file in request.files.getlist('image')]
+        timestamps = request.form.getlist('timestamp')
+    else:
+        content = request.get_json(silent=True)
+        if isinstance(content, dict):
+            content = content.get('frames')
+        if not isinstance(content, list):
+            return [], []
+        content = [item if isinstance(item, dict) else {} for item in content]
+        images = [decode_base64_image(i, item.get('image')) for i, item in enumerate(content)]
+        timestamps = [item.get('timestamp') for item in content]
+
+    timestamps = list(timestamps[:len(images)]) + [None] * (len(images) - len(timestamps))
+    return images, [parse_timestamp(i, ts) for i, ts in enumerate(timestamps)]
+
+def resolve_session(vehicle_id=None):
+    """Return ``(session, vehicle_id, camera_id)``; session is None for invalid ids."""
+    vehicle_id = vehicle_id or request_option('vehicle_id', VEHICLE_ID)
+    camera_id = request_option('camera_id', 'default')
+    if not all(isinstance(v, str) and ID_PATTERN.match(v) for v in (vehicle_id, camera_id)):
+        return None, vehicle_id, camera_id
+    return sessions.get(vehicle_id, camera_id), vehicle_id, camera_id
+
+def decode_frame(image_data):
+    """Decode an upload to the 450px wide frame and its grayscale copy."""
+    frame = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None, None
+    frame = imutils.resize(frame, width=450)
+    return frame, cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+def predict_shapes(gray, rects):
+    return np.array([
+        face_utils.shape_to_np(predictor(gray, dlib.rectangle(int(x), int(y), int(x + w), int(y + h))))
+        for (x, y, w, h) in rects
+    ], dtype=np.int32).reshape(-1, 68, 2)
+
+def primary_face(rects):
+    """Index of the largest face, which is the rider's."""
+    return int(np.argmax([w * h for (x, y, w, h) in rects]))
+
+def score_frame(session, timestamp, ear, distance):
+    """Add one frame to the session scores and classify it.
+
+    ``ear`` and ``distance`` are None when no face was found. The caller
+    holds ``session.lock``. Returns ``(status, status_code, scores)``.
+    """
+    if ear is None:
+        session.scorer.add(timestamp)
+    else:
+        session.scorer.add(timestamp, ear, distance)
+    scores = session.scorer.scores()
+
+    status, status_code = "normal", 0
+    eyes_closed = scores["eyes_closed_frames"] >= EYE_AR_CONSEC_FRAMES or (
+        EYE_CLOSED_ALERT_SECONDS > 0 and scores["eyes_closed_seconds"] >= EYE_CLOSED_ALERT_SECONDS)
+    if eyes_closed or (scores["perclos"] >= PERCLOS_THRESH and scores["observed_seconds"] >= PERCLOS_MIN_SECONDS):
+        status, status_code = "sleepy_detected", 2
+    if distance is not None and distance > YAWN_THRESH:
+        status, status_code = "yawn_detected", 1
+    return status, status_code, scores
+
+def readable_timestamp():
+    wib_timestamp = get_wib_timestamp()
+    return wib_timestamp, datetime.fromtimestamp(wib_timestamp, WIB_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z')
 
 @app.route('/upload', methods=['POST'])
-def upload_image():
-    global frame_counter, status, last_status, status_changed_time
-    
+@app.route('/<vehicle_id>/upload', methods=['POST'])
+def upload_image(vehicle_id=None):
     try:
-        content = request.json
-        base64_image = content.get('image', '')
+        image_data = read_upload_image()
         
-        if not base64_image:
+        if not image_data:
             return jsonify({"error": "No image data received"}), 400
         
-        image_data = base64.b64decode(base64_image)
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+        session, vehicle_id, camera_id = resolve_session(vehicle_id)
+        if session is None:
+            return jsonify({"error": "Invalid vehicle or camera id"}), 400
+        
+        frame, gray = decode_frame(image_data)
         
         if frame is None:
             return jsonify({"error": "Failed to decode image"}), 400
         
-        frame = imutils.resize(frame, width=450)
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        
-        rects = detector.detectMultiScale(gray, scaleFactor=1.1, 
-                                        minNeighbors=5, minSize=(30, 30),
-                                        flags=cv2.CASCADE_SCALE_IMAGE)
-        
-        status = "normal" 
-        status_code = 0
-        
-        for (x, y, w, h) in rects:
-            rect = dlib.rectangle(int(x), int(y), int(x + w), int(y + h))
-            
-            shape = predictor(gray, rect)
-            shape = face_utils.shape_to_np(shape)
-            
-            eye = final_ear(shape)
-            ear = eye[0]
-            
-            distance = lip_distance(shape)
-            
-            leftEye = eye[1]
-            rightEye = eye[2]
-            leftEyeHull = cv2.convexHull(leftEye)
-            rightEyeHull = cv2.convexHull(rightEye)
-            cv2.drawContours(frame, [leftEyeHull], -1, (0, 255, 0), 1)
-            cv2.drawContours(frame, [rightEyeHull], -1, (0, 255, 0), 1)
-            
-            lip = shape[48:60]
-            cv2.drawContours(frame, [lip], -1, (0, 255, 0), 1)
-            
-            if ear < EYE_AR_THRESH:
-                frame_counter += 1
-                if frame_counter >= EYE_AR_CONSEC_FRAMES:
-                    status = "sleepy_detected"
-                    status_code = 2
-                    cv2.putText(frame, "DROWSINESS ALERT!", (10, 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            else:
-                frame_counter = 0
-            
-            if distance > YAWN_THRESH:
-                status = "yawn_detected"
-                status_code = 1
-                cv2.putText(frame, "Yawn Alert", (10, 60),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
-            
+        rects = detect_faces(gray, session)
+        shapes = predict_shapes(gray, rects)
+        ears, distances = landmark_metrics(shapes)
+        
+        for shape in shapes:
+            for eye in shape[EYE_IDXS]:
+                cv2.drawContours(frame, [cv2.convexHull(eye)], -1, (0, 255, 0), 1)
+            cv2.drawContours(frame, [shape[MOUTH_IDXS]], -1, (0, 255, 0), 1)
+        
+        ear = distance = None
+        if len(rects) > 0:
+            primary = primary_face(rects)
+            ear, distance = float(ears[primary]), float(distances[primary])
+        
+        now = time.time()
+        with session.lock:
+            status, status_code, scores = score_frame(session, now, ear, distance)
+            publish = session.should_publish(status, now)
+        
+        if status_code == 2:
+            cv2.putText(frame, "DROWSINESS ALERT!", (10, 30),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        elif status_code == 1:
+            cv2.putText(frame, "Yawn Alert", (10, 60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+        
+        if ear is not None:
             cv2.putText(frame, f"EAR: {ear:.2f}", (300, 30),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
             cv2.putText(frame, f"YAWN: {distance:.2f}", (300, 60),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
         
-        if len(rects) == 0:
-            frame_counter = 0
+        if publish:
+            publish_to_firebase(status_code, session.topic)
         
-        current_time = time.time()
-        if status != last_status or (current_time - status_changed_time) > 3:
-            publish_to_firebase(status_code)
-            last_status = status
-            status_changed_time = current_time
-        
-        wib_timestamp = get_wib_timestamp()
-        readable_time = datetime.fromtimestamp(wib_timestamp, WIB_TIMEZONE).strftime('%Y-%m-%d %H:%M:%S %Z')
+        wib_timestamp, readable_time = readable_timestamp()
         
         return jsonify({
             "status": "success", 
+            "vehicle_id": vehicle_id,
+            "camera_id": camera_id,
             "detection_result": status,
             "status_code": status_code,
             "timestamp": wib_timestamp,
             "timestamp_readable": readable_time,
-            "ear": float(ear) if 'ear' in locals() else None,
-            "yawn_distance": float(distance) if 'distance' in locals() else None
+            "ear": ear,
+            "yawn_distance": distance,
+            "scores": scores
         })
     
     except Exception as e:
         print(f"Error processing image: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/upload_batch', methods=['POST'])
+@app.route('/<vehicle_id>/upload_batch', methods=['POST'])
+def upload_batch(vehicle_id=None):
+    """Score a burst of frames from one camera in capture order.
+
+    The frames are decoded in parallel, faces and landmarks are found frame
+    by frame in timestamp order (so region tracking carries over), and the
+    metrics of every face come from one landmark_metrics call. Capture
+    times are shifted so the newest frame lands on the arrival time, which
+    keeps camera clocks out of the session's timeline. Firebase gets one
+    update for the burst with its most severe status.
+    """
+    try:
+        try:
+            images, timestamps = read_upload_batch()
+        except BatchFrameError as e:
+            return jsonify({"error": str(e), "index": e.index}), 400
+        
+        if not images:
+            return jsonify({"error": "No frames received"}), 400
+        if len(images) > BATCH_MAX_FRAMES:
+            return jsonify({"error": f"At most {BATCH_MAX_FRAMES} frames per batch"}), 413
+        if None in timestamps:
+            return jsonify({"error": "Every frame needs a capture timestamp"}), 400
+        
+        session, vehicle_id, camera_id = resolve_session(vehicle_id)
+        if session is None:
+            return jsonify({"error": "Invalid vehicle or camera id"}), 400
+        
+        decoded = list(batch_executor.map(decode_frame, images))
+        order = sorted(range(len(images)), key=lambda i: timestamps[i])
+        
+        now = time.time()
+        offset = now - max(timestamps)
+        
+        frames = []
+        for i in order:
+            gray = decoded[i][1]
+            if gray is None:
+                continue
+            rects = detect_faces(gray, session)
+            frames.append((i, rects, predict_shapes(gray, rects)))
+        
+        if frames:
+            ears, distances = landmark_metrics(np.concatenate([shapes for _, _, shapes in frames]))
+        
+        results = [{"index": i, "timestamp": timestamps[i], "error": "Failed to decode image"}
+                   for i in order if decoded[i][1] is None]
+        
+        status, status_code, scores = "normal", 0, None
+        start = 0
+        with session.lock:
+            for i, rects, shapes in frames:
+                ear = distance = None
+                if len(rects) > 0:
+                    primary = start + primary_face(rects)
+                    ear, distance = float(ears[primary]), float(distances[primary])
+                start += len(shapes)
+                
+                frame_status, frame_code, scores = score_frame(session, timestamps[i] + offset, ear, distance)
+                if frame_code > status_code:
+                    status, status_code = frame_status, frame_code
+                results.append({
+                    "index": i,
+                    "timestamp": timestamps[i],
+                    "faces": len(rects),
+                    "detection_result": frame_status,
+                    "status_code": frame_code,
+                    "ear": ear,
+                    "yawn_distance": distance
+                })
+            publish = bool(frames) and session.should_publish(status, now)
+        
+        if publish:
+            publish_to_firebase(status_code, session.topic)
+        
+        results.sort(key=lambda result: result["index"])
+        wib_timestamp, readable_time = readable_timestamp()
+        
+        return jsonify({
+            "status": "success",
+            "vehicle_id": vehicle_id,
+            "camera_id": camera_id,
+            "frames": len(images),
+            "processed": len(frames),
+            "detection_result": status,
+            "status_code": status_code,
+            "timestamp": wib_timestamp,
+            "timestamp_readable": readable_time,
+            "scores": scores,
+            "results": results
+        })
+    
+    except Exception as e:
+        print(f"Error processing batch: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 if __name__ == '__main__':
     init_firebase()
     
@@ -0,0 +1,39 @@
+import numpy as np
+
+# Indices into dlib's 68-point model (see imutils.face_utils.FACIAL_LANDMARKS_IDXS)
+LEFT_EYE_IDXS = np.arange(42, 48)
+RIGHT_EYE_IDXS = np.arange(36, 42)
+EYE_IDXS = np.stack([LEFT_EYE_IDXS, RIGHT_EYE_IDXS])
+MOUTH_IDXS = np.arange(48, 60)
+
+# Per eye the point pairs p2-p6 and p3-p5 (vertical) and p1-p4 (horizontal)
+EYE_PAIR_FROM = EYE_IDXS[:, [1, 2, 0]]
+EYE_PAIR_TO = EYE_IDXS[:, [5, 4, 3]]
+
+TOP_LIP_IDXS = np.array([50, 51, 52, 61, 62, 63])
+LOW_LIP_IDXS = np.array([56, 57, 58, 65, 66, 67])
+
+# Mean top lip y minus mean bottom lip y as one dot product over all 68 points
+LIP_WEIGHTS = np.zeros(68)
+LIP_WEIGHTS[TOP_LIP_IDXS] = 1.0 / len(TOP_LIP_IDXS)
+LIP_WEIGHTS[LOW_LIP_IDXS] = -1.0 / len(LOW_LIP_IDXS)
+
+
+def landmark_metrics(shapes):
+    """Return the eye aspect ratio and lip distance of every face.
+
+    ``shapes`` is an ``(n_faces, 68, 2)`` landmark array. The EAR is the mean
+    of both eyes' ``(|p2-p6| + |p3-p5|) / (2 |p1-p4|)`` and the lip distance
+    the vertical gap between the mean top and bottom lip points, as two
+    float arrays of length ``n_faces``.
+    """
+    shapes = np.asarray(shapes, dtype=np.float64)
+    if shapes.ndim == 2:
+        shapes = shapes[None]
+
+    diffs = shapes[:, EYE_PAIR_FROM] - shapes[:, EYE_PAIR_TO]
+    lengths = np.sqrt(np.einsum("nepc,nepc->nep", diffs, diffs))
+    # Averaging two eyes of (A + B) / (2 C) each
+    ear = ((lengths[:, :, 0] + lengths[:, :, 1]) / lengths[:, :, 2]).sum(axis=1) / 4.0
+
+    return ear, np.abs(shapes[:, :, 1] @ LIP_WEIGHTS)
@@ -0,0 +1,197 @@
+import numpy as np
+
+
+class TimeWindow:
+    """Running sums over the samples of the last ``seconds`` seconds.
+
+    Durations are summed in whole microseconds so that evicting a sample
+    takes away exactly what adding it put in.
+    """
+
+    __slots__ = ("seconds", "start", "closed_us", "observed_us", "blinks", "yawns")
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.start = 0
+        self.closed_us = 0
+        self.observed_us = 0
+        self.blinks = 0
+        self.yawns = 0
+
+
+class DrowsinessScorer:
+    """PERCLOS, blink rate and yawn frequency over a ring buffer of samples.
+
+    Every frame adds one ``(timestamp, EAR, mouth distance)`` sample; a frame
+    without a face is added with NaN values. Each sample stands for the time
+    until the next one (at most ``max_gap`` seconds), so PERCLOS is the share
+    of observed time with the eyes closed, however irregular the uploads
+    are. The current run of closed-eye samples is kept both as a duration
+    and as a frame count. Blinks are counted when closed eyes open again and
+    yawns when the mouth distance first goes over ``yawn_threshold``.
+
+    Each window keeps running sums and the sequence number of its oldest
+    sample, so adding a sample only touches the samples entering and leaving
+    the windows. When more than ``capacity`` samples fall into a window the
+    oldest ones are dropped from it early.
+    """
+
+    def __init__(
+        self,
+        ear_threshold,
+        yawn_threshold,
+        perclos_window=60.0,
+        blink_window=60.0,
+        yawn_window=300.0,
+        capacity=256,
+        max_gap=2.0,
+    ):
+        self.ear_threshold = ear_threshold
+        self.yawn_threshold = yawn_threshold
+        self.capacity = capacity
+        self.max_gap = max_gap
+
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.ears = np.full(capacity, np.nan, dtype=np.float32)
+        self.mouths = np.full(capacity, np.nan, dtype=np.float32)
+        # Microseconds each sample stands for
+        self.durations = np.zeros(capacity, dtype=np.int64)
+        self.closed = np.zeros(capacity, dtype=bool)
+        self.blinks = np.zeros(capacity, dtype=bool)
+        self.yawns = np.zeros(capacity, dtype=bool)
+
+        self.perclos_window = TimeWindow(perclos_window)
+        self.blink_window = TimeWindow(blink_window)
+        self.yawn_window = TimeWindow(yawn_window)
+        self.windows = (self.perclos_window, self.blink_window, self.yawn_window)
+
+        self.count = 0
+        self.closed_since = None
+        self.closed_frames = 0
+
+    @property
+    def nbytes(self):
+        return sum(
+            a.nbytes
+            for a in (
+                self.times,
+                self.ears,
+                self.mouths,
+                self.durations,
+                self.closed,
+                self.blinks,
+                self.yawns,
+            )
+        )
+
+    def add(self, timestamp, ear=np.nan, mouth=np.nan):
+        seq = self.count
+        i = seq % self.capacity
+        observed = not np.isnan(ear)
+        closed = observed and ear < self.ear_threshold
+        yawning = not np.isnan(mouth) and mouth > self.yawn_threshold
+
+        blink = yawn = False
+        if seq > 0:
+            prev = (seq - 1) % self.capacity
+            timestamp = max(timestamp, self.times[prev])
+            gap = timestamp - self.times[prev]
+            duration = round(min(gap, self.max_gap) * 1e6)
+            if gap > self.max_gap:
+                # Nobody saw the eyes in between, so a closed run starts over
+                self.closed_since = None
+                self.closed_frames = 0
+            self.durations[prev] = duration
+            # The previous sample's duration is only known now
+            if not np.isnan(self.ears[prev]):
+                for window in self.windows:
+                    if window.start <= seq - 1:
+                        window.observed_us += duration
+                        if self.closed[prev]:
+                            window.closed_us += duration
+            blink = observed and not closed and self.closed[prev]
+            yawn = yawning and not self.mouths[prev] > self.yawn_threshold
+        else:
+            yawn = yawning
+
+        if seq >= self.capacity:
+            # The slot still holds sample seq - capacity; drop it from every window
+            for window in self.windows:
+                while window.start <= seq - self.capacity:
+                    self._evict(window)
+
+        self.times[i] = timestamp
+        self.ears[i] = ear
+        self.mouths[i] = mouth
+        self.durations[i] = 0
+        self.closed[i] = closed
+        self.blinks[i] = blink
+        self.yawns[i] = yawn
+        self.count = seq + 1
+
+        self.blink_window.blinks += blink
+        self.yawn_window.yawns += yawn
+
+        for window in self.windows:
+            while (
+                window.start < seq
+                and self.times[window.start % self.capacity]
+                < timestamp - window.seconds
+            ):
+                self._evict(window)
+
+        if closed:
+            if self.closed_since is None:
+                self.closed_since = timestamp
+            self.closed_frames += 1
+        else:
+            self.closed_since = None
+            self.closed_frames = 0
+
+    def _evict(self, window):
+        i = window.start % self.capacity
+        if not np.isnan(self.ears[i]):
+            window.observed_us -= int(self.durations[i])
+            if self.closed[i]:
+                window.closed_us -= int(self.durations[i])
+        window.blinks -= self.blinks[i]
+        window.yawns -= self.yawns[i]
+        window.start += 1
+
+    def _span(self, window):
+        """Seconds covered by the window's samples, for per-minute rates."""
+        if window.start >= self.count:
+            return 0.0
+        first = self.times[window.start % self.capacity]
+        last = self.times[(self.count - 1) % self.capacity]
+        return float(last - first)
+
+    def scores(self):
+        window = self.perclos_window
+        perclos = 0.0
+        if window.observed_us > 0:
+            perclos = window.closed_us / window.observed_us
+
+        eyes_closed = 0.0
+        if self.closed_since is not None:
+            last = self.times[(self.count - 1) % self.capacity]
+            eyes_closed = float(last - self.closed_since)
+
+        blink_span = self._span(self.blink_window)
+        yawn_span = self._span(self.yawn_window)
+        return {
+            "perclos": round(perclos, 4),
+            "observed_seconds": round(window.observed_us / 1e6, 3),
+            "eyes_closed_seconds": round(eyes_closed, 3),
+            "eyes_closed_frames": self.closed_frames,
+            "blinks_per_minute": (
+                round(float(self.blink_window.blinks * 60.0 / blink_span), 2)
+                if blink_span > 0
+                else 0.0
+            ),
+            "yawns_per_minute": (
+                round(float(self.yawn_window.yawns * 60.0 / yawn_span), 2)
+                if yawn_span > 0
+                else 0.0
+            ),
+        }
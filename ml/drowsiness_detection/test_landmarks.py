@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+# The reference functions use scipy's euclidean when it is installed
+from benchmark_landmarks import (
+    EYE_OUTLINE,
+    final_ear,
+    lip_distance,
+    make_shapes,
+    per_face_metrics,
+)
+from landmarks import landmark_metrics
+
+
+@pytest.mark.parametrize("faces", [1, 2, 7, 64])
+def test_matches_the_per_face_formula(faces):
+    shapes = make_shapes(faces, np.random.default_rng(faces))
+
+    ear, lips = landmark_metrics(shapes)
+    expected_ear, expected_lips = per_face_metrics(shapes)
+
+    assert ear.shape == lips.shape == (faces,)
+    np.testing.assert_allclose(ear, expected_ear, rtol=1e-12)
+    np.testing.assert_allclose(lips, expected_lips, rtol=1e-12)
+
+
+def test_single_shape():
+    shape = make_shapes(1, np.random.default_rng(0))[0]
+
+    ear, lips = landmark_metrics(shape)
+    assert ear.shape == lips.shape == (1,)
+    assert ear[0] == pytest.approx(final_ear(shape))
+    assert lips[0] == pytest.approx(lip_distance(shape))
+
+
+def test_no_faces():
+    ear, lips = landmark_metrics(np.zeros((0, 68, 2), dtype=np.int32))
+    assert ear.shape == lips.shape == (0,)
+
+
+def test_known_geometry():
+    shape = np.zeros((68, 2))
+    # Both eyes 30 wide and 10 high: EAR = (10 + 10) / (2 * 30)
+    for start in (36, 42):
+        shape[start : start + 6] = EYE_OUTLINE
+    # Top lip at y=100 and bottom lip at y=112
+    shape[[50, 51, 52, 61, 62, 63], 1] = 100
+    shape[[56, 57, 58, 65, 66, 67], 1] = 112
+
+    ear, lips = landmark_metrics(shape)
+    assert ear[0] == pytest.approx(1 / 3)
+    assert lips[0] == pytest.approx(12)
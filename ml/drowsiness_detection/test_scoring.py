@@ -0,0 +1,165 @@
+import numpy as np
+import pytest
+
+from scoring import DrowsinessScorer
+
+OPEN = 0.3
+CLOSED = 0.1
+
+
+def make_scorer(**kwargs):
+    kwargs.setdefault("max_gap", 2.0)
+    return DrowsinessScorer(0.2, 20, **kwargs)
+
+
+def test_window_edges():
+    scorer = make_scorer(perclos_window=10.0)
+    for t in range(11):
+        scorer.add(float(t), CLOSED if t < 5 else OPEN)
+
+    # A sample exactly ``window`` seconds old is still in the window
+    assert scorer.perclos_window.start == 0
+    assert scorer.scores()["observed_seconds"] == pytest.approx(10.0)
+    assert scorer.scores()["perclos"] == pytest.approx(0.5)
+
+    scorer.add(10.5, OPEN)
+    assert scorer.perclos_window.start == 1
+    assert scorer.scores()["observed_seconds"] == pytest.approx(9.5)
+    assert scorer.scores()["perclos"] == pytest.approx(4 / 9.5, abs=1e-4)
+
+
+def test_gaps_count_at_most_max_gap():
+    scorer = make_scorer(max_gap=2.0)
+    scorer.add(0.0, CLOSED)
+    scorer.add(10.0, OPEN)
+    scorer.add(11.0, OPEN)
+
+    scores = scorer.scores()
+    assert scores["observed_seconds"] == pytest.approx(3.0)
+    assert scores["perclos"] == pytest.approx(2 / 3, abs=1e-4)
+
+
+def test_closed_run():
+    scorer = make_scorer()
+    scorer.add(0.0, OPEN)
+    for t in (1.0, 1.5, 2.0):
+        scorer.add(t, CLOSED)
+
+    scores = scorer.scores()
+    assert scores["eyes_closed_frames"] == 3
+    assert scores["eyes_closed_seconds"] == pytest.approx(1.0)
+
+    scorer.add(2.5, OPEN)
+    scores = scorer.scores()
+    assert scores["eyes_closed_frames"] == 0
+    assert scores["eyes_closed_seconds"] == 0.0
+
+
+def test_closed_run_starts_over_after_a_gap():
+    scorer = make_scorer(max_gap=2.0)
+    scorer.add(0.0, CLOSED)
+    scorer.add(1.0, CLOSED)
+    scorer.add(5.0, CLOSED)
+
+    scores = scorer.scores()
+    assert scores["eyes_closed_frames"] == 1
+    assert scores["eyes_closed_seconds"] == 0.0
+
+
+def test_frames_without_a_face_are_not_observed():
+    scorer = make_scorer()
+    scorer.add(0.0, CLOSED)
+    scorer.add(1.0)
+    scorer.add(2.0)
+    scorer.add(3.0, OPEN)
+
+    scores = scorer.scores()
+    assert scores["observed_seconds"] == pytest.approx(1.0)
+    assert scores["perclos"] == pytest.approx(1.0)
+    assert scores["eyes_closed_frames"] == 0
+    # Closed eyes followed by no face are not a blink
+    assert scorer.blink_window.blinks == 0
+
+
+def test_blinks_and_rate():
+    scorer = make_scorer(blink_window=60.0)
+    for t in range(31):
+        scorer.add(float(t), CLOSED if t % 10 == 5 else OPEN)
+
+    assert scorer.blink_window.blinks == 3
+    # Three blinks over 30 seconds
+    assert scorer.scores()["blinks_per_minute"] == pytest.approx(6.0)
+
+
+def test_yawns_count_once_per_onset():
+    scorer = make_scorer(yawn_window=300.0)
+    mouths = [10, 25, 30, 25, 10, 25, 10]
+    for t, mouth in enumerate(mouths):
+        scorer.add(float(t), OPEN, mouth)
+
+    assert scorer.yawn_window.yawns == 2
+    assert scorer.scores()["yawns_per_minute"] == pytest.approx(20.0)
+
+
+def test_first_sample_can_be_a_yawn():
+    scorer = make_scorer()
+    scorer.add(0.0, OPEN, 30)
+    assert scorer.yawn_window.yawns == 1
+
+
+def test_capacity_drops_the_oldest_samples():
+    scorer = make_scorer(perclos_window=60.0, capacity=4)
+    for t in range(6):
+        scorer.add(float(t), CLOSED if t < 2 else OPEN)
+
+    assert scorer.perclos_window.start == 2
+    scores = scorer.scores()
+    assert scores["observed_seconds"] == pytest.approx(3.0)
+    assert scores["perclos"] == 0.0
+
+
+def test_timestamps_never_go_backwards():
+    scorer = make_scorer()
+    scorer.add(5.0, OPEN)
+    scorer.add(4.0, CLOSED)
+    scorer.add(6.0, OPEN)
+
+    assert scorer.times[1] == 5.0
+    assert scorer.scores()["observed_seconds"] == pytest.approx(1.0)
+    assert scorer.scores()["perclos"] == pytest.approx(1.0)
+
+
+def test_empty_scorer():
+    scores = make_scorer().scores()
+    assert scores == {
+        "perclos": 0.0,
+        "observed_seconds": 0.0,
+        "eyes_closed_seconds": 0.0,
+        "eyes_closed_frames": 0,
+        "blinks_per_minute": 0.0,
+        "yawns_per_minute": 0.0,
+    }
+
+
+def test_long_runs_leave_no_residue():
+    # Irregular gaps and faces coming and going, like a real camera session
+    rng = np.random.default_rng(1)
+    scorer = make_scorer(perclos_window=5.0, capacity=32, max_gap=0.4)
+    t = 1.7e9
+    for _ in range(50000):
+        t += rng.uniform(0.01, 0.5)
+        r = rng.random()
+        scorer.add(t, np.nan if r < 0.6 else CLOSED if r < 0.8 else OPEN)
+
+        window = scorer.perclos_window
+        assert 0 <= window.closed_us <= window.observed_us
+        scores = scorer.scores()
+        if scores["observed_seconds"] == 0:
+            assert scores["perclos"] == 0.0
+
+    # Once every observed sample has left the window the sums are exactly zero
+    for _ in range(40):
+        t += 0.3
+        scorer.add(t)
+    assert scorer.perclos_window.observed_us == 0
+    assert scorer.perclos_window.closed_us == 0
@@ -0,0 +1,85 @@
+import os
+import types
+
+import pytest
+
+# drowsiness.py loads dlib's landmark model from the working directory at import
+pytest.importorskip("dlib")
+pytest.importorskip("imutils")
+if not os.path.exists("shape_predictor_68_face_landmarks.dat"):
+    pytest.skip(
+        "run from the service directory with shape_predictor_68_face_landmarks.dat",
+        allow_module_level=True,
+    )
+
+import drowsiness
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(drowsiness, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def make_store(ttl=60, max_sessions=100, memory_budget=float("inf")):
+    return drowsiness.SessionStore(ttl, max_sessions, memory_budget)
+
+
+def test_sessions_are_per_vehicle_camera(clock):
+    store = make_store()
+    front = store.get("V1", "front")
+
+    assert store.get("V1", "front") is front
+    assert store.get("V1", "cabin") is not front
+    assert store.get("V2", "front") is not front
+    assert front.topic == "vehicle/V1/detection/drowsiness"
+    assert len(store) == 3
+
+
+def test_idle_sessions_expire(clock):
+    store = make_store(ttl=60)
+    idle = store.get("V1", "front")
+    clock[0] += 30
+    active = store.get("V2", "front")
+
+    clock[0] += 40
+    store.get("V2", "front")
+    assert len(store) == 1
+    assert store.get("V2", "front") is active
+    # An expired session starts over with fresh scores
+    assert store.get("V1", "front") is not idle
+
+
+def test_newest_session_is_never_expired(clock):
+    store = make_store(ttl=60)
+    session = store.get("V1", "front")
+    clock[0] += 600
+    assert store.get("V1", "front") is session
+
+
+def test_session_cap_evicts_least_recently_used(clock):
+    store = make_store(max_sessions=3)
+    first = store.get("V1", "front")
+    store.get("V2", "front")
+    store.get("V3", "front")
+
+    # Using V1 again makes V2 the least recently used
+    clock[0] += 1
+    assert store.get("V1", "front") is first
+    store.get("V4", "front")
+
+    assert len(store) == 3
+    assert set(store.sessions) == {("V1", "front"), ("V3", "front"), ("V4", "front")}
+
+
+def test_memory_budget_and_accounting(clock):
+    session_size = make_store().get("V0", "front").memory_usage()
+    store = make_store(memory_budget=2.5 * session_size)
+
+    for i in range(5):
+        store.get(f"V{i}", "front")
+
+    assert len(store) == 2
+    assert set(store.sessions) == {("V3", "front"), ("V4", "front")}
+    assert store.memory == sum(s.memory_usage() for s in store.sessions.values())
@@ -0,0 +1,179 @@
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from face_detectors import FACE_DETECTORS, create_face_detector
+
+
+def load_frames(folder, labels_file, scale):
+    """Load the labelled frames, resized by ``scale`` like ``process_frames``.
+
+    ``labels_file`` maps each image filename to its ground-truth faces as
+    ``[top, right, bottom, left]`` boxes in full-resolution pixels; frames
+    with an empty list are negatives.
+    """
+    with open(os.path.join(folder, labels_file), "r") as f:
+        labels = json.load(f)
+
+    frames = []
+    for filename, boxes in sorted(labels.items()):
+        image = cv2.imread(os.path.join(folder, filename))
+        if image is None:
+            print(f"Skipping unreadable frame {filename}")
+            continue
+
+        small = cv2.resize(image, (0, 0), fx=scale, fy=scale)
+        rgb_small = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+        boxes = [tuple(int(round(v * scale)) for v in box) for box in boxes]
+        frames.append((filename, rgb_small, boxes))
+    return frames
+
+
+def box_iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    intersection = max(0, right - left) * max(0, bottom - top)
+    union = (
+        (a[1] - a[3]) * (a[2] - a[0]) + (b[1] - b[3]) * (b[2] - b[0]) - intersection
+    )
+    return intersection / union if union > 0 else 0.0
+
+
+def match_detections(detections, truths, iou_threshold):
+    """Greedily match detections to ground truth, best IoU first."""
+    pairs = sorted(
+        (
+            (box_iou(detection, truth), d, t)
+            for d, detection in enumerate(detections)
+            for t, truth in enumerate(truths)
+        ),
+        reverse=True,
+    )
+
+    used_detections = set()
+    used_truths = set()
+    for iou, d, t in pairs:
+        if iou < iou_threshold:
+            break
+        if d in used_detections or t in used_truths:
+            continue
+        used_detections.add(d)
+        used_truths.add(t)
+    return len(used_truths)
+
+
+def detector_kwargs(name, args):
+    if name == "hog":
+        return {"upsample": args.upsample}
+    if name == "haar":
+        return {"model_path": args.haar_model}
+    return {
+        "model_path": args.dnn_model,
+        "config_path": args.dnn_config,
+        "confidence": args.dnn_confidence,
+    }
+
+
+def run(args):
+    frames = load_frames(args.folder, args.labels, args.scale)
+    if not frames:
+        raise SystemExit(f"No labelled frames found in {args.folder}")
+
+    results = []
+    for name in args.detectors:
+        try:
+            detector = create_face_detector(name, **detector_kwargs(name, args))
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+            continue
+
+        # One untimed pass so model loading and lazy init are not measured
+        detector.detect(frames[0][1])
+
+        latencies = []
+        true_faces = found_faces = detections_total = 0
+        for _ in range(args.repeat):
+            for _, rgb_small, truths in frames:
+                t0 = time.perf_counter()
+                detections = detector.detect(rgb_small)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+
+                true_faces += len(truths)
+                detections_total += len(detections)
+                found_faces += match_detections(detections, truths, args.iou)
+
+        latencies = np.array(latencies)
+        results.append(
+            {
+                "detector": name,
+                "frames": len(frames),
+                "scale": args.scale,
+                "recall": round(found_faces / true_faces, 4) if true_faces else None,
+                "precision": (
+                    round(found_faces / detections_total, 4)
+                    if detections_total
+                    else None
+                ),
+                "mean_ms": round(float(latencies.mean()), 3),
+                "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                "fps": round(1000.0 / float(latencies.mean()), 1),
+            }
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Latency/recall benchmark for the face detector backends"
+    )
+    parser.add_argument("folder", help="folder with the frames and the labels file")
+    parser.add_argument(
+        "--labels",
+        default="labels.json",
+        help='JSON mapping filename to [[top, right, bottom, left], ...]',
+    )
+    parser.add_argument(
+        "--detectors",
+        nargs="+",
+        default=sorted(FACE_DETECTORS),
+        choices=sorted(FACE_DETECTORS),
+    )
+    parser.add_argument("--scale", type=float, default=0.5)
+    parser.add_argument("--iou", type=float, default=0.4)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--upsample", type=int, default=1)
+    parser.add_argument("--haar-model", default=None)
+    parser.add_argument("--dnn-model", default=None)
+    parser.add_argument("--dnn-config", default=None)
+    parser.add_argument("--dnn-confidence", type=float, default=0.5)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+        return
+
+    print(
+        f"{'detector':<10} {'recall':>8} {'precision':>10} {'mean ms':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'fps':>8}"
+    )
+    for row in results:
+        recall = "-" if row["recall"] is None else f"{row['recall']:.3f}"
+        precision = "-" if row["precision"] is None else f"{row['precision']:.3f}"
+        print(
+            f"{row['detector']:<10} {recall:>8} {precision:>10} {row['mean_ms']:>9.2f} "
+            f"{row['p50_ms']:>8.2f} {row['p95_ms']:>8.2f} {row['fps']:>8.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from face_index import FACE_ENCODING_DIM, create_face_index
+
+
+def make_gallery(size, rng):
+    # dlib encodings are roughly unit-norm; identities are spread on the sphere
+    gallery = rng.normal(size=(size, FACE_ENCODING_DIM)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def make_queries(gallery, count, noise, rng):
+    ids = rng.integers(0, len(gallery), size=count)
+    queries = gallery[ids] + rng.normal(
+        scale=noise, size=(count, FACE_ENCODING_DIM)
+    ).astype(np.float32)
+    return queries
+
+
+def time_search(index, queries, batch_size):
+    latencies = []
+    keys = []
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start : start + batch_size]
+        t0 = time.perf_counter()
+        batch_keys, _ = index.search(batch)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        keys.extend(batch_keys)
+    return keys, np.array(latencies)
+
+
+def run(args):
+    rng = np.random.default_rng(args.seed)
+    results = []
+
+    for size in args.sizes:
+        gallery = make_gallery(size, rng)
+        keys = [f"face_{i}" for i in range(size)]
+        queries = make_queries(gallery, args.queries, args.noise, rng)
+
+        exact = create_face_index("brute")
+        exact.reset(keys, gallery)
+        exact_keys, exact_latencies = time_search(exact, queries, args.batch_size)
+
+        configs = [("brute", exact_keys, exact_latencies, 0.0)]
+        for n_probe in args.nprobe:
+            index = create_face_index(
+                "ivf", n_probe=n_probe, n_lists=args.nlists, min_train_size=1
+            )
+            t0 = time.perf_counter()
+            index.reset(keys, gallery)
+            build_ms = (time.perf_counter() - t0) * 1000.0
+            found_keys, latencies = time_search(index, queries, args.batch_size)
+            configs.append((f"ivf/nprobe={n_probe}", found_keys, latencies, build_ms))
+
+        for name, found_keys, latencies, build_ms in configs:
+            recall = float(
+                np.mean([a == b for a, b in zip(found_keys, exact_keys)])
+            )
+            results.append(
+                {
+                    "gallery_size": size,
+                    "index": name,
+                    "batch_size": args.batch_size,
+                    "build_ms": round(build_ms, 2),
+                    "recall_at_1": round(recall, 4),
+                    "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+                    "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+                    "queries_per_sec": round(
+                        len(queries) / (latencies.sum() / 1000.0), 1
+                    ),
+                }
+            )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Recall/latency benchmark for the known-face index"
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=[1000, 10000, 50000]
+    )
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16])
+    parser.add_argument("--nlists", type=int, default=None)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+        return
+
+    print(
+        f"{'size':>8} {'index':<16} {'build ms':>10} {'recall@1':>9} "
+        f"{'p50 ms':>8} {'p95 ms':>8} {'q/s':>10}"
+    )
+    for row in results:
+        print(
+            f"{row['gallery_size']:>8} {row['index']:<16} {row['build_ms']:>10.1f} "
+            f"{row['recall_at_1']:>9.3f} {row['p50_ms']:>8.3f} {row['p95_ms']:>8.3f} "
+            f"{row['queries_per_sec']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,646 @@
+import argparse
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+STAGES = [
+    "base64_decode",
+    "imdecode",
+    "resize",
+    "detect",
+    "encode",
+    "match",
+    "draw",
+    "publish",
+    "intruder_upload",
+]
+
+
+class PhotoApiStub(BaseHTTPRequestHandler):
+    """Local stand-in for the photo API: accepts intruder uploads, has no faces."""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(b'{"status": "ok"}')
+
+    def do_GET(self):
+        self.send_response(404)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FirebaseDbStub:
+    def reference(self, path):
+        return self
+
+    def set(self, data):
+        pass
+
+
+class MqttClientStub:
+    def publish(self, topic, payload):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+
+def start_photo_api():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PhotoApiStub)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def import_facerec(api_url):
+    # The service reads its configuration at import time, so the stubs have
+    # to be in place before the first import.
+    os.environ["KNOWN_FACES_API"] = api_url
+    os.environ["INTRUDER_API"] = api_url
+    # Nothing listens on port 1; the module-level MQTT client fails right away
+    # and every system gets MqttClientStub instead.
+    os.environ["MQTT_BROKER"] = "127.0.0.1"
+    os.environ["MQTT_PORT"] = "1"
+    # Detection and encoding have to run in this process to be timed
+    os.environ["INFERENCE_WORKERS"] = "0"
+
+    import facerec
+
+    facerec.db = FirebaseDbStub()
+    return facerec
+
+
+class StageTimer:
+    """Accumulates the time spent in each stage of the current frame."""
+
+    def __init__(self):
+        self.current = defaultdict(float)
+
+    def add(self, stage, seconds):
+        self.current[stage] += seconds * 1000.0
+
+    def wrap(self, stage, func):
+        def timed(*args, **kwargs):
+            t0 = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - t0)
+
+        return timed
+
+    def take(self):
+        current = self.current
+        self.current = defaultdict(float)
+        return current
+
+
+class TimedDetector:
+    def __init__(self, detector, timer):
+        self.detector = detector
+        self.timer = timer
+
+    def detect(self, rgb_frame):
+        t0 = time.perf_counter()
+        try:
+            return self.detector.detect(rgb_frame)
+        finally:
+            self.timer.add("detect", time.perf_counter() - t0)
+
+
+def instrument(facerec, timer):
+    """Wrap the module-level pipeline steps so every call is timed."""
+    import face_recognition
+    import inference_pool
+
+    facerec.detection_frame = timer.wrap("resize", facerec.detection_frame)
+    face_recognition.face_encodings = timer.wrap(
+        "encode", face_recognition.face_encodings
+    )
+
+    get_face_detector = inference_pool.get_face_detector
+    inference_pool.get_face_detector = lambda: TimedDetector(
+        get_face_detector(), timer
+    )
+
+
+class StubbedSystemFactory:
+    """Builds FaceRecognitionSystem instances wired to the local stubs."""
+
+    def __init__(self, facerec, timer, api_url, args):
+        class StubbedFaceSystem(facerec.FaceRecognitionSystem):
+            def init_firebase(self):
+                pass
+
+        self.system_class = StubbedFaceSystem
+        self.timer = timer
+        self.api_url = api_url
+        self.args = args
+
+    def create(
+        self,
+        known_faces_dir,
+        vehicle_id="bench",
+        detection_interval=0,
+        frame_queue=None,
+    ):
+        system = self.system_class(
+            known_faces_dir=known_faces_dir,
+            detection_interval=detection_interval,
+            intruder_api_endpoint=f"{self.api_url}/{vehicle_id}/upload_intruder/",
+            known_faces_api_endpoint=f"{self.api_url}/{vehicle_id}/knownface_json/",
+            known_faces_manifest_endpoint=(
+                f"{self.api_url}/{vehicle_id}/knownface_manifest/"
+            ),
+            face_index_type=self.args.index,
+            vehicle_id=vehicle_id,
+            mqtt_client=MqttClientStub(),
+            frame_queue=frame_queue,
+            face_track_reuse_frames=self.args.track_reuse_frames,
+        )
+
+        # _handle_detections draws, publishes and uploads inline; the publish
+        # and upload calls are timed separately and subtracted as "draw".
+        system.match_faces = self.timer.wrap("match", system.match_faces)
+        system.publish_to_firebase = self.timer.wrap(
+            "publish", system.publish_to_firebase
+        )
+        system.publish_to_mqtt = self.timer.wrap("publish", system.publish_to_mqtt)
+        system.upload_intruder_image = self.timer.wrap(
+            "intruder_upload", system.upload_intruder_image
+        )
+        system._handle_detections = self.timer.wrap(
+            "handle", system._handle_detections
+        )
+        return system
+
+
+def make_gallery(size, rng, dim):
+    # dlib encodings are roughly unit-norm; identities are spread on the sphere
+    gallery = rng.normal(size=(size, dim)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+    return gallery
+
+
+def load_face(path, margin=0.3):
+    """Return the face crop (BGR) and encoding of the face photo at ``path``."""
+    import face_recognition
+    from face_detectors import get_face_detector
+
+    image = cv2.imread(path)
+    if image is None:
+        raise SystemExit(f"Could not read face image {path}")
+
+    rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    locations = get_face_detector().detect(rgb)
+    if not locations:
+        raise SystemExit(f"No face found in {path}")
+
+    top, right, bottom, left = max(
+        locations, key=lambda box: (box[1] - box[3]) * (box[2] - box[0])
+    )
+    encoding = face_recognition.face_encodings(rgb, [(top, right, bottom, left)])[0]
+
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    height, width = image.shape[:2]
+    crop = image[
+        max(0, top - pad_y) : min(height, bottom + pad_y),
+        max(0, left - pad_x) : min(width, right + pad_x),
+    ]
+    return crop, np.asarray(encoding, dtype=np.float32)
+
+
+def synthetic_frame(face_crop, faces, width, height):
+    """Grey frame with ``faces`` copies of the face crop laid out on a grid."""
+    frame = np.full((height, width, 3), 96, dtype=np.uint8)
+    if faces == 0:
+        return frame
+
+    columns = int(np.ceil(np.sqrt(faces)))
+    rows = int(np.ceil(faces / columns))
+    cell_w, cell_h = width // columns, height // rows
+
+    crop_h, crop_w = face_crop.shape[:2]
+    ratio = min(cell_w / crop_w, cell_h / crop_h) * 0.9
+    face = cv2.resize(face_crop, (int(crop_w * ratio), int(crop_h * ratio)))
+    face_h, face_w = face.shape[:2]
+
+    for i in range(faces):
+        row, column = divmod(i, columns)
+        y = row * cell_h + (cell_h - face_h) // 2
+        x = column * cell_w + (cell_w - face_w) // 2
+        frame[y : y + face_h, x : x + face_w] = face
+    return frame
+
+
+def load_recorded_frames(folder):
+    frames = []
+    for filename in sorted(os.listdir(folder)):
+        if not filename.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        with open(os.path.join(folder, filename), "rb") as f:
+            data = f.read()
+        if not filename.lower().endswith((".jpg", ".jpeg")):
+            image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None:
+                continue
+            data = cv2.imencode(".jpg", image)[1].tobytes()
+        frames.append(data)
+    return frames
+
+
+def encode_jpeg(frame, quality):
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+def run_config(factory, facerec, timer, payloads, gallery_size, rider, args, rng):
+    with tempfile.TemporaryDirectory() as known_faces_dir:
+        system = factory.create(known_faces_dir)
+        try:
+            names = [f"face_{i}" for i in range(gallery_size)]
+            gallery = make_gallery(gallery_size, rng, facerec.FACE_ENCODING_DIM)
+            if rider is not None:
+                names.append("rider")
+                gallery = np.vstack([gallery, rider[None, :]])
+            system._set_known_faces(names, gallery)
+
+            b64decode = timer.wrap("base64_decode", base64.b64decode)
+            imdecode = timer.wrap("imdecode", cv2.imdecode)
+            stage_times = defaultdict(list)
+            totals = []
+            results = defaultdict(int)
+            for i in range(args.warmup + args.count):
+                payload = payloads[i % len(payloads)]
+                timer.take()
+
+                t0 = time.perf_counter()
+                image_data = b64decode(payload)
+                frame = imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_COLOR)
+                _, result = system.process_frame(frame, "bench")
+                total = (time.perf_counter() - t0) * 1000.0
+
+                stages = timer.take()
+                if i < args.warmup:
+                    continue
+
+                stages["draw"] = max(
+                    0.0,
+                    stages.pop("handle", 0.0)
+                    - stages["publish"]
+                    - stages["intruder_upload"],
+                )
+                for stage in STAGES:
+                    stage_times[stage].append(stages.get(stage, 0.0))
+                totals.append(total)
+                results[result] += 1
+
+            # Let the background publisher and upload workers drain so their
+            # counts cover every frame of this configuration.
+            time.sleep(args.drain)
+            publisher = system.status_publisher
+            uploads = system.intruder_uploader.metrics()
+        finally:
+            system.cleanup()
+
+    return {
+        "total": percentiles(totals),
+        "fps": round(1000.0 / float(np.mean(totals)), 1),
+        "stages": {stage: percentiles(stage_times[stage]) for stage in STAGES},
+        "results": dict(results),
+        "status_updates_sent": publisher.sent_count,
+        "status_updates_suppressed": publisher.suppressed_count,
+        "intruder_uploads": uploads,
+    }
+
+
+def record_batch_sizes(frame_queue, batch_sizes):
+    process_batch = frame_queue.process_batch
+
+    def recorded(frames, keys):
+        batch_sizes.append(len(frames))
+        return process_batch(frames, keys)
+
+    frame_queue.process_batch = recorded
+
+
+def send_uploads(system_for, vehicle_id, jpeg_frames, args, rng, outcomes):
+    """One vehicle's camera: a frame every 1 / upload_fps seconds, with jitter."""
+    interval = 1.0 / args.upload_fps
+    time.sleep(rng.uniform(0, interval))
+    deadline = time.perf_counter() + args.duration
+    i = 0
+    while time.perf_counter() < deadline:
+        sent_at = time.perf_counter()
+        image_data = jpeg_frames[i % len(jpeg_frames)]
+        processed, result = system_for(vehicle_id).process_rest_image(
+            image_data, camera_id=vehicle_id, wait=True
+        )
+        latency = (time.perf_counter() - sent_at) * 1000.0
+        outcomes.append((processed, result, latency))
+        i += 1
+        time.sleep(
+            max(0.0, sent_at + interval * rng.uniform(0.8, 1.2) - time.perf_counter())
+        )
+
+
+def run_traffic(factory, facerec, jpeg_frames, gallery_size, args, rng):
+    """Many vehicles uploading at once, with a queue per vehicle or a shared one.
+
+    Each vehicle only gets a frame through every ``detection_interval``, so a
+    queue per vehicle rarely holds more than one frame; the shared queue of
+    FaceSystemRegistry batches frames across vehicles.
+    """
+    gallery = make_gallery(max(gallery_size, 1), rng, facerec.FACE_ENCODING_DIM)
+    names = [f"face_{i}" for i in range(len(gallery))]
+    vehicle_ids = [f"vehicle{i:03d}" for i in range(args.vehicles)]
+
+    rows = []
+    for layout in ("per_vehicle", "shared"):
+        batch_sizes = []
+        with tempfile.TemporaryDirectory() as known_faces_dir:
+
+            def create(vehicle_id, frame_queue=None):
+                system = factory.create(
+                    known_faces_dir,
+                    vehicle_id=vehicle_id,
+                    detection_interval=args.detection_interval,
+                    frame_queue=frame_queue,
+                )
+                system._set_known_faces(names, gallery)
+                if frame_queue is None:
+                    record_batch_sizes(system.frame_queue, batch_sizes)
+                return system
+
+            if layout == "shared":
+                registry = facerec.FaceSystemRegistry(
+                    create, memory_budget=float("inf"), max_systems=args.vehicles
+                )
+                record_batch_sizes(registry.frame_queue, batch_sizes)
+                for vehicle_id in vehicle_ids:
+                    registry.get(vehicle_id)
+                system_for = registry.get
+                cleanup = registry.cleanup
+            else:
+                systems = {vehicle_id: create(vehicle_id) for vehicle_id in vehicle_ids}
+                system_for = systems.__getitem__
+
+                def cleanup():
+                    for system in systems.values():
+                        system.cleanup()
+
+            outcomes = []
+            threads = [
+                threading.Thread(
+                    target=send_uploads,
+                    args=(
+                        system_for,
+                        vehicle_id,
+                        jpeg_frames,
+                        args,
+                        np.random.default_rng(args.seed + i),
+                        outcomes,
+                    ),
+                )
+                for i, vehicle_id in enumerate(vehicle_ids)
+            ]
+            try:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                cleanup()
+
+        counts = defaultdict(int)
+        latencies = []
+        for processed, result, latency in outcomes:
+            if processed:
+                counts["processed"] += 1
+                latencies.append(latency)
+            else:
+                counts[result] += 1
+        sizes = np.asarray(batch_sizes or [0])
+        rows.append(
+            {
+                "layout": layout,
+                "vehicles": args.vehicles,
+                "upload_fps": args.upload_fps,
+                "detection_interval": args.detection_interval,
+                "uploads": len(outcomes),
+                "results": dict(counts),
+                "batches": len(batch_sizes),
+                "mean_batch": round(float(sizes.mean()), 2),
+                "max_batch": int(sizes.max()),
+                "batch_sizes": {
+                    int(size): int(count)
+                    for size, count in zip(*np.unique(sizes, return_counts=True))
+                },
+                "latency": percentiles(latencies or [0.0]),
+            }
+        )
+    return rows
+
+
+def run(args):
+    server = start_photo_api()
+    api_url = f"http://127.0.0.1:{server.server_address[1]}"
+    facerec = import_facerec(api_url)
+
+    timer = StageTimer()
+    rng = np.random.default_rng(args.seed)
+
+    face_crop = rider = None
+    if args.face_image:
+        face_crop, rider = load_face(args.face_image)
+    if args.unknown:
+        rider = None
+
+    if args.frames:
+        recorded = load_recorded_frames(args.frames)
+        if not recorded:
+            raise SystemExit(f"No frames found in {args.frames}")
+        inputs = [("recorded", recorded)]
+    else:
+        if face_crop is None and any(args.faces):
+            raise SystemExit("Synthetic frames with faces need --face-image")
+        width, height = args.resolution
+        inputs = [
+            (
+                faces,
+                [
+                    encode_jpeg(
+                        synthetic_frame(face_crop, faces, width, height),
+                        args.jpeg_quality,
+                    )
+                ],
+            )
+            for faces in args.faces
+        ]
+
+    factory = StubbedSystemFactory(facerec, timer, api_url, args)
+    results = []
+
+    if args.vehicles:
+        try:
+            for faces, jpeg_frames in inputs:
+                for row in run_traffic(
+                    factory, facerec, jpeg_frames, args.gallery_sizes[0], args, rng
+                ):
+                    row.update({"faces": faces, "index": args.index})
+                    results.append(row)
+        finally:
+            server.shutdown()
+        return results
+
+    # Instrument after the face photo was loaded so its encoding is not timed
+    instrument(facerec, timer)
+
+    try:
+        for faces, jpeg_frames in inputs:
+            payloads = [base64.b64encode(data) for data in jpeg_frames]
+            for gallery_size in args.gallery_sizes:
+                row = {
+                    "faces": faces,
+                    "gallery_size": gallery_size,
+                    "index": args.index,
+                    "detector": facerec.FACE_DETECTOR,
+                    "frames": args.count,
+                    "enrolled": rider is not None,
+                }
+                row.update(
+                    run_config(
+                        factory,
+                        facerec,
+                        timer,
+                        payloads,
+                        gallery_size,
+                        rider,
+                        args,
+                        rng,
+                    )
+                )
+                results.append(row)
+    finally:
+        server.shutdown()
+
+    return results
+
+
+def parse_resolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-stage latency benchmark for the face recognition pipeline"
+    )
+    parser.add_argument(
+        "--frames", help="folder of recorded JPEG/PNG frames instead of synthetic ones"
+    )
+    parser.add_argument(
+        "--face-image", help="photo with one face, pasted into synthetic frames"
+    )
+    parser.add_argument(
+        "--unknown",
+        action="store_true",
+        help="do not enroll the face image, so every face is an intruder",
+    )
+    parser.add_argument("--faces", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument(
+        "--gallery-sizes", type=int, nargs="+", default=[0, 100, 1000, 10000]
+    )
+    parser.add_argument("--resolution", type=parse_resolution, default=(640, 480))
+    parser.add_argument("--jpeg-quality", type=int, default=90)
+    parser.add_argument("--index", choices=["brute", "ivf"], default="brute")
+    parser.add_argument(
+        "--track-reuse-frames",
+        type=int,
+        default=0,
+        help="face tracker encoding reuse (0 encodes every face of every frame)",
+    )
+    parser.add_argument(
+        "--vehicles",
+        type=int,
+        default=0,
+        help="simulate this many vehicles uploading concurrently and report "
+        "frame batch sizes instead of per-stage latency",
+    )
+    parser.add_argument("--upload-fps", type=float, default=2.0)
+    parser.add_argument("--detection-interval", type=float, default=1.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--count", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--drain", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print JSON lines")
+    args = parser.parse_args()
+
+    results = run(args)
+
+    if args.json:
+        for row in results:
+            print(json.dumps(row))
+        return
+
+    if args.vehicles:
+        print(
+            f"{'faces':>6} {'layout':<12} {'uploads':>8} {'processed':>10} "
+            f"{'batches':>8} {'mean':>6} {'max':>4} {'p50 ms':>8} {'p95 ms':>8}"
+        )
+        for row in results:
+            print(
+                f"{row['faces']:>6} {row['layout']:<12} {row['uploads']:>8} "
+                f"{row['results'].get('processed', 0):>10} {row['batches']:>8} "
+                f"{row['mean_batch']:>6.2f} {row['max_batch']:>4} "
+                f"{row['latency']['p50_ms']:>8.2f} {row['latency']['p95_ms']:>8.2f}"
+            )
+        return
+
+    for row in results:
+        total = row["total"]
+        print(
+            f"\nfaces={row['faces']} gallery={row['gallery_size']} "
+            f"index={row['index']} detector={row['detector']}: "
+            f"p50 {total['p50_ms']:.2f} ms, p95 {total['p95_ms']:.2f} ms, "
+            f"p99 {total['p99_ms']:.2f} ms, {row['fps']:.1f} fps"
+        )
+        print(
+            f"  {'stage':<16} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for stage in STAGES:
+            timing = row["stages"][stage]
+            print(
+                f"  {stage:<16} {timing['mean_ms']:>9.3f} {timing['p50_ms']:>8.3f} "
+                f"{timing['p95_ms']:>8.3f} {timing['p99_ms']:>8.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
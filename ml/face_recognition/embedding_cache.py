@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+
+import numpy as np
+
+from face_index import FACE_ENCODING_DIM
+
+EMBEDDING_CACHE_FILE = ".embedding_cache.npy"
+EMBEDDING_CACHE_INDEX_FILE = ".embedding_cache.json"
+
+
+class EmbeddingCache:
+    """Face encodings keyed by the SHA-256 of the source image bytes.
+
+    The encodings live in one float32 ``.npy`` matrix (opened memory-mapped)
+    next to the photos, with a small JSON index mapping content hash to row.
+    Images in which no face was found are cached too (row -1), so they are
+    not run through HOG again on every start.
+    """
+
+    def __init__(self, directory):
+        self.matrix_path = os.path.join(directory, EMBEDDING_CACHE_FILE)
+        self.index_path = os.path.join(directory, EMBEDDING_CACHE_INDEX_FILE)
+        self.lock = threading.Lock()
+        self.dirty = False
+
+        self.matrix = np.empty((0, FACE_ENCODING_DIM), dtype=np.float32)
+        self.rows = {}
+        self.pending = {}
+
+        self.load()
+
+    @staticmethod
+    def content_hash(data):
+        return hashlib.sha256(data).hexdigest()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r") as f:
+                rows = json.load(f)
+            matrix = np.load(self.matrix_path, mmap_mode="r")
+
+            if matrix.ndim != 2 or matrix.shape[1] != FACE_ENCODING_DIM:
+                raise ValueError(f"unexpected matrix shape {matrix.shape}")
+            if any(row >= len(matrix) for row in rows.values()):
+                raise ValueError("index refers to rows outside the matrix")
+
+            self.matrix = matrix
+            self.rows = rows
+            print(f"Loaded {len(rows)} cached face encodings from {self.matrix_path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Ignoring unreadable embedding cache {self.matrix_path}: {e}")
+
+    def __contains__(self, content_hash):
+        with self.lock:
+            return content_hash in self.pending or content_hash in self.rows
+
+    def get(self, content_hash):
+        with self.lock:
+            if content_hash in self.pending:
+                return self.pending[content_hash]
+
+            row = self.rows.get(content_hash, -1)
+            if row < 0:
+                return None
+            return np.array(self.matrix[row], dtype=np.float32)
+
+    def put(self, content_hash, face_encoding):
+        if face_encoding is not None:
+            face_encoding = np.asarray(face_encoding, dtype=np.float32)
+
+        with self.lock:
+            self.pending[content_hash] = face_encoding
+            self.dirty = True
+
+    def save(self, keep_hashes=None):
+        with self.lock:
+            if keep_hashes is not None:
+                keep_hashes = set(keep_hashes)
+                if not self.dirty and keep_hashes.issuperset(self.rows):
+                    return
+            elif not self.dirty:
+                return
+
+            entries = {}
+            for content_hash, row in self.rows.items():
+                entries[content_hash] = self.matrix[row] if row >= 0 else None
+            entries.update(self.pending)
+
+            if keep_hashes is not None:
+                entries = {h: e for h, e in entries.items() if h in keep_hashes}
+
+            rows = {}
+            encodings = []
+            for content_hash, encoding in entries.items():
+                if encoding is None:
+                    rows[content_hash] = -1
+                else:
+                    rows[content_hash] = len(encodings)
+                    encodings.append(encoding)
+
+            matrix = np.array(encodings, dtype=np.float32).reshape(
+                -1, FACE_ENCODING_DIM
+            )
+
+            try:
+                # Write to temporary files and rename, so a crash mid-save
+                # never leaves a matrix that disagrees with its index.
+                tmp_matrix_path = self.matrix_path + ".tmp.npy"
+                tmp_index_path = self.index_path + ".tmp"
+                np.save(tmp_matrix_path, matrix)
+                with open(tmp_index_path, "w") as f:
+                    json.dump(rows, f)
+                os.replace(tmp_matrix_path, self.matrix_path)
+                os.replace(tmp_index_path, self.index_path)
+            except Exception as e:
+                print(f"Error saving embedding cache {self.matrix_path}: {e}")
+                return
+
+            self.matrix = matrix
+            self.rows = rows
+            self.pending = {}
+            self.dirty = False
+            print(f"Saved {len(rows)} face encodings to {self.matrix_path}")
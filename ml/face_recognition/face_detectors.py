@@ -0,0 +1,158 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+
+class HogDetector:
+    """dlib's HOG + linear SVM detector, as used by face_recognition."""
+
+    def __init__(self, upsample=1):
+        self.upsample = upsample
+
+    def detect(self, rgb_frame):
+        import face_recognition
+
+        return [
+            tuple(location)
+            for location in face_recognition.face_locations(
+                rgb_frame, number_of_times_to_upsample=self.upsample, model="hog"
+            )
+        ]
+
+
+class HaarDetector:
+    """OpenCV Haar cascade, the same detector drowsiness.py uses."""
+
+    def __init__(
+        self,
+        model_path=None,
+        scale_factor=1.1,
+        min_neighbors=5,
+        min_size=(30, 30),
+    ):
+        if model_path is None:
+            model_path = cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+
+        self.cascade = cv2.CascadeClassifier(model_path)
+        if self.cascade.empty():
+            raise ValueError(f"Could not load Haar cascade from {model_path}")
+
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.min_size = tuple(min_size)
+
+    def detect(self, rgb_frame):
+        gray = cv2.cvtColor(rgb_frame, cv2.COLOR_RGB2GRAY)
+        rects = self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=self.scale_factor,
+            minNeighbors=self.min_neighbors,
+            minSize=self.min_size,
+            flags=cv2.CASCADE_SCALE_IMAGE,
+        )
+        return [(int(y), int(x + w), int(y + h), int(x)) for (x, y, w, h) in rects]
+
+
+class DnnDetector:
+    """OpenCV DNN face detector loaded from a local model file.
+
+    Defaults match the res10 300x300 SSD shipped with OpenCV's samples
+    (``res10_300x300_ssd_iter_140000.caffemodel`` with ``deploy.prototxt``),
+    but any network producing the SSD ``[1, 1, N, 7]`` detection output works.
+    ``cv2.dnn.Net`` is not thread-safe, so concurrent ``detect`` calls take
+    turns running the network.
+    """
+
+    def __init__(
+        self,
+        model_path,
+        config_path=None,
+        confidence=0.5,
+        input_size=(300, 300),
+        mean=(104.0, 177.0, 123.0),
+    ):
+        if not model_path:
+            raise ValueError("The dnn face detector needs a model file")
+        for path in (model_path, config_path):
+            if path and not os.path.isfile(path):
+                raise ValueError(f"Face detector model file {path} does not exist")
+
+        try:
+            self.net = cv2.dnn.readNet(model_path, config_path or "")
+        except cv2.error as e:
+            raise ValueError(f"Could not load face detector model {model_path}: {e}")
+        self.confidence = confidence
+        self.input_size = tuple(input_size)
+        self.mean = mean
+        self.lock = threading.Lock()
+
+    def detect(self, rgb_frame):
+        height, width = rgb_frame.shape[:2]
+        # The network was trained on BGR input
+        blob = cv2.dnn.blobFromImage(
+            rgb_frame, 1.0, self.input_size, self.mean, swapRB=True, crop=False
+        )
+        with self.lock:
+            self.net.setInput(blob)
+            detections = self.net.forward().reshape(-1, 7)
+
+        locations = []
+        for detection in detections[detections[:, 2] >= self.confidence]:
+            left, top, right, bottom = (
+                detection[3:7] * np.array([width, height, width, height])
+            ).astype(int)
+            left, top = max(0, left), max(0, top)
+            right, bottom = min(width - 1, right), min(height - 1, bottom)
+            if right > left and bottom > top:
+                locations.append((int(top), int(right), int(bottom), int(left)))
+        return locations
+
+
+FACE_DETECTORS = {
+    "hog": HogDetector,
+    "haar": HaarDetector,
+    "dnn": DnnDetector,
+}
+
+
+def create_face_detector(detector_type="hog", **kwargs):
+    try:
+        detector_class = FACE_DETECTORS[detector_type]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face detector {detector_type!r}, expected one of {sorted(FACE_DETECTORS)}"
+        )
+    return detector_class(**kwargs)
+
+
+_default_config = ("hog", {})
+_default_detector = None
+_default_detector_pid = None
+
+
+def configure_face_detector(detector_type="hog", **kwargs):
+    """Select the detector ``run_inference`` uses in this process.
+
+    The detector is built right away, so a bad configuration (an unknown
+    type, a missing model file) raises ``ValueError`` at startup instead of
+    on the first frame. Forked inference workers still build their own
+    OpenCV/dlib objects on first use.
+    """
+    global _default_config, _default_detector, _default_detector_pid
+
+    detector = create_face_detector(detector_type, **kwargs)
+    _default_config = (detector_type, kwargs)
+    _default_detector = detector
+    _default_detector_pid = os.getpid()
+
+
+def get_face_detector():
+    global _default_detector, _default_detector_pid
+
+    if _default_detector is None or _default_detector_pid != os.getpid():
+        detector_type, kwargs = _default_config
+        _default_detector = create_face_detector(detector_type, **kwargs)
+        _default_detector_pid = os.getpid()
+    return _default_detector
@@ -0,0 +1,364 @@
+import threading
+
+import numpy as np
+
+FACE_ENCODING_DIM = 128
+
+
+class VectorBlock:
+    """Growable float32 matrix of vectors with their keys and squared norms.
+
+    Rows are kept dense: removing a key moves the last row into its slot, so
+    add and remove are O(1) amortised and distances are always computed over
+    one contiguous ``matrix[: len(self)]`` slice.
+    """
+
+    def __init__(self, dim=FACE_ENCODING_DIM, capacity=16):
+        self.dim = dim
+        self.matrix = np.empty((capacity, dim), dtype=np.float32)
+        self.sq_norms = np.empty(capacity, dtype=np.float32)
+        self.keys = []
+        self.rows = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.matrix.nbytes + self.sq_norms.nbytes
+
+    def _reserve(self, size):
+        capacity = len(self.matrix)
+        if size <= capacity:
+            return
+
+        while capacity < size:
+            capacity *= 2
+
+        matrix = np.empty((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        matrix[: len(self)] = self.matrix[: len(self)]
+        sq_norms[: len(self)] = self.sq_norms[: len(self)]
+        self.matrix = matrix
+        self.sq_norms = sq_norms
+
+    def add(self, key, vector):
+        row = self.rows.get(key)
+        if row is None:
+            row = len(self.keys)
+            self._reserve(row + 1)
+            self.keys.append(key)
+            self.rows[key] = row
+
+        self.matrix[row] = vector
+        self.sq_norms[row] = np.dot(self.matrix[row], self.matrix[row])
+        return row
+
+    def remove(self, key):
+        row = self.rows.pop(key, None)
+        if row is None:
+            return False
+
+        last = len(self.keys) - 1
+        if row != last:
+            last_key = self.keys[last]
+            self.matrix[row] = self.matrix[last]
+            self.sq_norms[row] = self.sq_norms[last]
+            self.keys[row] = last_key
+            self.rows[last_key] = row
+        self.keys.pop()
+        return True
+
+    def get(self, key):
+        row = self.rows.get(key)
+        if row is None:
+            return None
+        return self.matrix[row].copy()
+
+    def vectors(self):
+        return self.matrix[: len(self)]
+
+    def squared_distances(self, queries, query_sq_norms):
+        # ||q - v||^2 = ||q||^2 + ||v||^2 - 2 q.v, shape (len(self), len(queries))
+        sq_distances = self.vectors() @ queries.T
+        sq_distances *= -2.0
+        sq_distances += self.sq_norms[: len(self), None]
+        sq_distances += query_sq_norms[None, :]
+        np.maximum(sq_distances, 0.0, out=sq_distances)
+        return sq_distances
+
+
+def _as_queries(queries, dim):
+    queries = np.ascontiguousarray(queries, dtype=np.float32).reshape(-1, dim)
+    return queries, np.einsum("ij,ij->i", queries, queries)
+
+
+class BruteForceIndex:
+    """Exact nearest-neighbour search over every stored vector."""
+
+    def __init__(self, dim=FACE_ENCODING_DIM):
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.block = VectorBlock(dim)
+
+    def __len__(self):
+        return len(self.block)
+
+    def __contains__(self, key):
+        return key in self.block.rows
+
+    @property
+    def nbytes(self):
+        return self.block.nbytes
+
+    def keys(self):
+        with self.lock:
+            return list(self.block.keys)
+
+    def get(self, key):
+        with self.lock:
+            return self.block.get(key)
+
+    def add(self, key, vector):
+        """Insert or replace ``key``. Returns True if the key was new."""
+        with self.lock:
+            is_new = key not in self.block.rows
+            self.block.add(key, vector)
+            return is_new
+
+    def remove(self, key):
+        with self.lock:
+            return self.block.remove(key)
+
+    def reset(self, keys, vectors):
+        block = VectorBlock(self.dim, capacity=max(16, len(keys)))
+        for key, vector in zip(keys, vectors):
+            block.add(key, vector)
+
+        with self.lock:
+            self.block = block
+
+    def search(self, queries):
+        """Return the nearest key and its euclidean distance for every query."""
+        queries, query_sq_norms = _as_queries(queries, self.dim)
+
+        with self.lock:
+            if len(queries) == 0 or len(self.block) == 0:
+                return [None] * len(queries), np.full(len(queries), np.inf)
+
+            sq_distances = self.block.squared_distances(queries, query_sq_norms)
+            best_rows = np.argmin(sq_distances, axis=0)
+            best_distances = np.sqrt(sq_distances[best_rows, np.arange(len(queries))])
+            return [self.block.keys[row] for row in best_rows], best_distances
+
+
+class IVFIndex:
+    """Inverted-file index: k-means coarse clustering plus per-cluster lists.
+
+    A query is compared against the ``n_probe`` closest centroids and only the
+    vectors in those lists are scanned, trading a little recall for a scan of
+    roughly ``n_probe / n_lists`` of the gallery. Until the gallery reaches
+    ``min_train_size`` vectors everything is kept in a single list, which makes
+    small galleries exact. The centroids are retrained when the gallery has
+    doubled since the last training.
+    """
+
+    def __init__(
+        self,
+        dim=FACE_ENCODING_DIM,
+        n_lists=None,
+        n_probe=8,
+        min_train_size=1024,
+        train_iterations=10,
+        seed=0,
+    ):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.min_train_size = min_train_size
+        self.train_iterations = train_iterations
+        self.rng = np.random.default_rng(seed)
+
+        self.lock = threading.Lock()
+        self.centroids = np.empty((0, dim), dtype=np.float32)
+        self.lists = [VectorBlock(dim)]
+        self.assignments = {}
+        self.trained_size = 0
+
+    def __len__(self):
+        return len(self.assignments)
+
+    def __contains__(self, key):
+        return key in self.assignments
+
+    @property
+    def nbytes(self):
+        return self.centroids.nbytes + sum(block.nbytes for block in self.lists)
+
+    def keys(self):
+        with self.lock:
+            return list(self.assignments)
+
+    def get(self, key):
+        with self.lock:
+            list_id = self.assignments.get(key)
+            if list_id is None:
+                return None
+            return self.lists[list_id].get(key)
+
+    def _nearest_centroids(self, vectors, count):
+        vectors, sq_norms = _as_queries(vectors, self.dim)
+        sq_distances = self.centroids @ vectors.T
+        sq_distances *= -2.0
+        sq_distances += np.einsum("ij,ij->i", self.centroids, self.centroids)[:, None]
+        sq_distances += sq_norms[None, :]
+
+        if count >= len(self.centroids):
+            return np.argsort(sq_distances, axis=0)
+        nearest = np.argpartition(sq_distances, count - 1, axis=0)[:count]
+        return nearest
+
+    def _assign_list(self, vector):
+        if len(self.centroids) == 0:
+            return 0
+        return int(self._nearest_centroids(vector, 1)[0, 0])
+
+    def _train(self, keys, vectors):
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(keys))))
+        n_lists = min(n_lists, len(keys))
+
+        centroids = vectors[self.rng.choice(len(vectors), n_lists, replace=False)]
+        sq_norms = np.einsum("ij,ij->i", vectors, vectors)
+
+        def nearest_labels():
+            sq_distances = vectors @ centroids.T
+            sq_distances *= -2.0
+            sq_distances += np.einsum("ij,ij->i", centroids, centroids)[None, :]
+            sq_distances += sq_norms[:, None]
+            return np.argmin(sq_distances, axis=1)
+
+        for _ in range(self.train_iterations):
+            labels = nearest_labels()
+            counts = np.bincount(labels, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, vectors)
+            non_empty = counts > 0
+            centroids[non_empty] = sums[non_empty] / counts[non_empty, None]
+        labels = nearest_labels()
+
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.lists = [VectorBlock(self.dim) for _ in range(n_lists)]
+        self.assignments = {}
+        for key, vector, label in zip(keys, vectors, labels):
+            self.lists[label].add(key, vector)
+            self.assignments[key] = int(label)
+        self.trained_size = len(keys)
+
+    def _all_items(self):
+        keys = []
+        vectors = []
+        for block in self.lists:
+            keys.extend(block.keys)
+            vectors.append(block.vectors())
+        if not vectors:
+            return keys, np.empty((0, self.dim), dtype=np.float32)
+        return keys, np.concatenate(vectors)
+
+    def _maybe_train(self):
+        size = len(self.assignments)
+        if size < self.min_train_size or size < 2 * self.trained_size:
+            return
+
+        keys, vectors = self._all_items()
+        self._train(keys, vectors)
+
+    def add(self, key, vector):
+        """Insert or replace ``key``. Returns True if the key was new."""
+        with self.lock:
+            vector = np.asarray(vector, dtype=np.float32).reshape(self.dim)
+            is_new = key not in self.assignments
+            if not is_new:
+                self.lists[self.assignments[key]].remove(key)
+
+            list_id = self._assign_list(vector)
+            self.lists[list_id].add(key, vector)
+            self.assignments[key] = list_id
+
+            self._maybe_train()
+            return is_new
+
+    def remove(self, key):
+        with self.lock:
+            list_id = self.assignments.pop(key, None)
+            if list_id is None:
+                return False
+            return self.lists[list_id].remove(key)
+
+    def reset(self, keys, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+
+        with self.lock:
+            self.centroids = np.empty((0, self.dim), dtype=np.float32)
+            self.lists = [VectorBlock(self.dim, capacity=max(16, len(keys)))]
+            self.assignments = {}
+            self.trained_size = 0
+
+            if len(keys) >= self.min_train_size:
+                self._train(list(keys), vectors)
+                return
+
+            for key, vector in zip(keys, vectors):
+                self.lists[0].add(key, vector)
+                self.assignments[key] = 0
+
+    def search(self, queries):
+        """Return the nearest key and its euclidean distance for every query."""
+        queries, query_sq_norms = _as_queries(queries, self.dim)
+        best_keys = [None] * len(queries)
+        best_distances = np.full(len(queries), np.inf)
+
+        with self.lock:
+            if len(queries) == 0 or len(self.assignments) == 0:
+                return best_keys, best_distances
+
+            if len(self.centroids) == 0:
+                probes = np.zeros((1, len(queries)), dtype=np.intp)
+            else:
+                probes = self._nearest_centroids(
+                    queries, min(self.n_probe, len(self.centroids))
+                )
+
+            for query_id, query in enumerate(queries):
+                for list_id in probes[:, query_id]:
+                    block = self.lists[list_id]
+                    if len(block) == 0:
+                        continue
+
+                    sq_distances = block.sq_norms[: len(block)] - 2.0 * (
+                        block.vectors() @ query
+                    )
+                    row = int(np.argmin(sq_distances))
+                    sq_distance = sq_distances[row] + query_sq_norms[query_id]
+                    distance = np.sqrt(max(float(sq_distance), 0.0))
+
+                    if distance < best_distances[query_id]:
+                        best_distances[query_id] = distance
+                        best_keys[query_id] = block.keys[row]
+
+        return best_keys, best_distances
+
+
+FACE_INDEX_TYPES = {
+    "brute": BruteForceIndex,
+    "ivf": IVFIndex,
+}
+
+
+def create_face_index(index_type="brute", **kwargs):
+    try:
+        index_class = FACE_INDEX_TYPES[index_type]
+    except KeyError:
+        raise ValueError(
+            f"Unknown face index type {index_type!r}, expected one of {sorted(FACE_INDEX_TYPES)}"
+        )
+    return index_class(**kwargs)
@@ -4,11 +4,11 @@ import face_recognition
 import os
 import time
 import threading
-import queue
 from datetime import datetime
 import base64
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, send_file
 import shutil
+import sys
 import firebase_admin
 from firebase_admin import credentials
 from firebase_admin import db
@@ -17,13 +17,39 @@ import ntplib
 import pytz
 import requests
 import json
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+    TimeoutError as FutureTimeoutError,
+)
 from io import BytesIO
+from embedding_cache import EmbeddingCache
+from face_detectors import configure_face_detector
+from face_index import FACE_ENCODING_DIM, create_face_index
+from inference_pool import InferencePool, run_inference
+from intruder_uploader import IntruderUploader
+from known_faces_sync import KnownFacesSync
 
 app = Flask(__name__)
 
 UPLOAD_FOLDER = "uploads"
 LATEST_IMAGE = "latest.jpg"
 MAX_IMAGES = 30
+UPLOAD_RING_SIZE = int(os.environ.get("UPLOAD_RING_SIZE", 10))
+UPLOAD_SPILL_TO_DISK = os.environ.get("UPLOAD_SPILL_TO_DISK", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+UPLOAD_SPILL_INTERVAL = float(os.environ.get("UPLOAD_SPILL_INTERVAL", 5))
+UPLOAD_SPILL_BATCH_SIZE = int(os.environ.get("UPLOAD_SPILL_BATCH_SIZE", 16))
+PREVIEW_MIN_WIDTH = 64
+PREVIEW_MAX_WIDTH = 1280
+PREVIEW_JPEG_QUALITY = int(os.environ.get("PREVIEW_JPEG_QUALITY", 70))
+MJPEG_KEEPALIVE_INTERVAL = float(os.environ.get("MJPEG_KEEPALIVE_INTERVAL", 15))
+MJPEG_BOUNDARY = "frame"
 
 FIREBASE_CRED_PATH = os.environ.get("FIREBASE_CRED_PATH", "./serviceAccountKey.json")
 FIREBASE_DATABASE_URL = os.environ.get(
@@ -42,6 +68,14 @@ MQTT_CLIENT_ID = os.environ.get("MQTT_CLIENT_ID", "face_recognition_client")
 
 MQTT_TOPIC = f"/SECURIN/{VEHICLE_ID}/master_switch"
 
+FACE_DETECTOR = os.environ.get("FACE_DETECTOR", "hog")
+FACE_DETECTOR_MODEL = os.environ.get("FACE_DETECTOR_MODEL")
+FACE_DETECTOR_CONFIG = os.environ.get("FACE_DETECTOR_CONFIG")
+FACE_DETECTOR_CONFIDENCE = float(os.environ.get("FACE_DETECTOR_CONFIDENCE", 0.5))
+
+FACE_INDEX_TYPE = os.environ.get("FACE_INDEX_TYPE", "brute")
+FACE_INDEX_NPROBE = int(os.environ.get("FACE_INDEX_NPROBE", 8))
+
 INTRUDER_API = os.environ.get("INTRUDER_API", "http://localhost:4998")
 KNOWN_FACES_API = os.environ.get("KNOWN_FACES_API", "http://localhost:4998")
 
@@ -60,8 +94,59 @@ KNOWN_FACES_API_ENDPOINT = os.environ.get(
     "KNOWN_FACES_API_ENDPOINT", f"{base_known}/{VEHICLE_ID}/knownface_json/"
 )
 
+KNOWN_FACES_MANIFEST_ENDPOINT = os.environ.get(
+    "KNOWN_FACES_MANIFEST_ENDPOINT", f"{base_known}/{VEHICLE_ID}/knownface_manifest/"
+)
+KNOWN_FACES_API_TIMEOUT = float(os.environ.get("KNOWN_FACES_API_TIMEOUT", 30))
+KNOWN_FACES_PAGE_SIZE = int(os.environ.get("KNOWN_FACES_PAGE_SIZE", 50))
+KNOWN_FACES_EMBEDDING_DTYPE = os.environ.get("KNOWN_FACES_EMBEDDING_DTYPE", "float32")
+
 # KNOWN_FACES_API_ENDPOINT="http://localhost:4998/SUPRAX125/knownface_json/"
 
+FACE_SYSTEM_MEMORY_BUDGET_MB = float(
+    os.environ.get("FACE_SYSTEM_MEMORY_BUDGET_MB", 512)
+)
+FACE_SYSTEM_MAX_VEHICLES = int(os.environ.get("FACE_SYSTEM_MAX_VEHICLES", 256))
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+INFERENCE_SLOT_MB = float(os.environ.get("INFERENCE_SLOT_MB", 4))
+INFERENCE_TIMEOUT = float(os.environ.get("INFERENCE_TIMEOUT", 30))
+
+FRAME_QUEUE_DEPTH = int(os.environ.get("FRAME_QUEUE_DEPTH", 32))
+FRAME_BATCH_SIZE = int(os.environ.get("FRAME_BATCH_SIZE", 4))
+# 0 sizes it from the inference pool, see frame_batches_in_flight
+FRAME_BATCHES_IN_FLIGHT = int(os.environ.get("FRAME_BATCHES_IN_FLIGHT", 0))
+FRAME_RESULT_TIMEOUT = float(os.environ.get("FRAME_RESULT_TIMEOUT", 10))
+
+SCENE_CHANGE_THRESHOLD = float(os.environ.get("SCENE_CHANGE_THRESHOLD", 6.0))
+SCENE_MAX_AGE = float(os.environ.get("SCENE_MAX_AGE", 3))
+SCENE_THUMBNAIL_SIZE = (64, 48)
+SCENE_TILE_GRID = (8, 6)
+
+FACE_TRACK_REUSE_FRAMES = int(os.environ.get("FACE_TRACK_REUSE_FRAMES", 10))
+FACE_TRACK_REUSE_SECONDS = float(os.environ.get("FACE_TRACK_REUSE_SECONDS", 5))
+FACE_TRACK_IOU = float(os.environ.get("FACE_TRACK_IOU", 0.3))
+FACE_TRACK_MAX_AGE = float(os.environ.get("FACE_TRACK_MAX_AGE", 3))
+
+DETECTION_SCALE = float(os.environ.get("DETECTION_SCALE", 0.5))
+DETECTION_MIN_SCALE = float(os.environ.get("DETECTION_MIN_SCALE", 0.2))
+# Never detect at a finer scale than the fixed one by default, so adapting the
+# scale to the faces seen only ever lowers the detection cost.
+DETECTION_MAX_SCALE = float(os.environ.get("DETECTION_MAX_SCALE", DETECTION_SCALE))
+DETECTION_MIN_WIDTH = int(os.environ.get("DETECTION_MIN_WIDTH", 160))
+DETECTION_TARGET_FACE_PX = float(os.environ.get("DETECTION_TARGET_FACE_PX", 80))
+DETECTION_SCALE_STEP = 0.0625
+
+STATUS_KEEPALIVE_INTERVAL = float(os.environ.get("STATUS_KEEPALIVE_INTERVAL", 30))
+
+INTRUDER_UPLOAD_WORKERS = int(os.environ.get("INTRUDER_UPLOAD_WORKERS", 2))
+INTRUDER_UPLOAD_QUEUE_SIZE = int(os.environ.get("INTRUDER_UPLOAD_QUEUE_SIZE", 8))
+INTRUDER_UPLOAD_TIMEOUT = float(os.environ.get("INTRUDER_UPLOAD_TIMEOUT", 10))
+INTRUDER_UPLOAD_RETRIES = int(os.environ.get("INTRUDER_UPLOAD_RETRIES", 3))
+INTRUDER_UPLOAD_BACKOFF = float(os.environ.get("INTRUDER_UPLOAD_BACKOFF", 1.0))
+INTRUDER_UPLOAD_MAX_BACKOFF = float(os.environ.get("INTRUDER_UPLOAD_MAX_BACKOFF", 30))
+
+VEHICLE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
 NTP_SERVER = "pool.ntp.org"
 WIB_TIMEZONE = pytz.timezone("Asia/Jakarta")
 
@@ -69,6 +154,41 @@ if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
 
 
+try:
+    if FACE_DETECTOR == "dnn":
+        configure_face_detector(
+            "dnn",
+            model_path=FACE_DETECTOR_MODEL,
+            config_path=FACE_DETECTOR_CONFIG,
+            confidence=FACE_DETECTOR_CONFIDENCE,
+        )
+    elif FACE_DETECTOR == "haar":
+        configure_face_detector("haar", model_path=FACE_DETECTOR_MODEL)
+    else:
+        configure_face_detector(FACE_DETECTOR)
+except ValueError as e:
+    # Fail at startup rather than answering every frame with an error
+    print(f"Invalid face detector configuration (FACE_DETECTOR={FACE_DETECTOR}): {e}")
+    sys.exit(1)
+
+try:
+    # Galleries are built lazily per vehicle, so check the index type up front
+    create_face_index(FACE_INDEX_TYPE)
+except ValueError as e:
+    print(f"Invalid face index configuration (FACE_INDEX_TYPE={FACE_INDEX_TYPE}): {e}")
+    sys.exit(1)
+
+# Started before the NTP and MQTT threads so the pool's spawner, which forks
+# every worker including restarted ones, comes from a single-threaded process.
+inference_pool = None
+if INFERENCE_WORKERS > 0:
+    inference_pool = InferencePool(
+        INFERENCE_WORKERS,
+        slot_bytes=int(INFERENCE_SLOT_MB * 1024 * 1024),
+        timeout=INFERENCE_TIMEOUT,
+    )
+
+
 class TimestampManager:
     def __init__(
         self,
@@ -170,6 +290,560 @@ def get_ntp_timestamp():
     return timestamp_manager.get_timestamp()
 
 
+def vehicle_settings(vehicle_id):
+    settings = {
+        "known_faces_dir": os.path.join("photo_storage", vehicle_id, "knownface_photo"),
+        "firebase_topic": f"vehicle/{vehicle_id}/detection/face_detection",
+        "firebase_master_switch": f"vehicle/{vehicle_id}/master_switch",
+        "mqtt_topic": f"/SECURIN/{vehicle_id}/master_switch",
+        "intruder_api_endpoint": f"{base_intruder}/{vehicle_id}/upload_intruder/",
+        "known_faces_api_endpoint": f"{base_known}/{vehicle_id}/knownface_json/",
+        "known_faces_manifest_endpoint": f"{base_known}/{vehicle_id}/knownface_manifest/",
+    }
+
+    # Explicit endpoint overrides from the environment only apply to the
+    # vehicle this container was originally configured for.
+    if vehicle_id == VEHICLE_ID:
+        settings["intruder_api_endpoint"] = INTRUDER_API_ENDPOINT
+        settings["known_faces_api_endpoint"] = KNOWN_FACES_API_ENDPOINT
+        settings["known_faces_manifest_endpoint"] = KNOWN_FACES_MANIFEST_ENDPOINT
+
+    return settings
+
+
+def connect_mqtt_client(broker, port, username, password, client_id):
+    client = mqtt.Client(client_id=client_id)
+    try:
+        client.username_pw_set(username, password)
+        client.connect(broker, port, 60)
+        client.loop_start()
+
+        print(f"MQTT client connected to {broker}:{port}")
+    except Exception as e:
+        print(f"MQTT connection error: {e}")
+    return client
+
+
+class SceneChangeGate:
+    """Cheap per-camera check whether a JPEG shows the same scene as before.
+
+    The JPEG is decoded at 1/8 scale in grayscale (libjpeg skips most of the
+    IDCT work for that) and shrunk to a small thumbnail. The thumbnail is
+    compared tile by tile with the one of the last processed frame, so a face
+    entering a corner of the picture is not averaged away by the unchanged
+    background. A frame counts as unchanged when no tile's mean absolute
+    difference reaches ``threshold`` grey levels and the last processed frame
+    is younger than ``max_age`` seconds, in which case its result can be
+    reused. A threshold of 0 disables the gate.
+    """
+
+    def __init__(self, threshold=SCENE_CHANGE_THRESHOLD, max_age=SCENE_MAX_AGE):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.cameras = {}
+        self.lock = threading.Lock()
+
+    def signature(self, image_data):
+        thumbnail = cv2.imdecode(
+            np.frombuffer(image_data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8
+        )
+        if thumbnail is None:
+            return None
+        thumbnail = cv2.resize(
+            thumbnail, SCENE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA
+        )
+        return thumbnail.astype(np.float32)
+
+    def check(self, camera_id, image_data):
+        """Return ``(unchanged, previous_result, signature)`` for a new frame."""
+        if self.threshold <= 0:
+            return False, None, None
+
+        signature = self.signature(image_data)
+        if signature is None:
+            return False, None, None
+
+        with self.lock:
+            previous = self.cameras.get(camera_id)
+
+        if previous is None:
+            return False, None, signature
+
+        previous_signature, processed_at, previous_result = previous
+        if time.time() - processed_at > self.max_age:
+            return False, None, signature
+
+        # INTER_AREA down to the tile grid averages each tile exactly
+        tile_differences = cv2.resize(
+            np.abs(signature - previous_signature),
+            SCENE_TILE_GRID,
+            interpolation=cv2.INTER_AREA,
+        )
+        if float(tile_differences.max()) < self.threshold:
+            return True, previous_result, signature
+        return False, None, signature
+
+    def commit(self, camera_id, signature, result):
+        if signature is None:
+            return
+        with self.lock:
+            self.cameras[camera_id] = (signature, time.time(), result)
+
+
+def box_iou(a, b):
+    top, right, bottom, left = a
+    other_top, other_right, other_bottom, other_left = b
+
+    inter_w = min(right, other_right) - max(left, other_left)
+    inter_h = min(bottom, other_bottom) - max(top, other_top)
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+
+    intersection = inter_w * inter_h
+    union = (
+        (right - left) * (bottom - top)
+        + (other_right - other_left) * (other_bottom - other_top)
+        - intersection
+    )
+    return intersection / union if union > 0 else 0.0
+
+
+def box_centroid_shift(a, b):
+    """Centroid distance between two boxes relative to the size of ``a``."""
+    top, right, bottom, left = a
+    other_top, other_right, other_bottom, other_left = b
+
+    dx = (left + right - other_left - other_right) / 2.0
+    dy = (top + bottom - other_top - other_bottom) / 2.0
+    size = max(right - left, bottom - top, 1)
+    return float(np.hypot(dx, dy)) / size
+
+
+def detection_frame(frame, scale):
+    """Return the RGB frame the detector runs on, resized by ``scale``."""
+    if scale != 1.0:
+        height, width = frame.shape[:2]
+        size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+        frame = cv2.resize(frame, size)
+    return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+
+def scale_face_locations(face_locations, small_shape, frame_shape):
+    """Map boxes found on a resized frame back to full-frame pixels.
+
+    The factors come from the actual frame sizes rather than the requested
+    scale, since resizing rounds the target size to whole pixels.
+    """
+    height, width = frame_shape[:2]
+    y_factor = height / small_shape[0]
+    x_factor = width / small_shape[1]
+    return [
+        (
+            max(0, int(round(top * y_factor))),
+            min(width, int(round(right * x_factor))),
+            min(height, int(round(bottom * y_factor))),
+            max(0, int(round(left * x_factor))),
+        )
+        for top, right, bottom, left in face_locations
+    ]
+
+
+class FaceTrack:
+    __slots__ = (
+        "location",
+        "encoding",
+        "verified_at",
+        "frames_since_verify",
+        "last_seen",
+    )
+
+    def __init__(self, location, now):
+        self.location = location
+        self.encoding = None
+        self.verified_at = 0.0
+        self.frames_since_verify = 0
+        self.last_seen = now
+
+    def reuse(self):
+        self.frames_since_verify += 1
+
+    def verify(self, encoding, now):
+        self.encoding = encoding
+        self.verified_at = now
+        self.frames_since_verify = 0
+
+
+class FaceTracker:
+    """Associates detections with the previous frame's faces per camera.
+
+    Detections are matched greedily to live tracks by IoU, falling back to a
+    centroid shift of at most half a box for small fast-moving faces. A
+    matched track keeps its encoding for up to ``reuse_frames`` frames or
+    ``reuse_seconds`` seconds before it is re-encoded, so a rider sitting in
+    roughly the same place skips the ResNet encoder. Tracks not seen for
+    ``max_age`` seconds are dropped.
+    """
+
+    def __init__(
+        self,
+        reuse_frames=FACE_TRACK_REUSE_FRAMES,
+        reuse_seconds=FACE_TRACK_REUSE_SECONDS,
+        iou_threshold=FACE_TRACK_IOU,
+        max_age=FACE_TRACK_MAX_AGE,
+        max_centroid_shift=0.5,
+    ):
+        self.reuse_frames = reuse_frames
+        self.reuse_seconds = reuse_seconds
+        self.iou_threshold = iou_threshold
+        self.max_age = max_age
+        self.max_centroid_shift = max_centroid_shift
+
+        self.tracks = {}
+        self.lock = threading.Lock()
+
+    def is_reusable(self, track, now):
+        return (
+            track.encoding is not None
+            and track.frames_since_verify < self.reuse_frames
+            and now - track.verified_at < self.reuse_seconds
+        )
+
+    def associate(self, camera_id, face_locations, now):
+        with self.lock:
+            tracks = [
+                track
+                for track in self.tracks.get(camera_id, [])
+                if now - track.last_seen <= self.max_age
+            ]
+
+        candidates = []
+        for detection_id, location in enumerate(face_locations):
+            for track_id, track in enumerate(tracks):
+                iou = box_iou(location, track.location)
+                shift = box_centroid_shift(track.location, location)
+                if iou >= self.iou_threshold or shift <= self.max_centroid_shift:
+                    candidates.append((iou, -shift, detection_id, track_id))
+        candidates.sort(reverse=True)
+
+        assigned = [None] * len(face_locations)
+        used_tracks = set()
+        for _, _, detection_id, track_id in candidates:
+            if assigned[detection_id] is None and track_id not in used_tracks:
+                assigned[detection_id] = tracks[track_id]
+                used_tracks.add(track_id)
+
+        for detection_id, location in enumerate(face_locations):
+            track = assigned[detection_id]
+            if track is None:
+                track = FaceTrack(location, now)
+                assigned[detection_id] = track
+                tracks.append(track)
+            track.location = location
+            track.last_seen = now
+
+        with self.lock:
+            if tracks:
+                self.tracks[camera_id] = tracks
+            else:
+                self.tracks.pop(camera_id, None)
+
+        return assigned
+
+
+class DetectionScaler:
+    """Picks the detection scale per camera from the faces it recently saw.
+
+    Detection cost grows with the pixel count, so a camera whose faces are
+    large (a close-range rider shot) is detected at a coarser scale. The
+    scale is chosen so that the smallest recent face, tracked as a moving
+    average of its full-frame size, is still about ``target_face_size``
+    pixels after resizing. It is rounded up to ``step`` and kept between
+    ``min_scale`` (and ``min_width`` pixels of frame width) and
+    ``max_scale``, which defaults to ``default_scale`` so small faces are
+    detected at the fixed scale rather than at a more expensive one.
+    Cameras without recent faces use ``default_scale``; a frame that comes
+    back empty at a coarser scale should be retried at ``finer_scale``, and
+    a miss resets the camera to the default.
+    """
+
+    def __init__(
+        self,
+        default_scale=DETECTION_SCALE,
+        min_scale=DETECTION_MIN_SCALE,
+        max_scale=DETECTION_MAX_SCALE,
+        min_width=DETECTION_MIN_WIDTH,
+        target_face_size=DETECTION_TARGET_FACE_PX,
+        step=DETECTION_SCALE_STEP,
+        smoothing=0.3,
+    ):
+        self.default_scale = default_scale
+        self.min_scale = min_scale
+        self.max_scale = max_scale
+        self.min_width = min_width
+        self.target_face_size = target_face_size
+        self.step = step
+        self.smoothing = smoothing
+
+        self.face_sizes = {}
+        self.lock = threading.Lock()
+
+    def scale_for(self, camera_id, frame_shape):
+        with self.lock:
+            face_size = self.face_sizes.get(camera_id)
+
+        if face_size is None:
+            scale = self.default_scale
+        else:
+            scale = self.target_face_size / face_size
+            scale = np.ceil(scale / self.step) * self.step
+
+        lower = max(self.min_scale, self.min_width / frame_shape[1])
+        return float(min(self.max_scale, max(lower, scale)))
+
+    def finer_scale(self, scale):
+        """Scale to retry an empty frame at, or None if ``scale`` is fine enough."""
+        if scale < self.default_scale:
+            return self.default_scale
+        return None
+
+    def observe(self, camera_id, face_locations):
+        """Record the full-frame boxes found for ``camera_id``."""
+        with self.lock:
+            if not face_locations:
+                self.face_sizes.pop(camera_id, None)
+                return
+
+            face_size = max(
+                1,
+                min(
+                    min(right - left, bottom - top)
+                    for top, right, bottom, left in face_locations
+                ),
+            )
+            previous = self.face_sizes.get(camera_id)
+            if previous is not None:
+                face_size = previous + self.smoothing * (face_size - previous)
+            self.face_sizes[camera_id] = face_size
+
+
+class FrameQueue:
+    """Bounded latest-wins ingest queue feeding a micro-batching consumer.
+
+    Each key (a camera) has at most one pending frame: a newer frame replaces
+    the queued one, whose future resolves as ``(False, "dropped")``. When
+    ``max_depth`` keys are already waiting, the oldest pending frame is
+    dropped instead. The consumer hands up to ``batch_size`` pending frames
+    and their keys to ``process_batch`` at once and resolves every future
+    with ``(True, result)``.
+
+    Up to ``max_in_flight`` batches are processed at the same time, so one
+    slow frame does not hold back everything queued behind it. A key whose
+    frame is still being processed stays queued until that batch is done,
+    which keeps the frames of one camera in order.
+    """
+
+    def __init__(self, process_batch, max_depth=4, batch_size=4, max_in_flight=1):
+        self.process_batch = process_batch
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.max_in_flight = max(1, max_in_flight)
+
+        self.pending = OrderedDict()
+        self.in_flight = 0
+        self.in_flight_keys = set()
+        self.condition = threading.Condition()
+        self.is_running = True
+        self.dropped_frames = 0
+
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="frame-queue"
+        )
+        self.consumer_thread = threading.Thread(target=self._consume, daemon=True)
+        self.consumer_thread.start()
+
+    def __len__(self):
+        with self.condition:
+            return len(self.pending)
+
+    def submit(self, camera_id, frame):
+        future = Future()
+
+        with self.condition:
+            if not self.is_running:
+                future.set_result((False, "dropped"))
+                return future
+
+            dropped = self.pending.pop(camera_id, None)
+            if dropped is None and len(self.pending) >= self.max_depth:
+                _, dropped = self.pending.popitem(last=False)
+            if dropped is not None:
+                self.dropped_frames += 1
+
+            self.pending[camera_id] = (camera_id, frame, future)
+            self.condition.notify()
+
+        if dropped is not None:
+            dropped[2].set_result((False, "dropped"))
+        return future
+
+    def _take_batch(self):
+        """Pop the oldest frames not already in flight; the caller holds the lock."""
+        if self.in_flight >= self.max_in_flight:
+            return []
+        keys = [key for key in self.pending if key not in self.in_flight_keys]
+        return [self.pending.pop(key) for key in keys[: self.batch_size]]
+
+    def _consume(self):
+        while True:
+            with self.condition:
+                batch = self._take_batch()
+                while self.is_running and not batch:
+                    self.condition.wait()
+                    batch = self._take_batch()
+                if not self.is_running:
+                    break
+
+                self.in_flight += 1
+                self.in_flight_keys.update(camera_id for camera_id, _, _ in batch)
+                # Submitted under the lock so stop() cannot shut the executor
+                # down in between
+                self.executor.submit(self._process, batch)
+
+    def _process(self, batch):
+        camera_ids = [camera_id for camera_id, _, _ in batch]
+        frames = [frame for _, frame, _ in batch]
+        try:
+            results = self.process_batch(frames, camera_ids)
+        except Exception as e:
+            print(f"Error processing frame batch: {e}")
+            results = [(frame, "error") for frame in frames]
+
+        for (_, _, future), (_, result) in zip(batch, results):
+            future.set_result((True, result))
+
+        with self.condition:
+            self.in_flight -= 1
+            self.in_flight_keys.difference_update(camera_ids)
+            self.condition.notify()
+
+    def stop(self):
+        # Batches already in flight still finish and resolve their futures
+        with self.condition:
+            self.is_running = False
+            dropped = list(self.pending.values())
+            self.pending.clear()
+            self.condition.notify_all()
+        self.executor.shutdown(wait=False)
+
+        for _, _, future in dropped:
+            future.set_result((False, "dropped"))
+
+
+def frame_batches_in_flight(pool, batch_size):
+    """Frame batches to process at once when FRAME_BATCHES_IN_FLIGHT is unset.
+
+    Enough batches to keep every shared-memory slot of ``pool`` busy plus one,
+    so the pool never waits for the queue. Without a pool, a second batch
+    still keeps one slow frame from stalling the rest.
+    """
+    if FRAME_BATCHES_IN_FLIGHT > 0:
+        return FRAME_BATCHES_IN_FLIGHT
+    if pool is None:
+        return 2
+    return -(-len(pool.slots) // max(1, batch_size)) + 1
+
+
+class StatusPublisher:
+    """Background sender for Firebase and MQTT status updates.
+
+    ``publish`` only records the latest value per key (a Firebase path or
+    MQTT topic) and returns; a worker thread performs the network calls, so
+    a newer status replaces one that has not been sent yet. A value equal to
+    the last one sent for the same key is suppressed until
+    ``keepalive_interval`` seconds have passed, after which it is sent again
+    to refresh its timestamp. Failed sends are not recorded, so the next
+    publish of the same value goes out.
+
+    Commands (``dedupe=False``), such as re-enabling the master switch, are
+    only coalesced while pending and never suppressed: other clients may
+    have changed the value since it was last sent.
+    """
+
+    def __init__(self, keepalive_interval=STATUS_KEEPALIVE_INTERVAL):
+        self.keepalive_interval = keepalive_interval
+
+        self.pending = OrderedDict()
+        self.sent = {}
+        self.condition = threading.Condition()
+        self.is_running = True
+        self.sent_count = 0
+        self.suppressed_count = 0
+
+        self.worker_thread = threading.Thread(target=self._run, daemon=True)
+        self.worker_thread.start()
+
+    def publish(self, key, value, send, *args, dedupe=True):
+        now = time.time()
+
+        with self.condition:
+            if not self.is_running:
+                return False
+
+            last = self.sent.get(key)
+            if (
+                dedupe
+                and last is not None
+                and last[0] == value
+                and now - last[1] < self.keepalive_interval
+            ):
+                self.pending.pop(key, None)
+                self.suppressed_count += 1
+                return False
+
+            self.pending.pop(key, None)
+            self.pending[key] = (value, send, args)
+            self.condition.notify()
+            return True
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while self.is_running and not self.pending:
+                    self.condition.wait()
+                if not self.pending:
+                    break
+                key, (value, send, args) = self.pending.popitem(last=False)
+
+            try:
+                send(*args)
+            except Exception as e:
+                print(f"Error publishing status to {key}: {e}")
+                continue
+
+            with self.condition:
+                self.sent[key] = (value, time.time())
+                self.sent_count += 1
+
+    def stop(self, timeout=5):
+        # Pending updates are flushed before the worker exits
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+        self.worker_thread.join(timeout=timeout)
+
+
+def create_intruder_uploader():
+    return IntruderUploader(
+        workers=INTRUDER_UPLOAD_WORKERS,
+        max_queue=INTRUDER_UPLOAD_QUEUE_SIZE,
+        timeout=INTRUDER_UPLOAD_TIMEOUT,
+        max_retries=INTRUDER_UPLOAD_RETRIES,
+        backoff=INTRUDER_UPLOAD_BACKOFF,
+        max_backoff=INTRUDER_UPLOAD_MAX_BACKOFF,
+        clock=get_ntp_time,
+    )
+
+
 class FaceRecognitionSystem:
     def __init__(
         self,
@@ -187,16 +861,34 @@ class FaceRecognitionSystem:
         mqtt_client_id=MQTT_CLIENT_ID,
         intruder_api_endpoint=INTRUDER_API_ENDPOINT,
         known_faces_api_endpoint=KNOWN_FACES_API_ENDPOINT,
+        known_faces_manifest_endpoint=KNOWN_FACES_MANIFEST_ENDPOINT,
         tolerance=0.6,
+        face_index_type=FACE_INDEX_TYPE,
+        face_index_nprobe=FACE_INDEX_NPROBE,
+        vehicle_id=VEHICLE_ID,
+        mqtt_client=None,
+        inference_pool=None,
+        frame_queue=None,
+        frame_queue_depth=FRAME_QUEUE_DEPTH,
+        frame_batch_size=FRAME_BATCH_SIZE,
+        frame_result_timeout=FRAME_RESULT_TIMEOUT,
+        face_track_reuse_frames=FACE_TRACK_REUSE_FRAMES,
+        status_publisher=None,
+        intruder_uploader=None,
     ):
+        self.vehicle_id = vehicle_id
+        self.inference_pool = inference_pool
         self.known_faces_dir = known_faces_dir
-        self.known_face_encodings = []
-        self.known_face_names = []
+        if face_index_type == "ivf":
+            self.face_index = create_face_index("ivf", n_probe=face_index_nprobe)
+        else:
+            self.face_index = create_face_index(face_index_type)
         self.detection_interval = detection_interval
         self.tolerance = tolerance
 
         self.intruder_api_endpoint = intruder_api_endpoint
         self.known_faces_api_endpoint = known_faces_api_endpoint
+        self.known_faces_manifest_endpoint = known_faces_manifest_endpoint
 
         self.firebase_cred_path = firebase_cred_path
         self.firebase_database_url = firebase_database_url
@@ -209,11 +901,37 @@ class FaceRecognitionSystem:
         self.mqtt_password = mqtt_password
         self.mqtt_topic = mqtt_topic
         self.mqtt_client_id = mqtt_client_id
-        self.mqtt_client = None
-
-        self.frame_queue = queue.Queue(maxsize=2)
-        self.is_running = False
-        self.last_detection_time = 0
+        self.mqtt_client = mqtt_client
+        self.owns_mqtt_client = mqtt_client is None
+
+        self.status_publisher = status_publisher
+        self.owns_status_publisher = status_publisher is None
+        if self.owns_status_publisher:
+            self.status_publisher = StatusPublisher()
+
+        self.intruder_uploader = intruder_uploader
+        self.owns_intruder_uploader = intruder_uploader is None
+        if self.owns_intruder_uploader:
+            self.intruder_uploader = create_intruder_uploader()
+
+        # Frames are queued under (vehicle_id, camera_id) so one queue can be
+        # shared by every vehicle's system and batch their frames together.
+        self.frame_queue = frame_queue
+        self.owns_frame_queue = frame_queue is None
+        if self.owns_frame_queue:
+            self.frame_queue = FrameQueue(
+                self.process_queued_frames,
+                max_depth=frame_queue_depth,
+                batch_size=frame_batch_size,
+                max_in_flight=frame_batches_in_flight(inference_pool, frame_batch_size),
+            )
+        self.frame_result_timeout = frame_result_timeout
+        self.scene_gate = SceneChangeGate()
+        self.detection_scaler = DetectionScaler()
+        self.face_tracker = None
+        if face_track_reuse_frames > 0:
+            self.face_tracker = FaceTracker(reuse_frames=face_track_reuse_frames)
+        self.last_detection_times = {}
         self.lock = threading.Lock()
 
         self.current_frame = None
@@ -225,53 +943,82 @@ class FaceRecognitionSystem:
         if not os.path.exists(self.known_faces_dir):
             os.makedirs(self.known_faces_dir)
 
+        self.embedding_cache = EmbeddingCache(self.known_faces_dir)
+        self.known_faces_sync = KnownFacesSync(
+            known_faces_manifest_endpoint,
+            self.known_faces_dir,
+            self.face_index,
+            self.embedding_cache,
+            self._process_face_image,
+            self.fetch_known_faces_from_api,
+            timeout=KNOWN_FACES_API_TIMEOUT,
+            embedding_dtype=KNOWN_FACES_EMBEDDING_DTYPE,
+        )
         self.load_known_faces()
 
-        threading.Thread(target=self.fetch_known_faces_from_api, daemon=True).start()
+        threading.Thread(target=self.sync_known_faces_from_api, daemon=True).start()
+
+    def sync_known_faces_from_api(self):
+        self.known_faces_sync.sync()
 
     def fetch_known_faces_from_api(self):
         try:
             print(f"Fetching known faces from API: {self.known_faces_api_endpoint}")
-            response = requests.get(self.known_faces_api_endpoint)
-
-            if response.status_code == 200:
-                try:
-                    faces_data = response.json()
-
-                    for face in faces_data:
-                        if (
-                            isinstance(face, dict)
-                            and "name" in face
-                            and "image" in face
-                        ):
-                            name = face["name"]
-                            image_data = base64.b64decode(face["image"])
-                        elif (
-                            isinstance(face, dict)
-                            and "filename" in face
-                            and "data" in face
-                        ):
-                            name = os.path.splitext(face["filename"])[0]
-                            image_data = base64.b64decode(face["data"])
-                        else:
-                            print(f"Unknown face data format: {face}")
-                            continue
-
-                        filepath = os.path.join(self.known_faces_dir, f"{name}.jpg")
-                        with open(filepath, "wb") as f:
-                            f.write(image_data)
-
-                        self._process_face_image(filepath, name)
+            # Servers that do not paginate ignore these and return everything
+            params = {"limit": KNOWN_FACES_PAGE_SIZE}
+            fetched_count = 0
+
+            while True:
+                response = requests.get(
+                    self.known_faces_api_endpoint,
+                    params=params,
+                    timeout=KNOWN_FACES_API_TIMEOUT,
+                )
 
+                if response.status_code != 200:
                     print(
-                        f"Successfully fetched and processed {len(faces_data)} faces from API"
+                        f"Failed to fetch known faces from API. Status code: {response.status_code}"
                     )
+                    break
+
+                try:
+                    faces_data = response.json()
                 except ValueError as e:
                     print(f"API returned non-JSON data: {e}")
                     self._process_api_directory_listing(response.text)
-            else:
+                    return
+
+                for face in faces_data:
+                    if isinstance(face, dict) and "name" in face and "image" in face:
+                        name = face["name"]
+                        image_data = base64.b64decode(face["image"])
+                    elif (
+                        isinstance(face, dict)
+                        and "filename" in face
+                        and "data" in face
+                    ):
+                        name = os.path.splitext(face["filename"])[0]
+                        image_data = base64.b64decode(face["data"])
+                    else:
+                        print(f"Unknown face data format: {face}")
+                        continue
+
+                    filepath = os.path.join(self.known_faces_dir, f"{name}.jpg")
+                    with open(filepath, "wb") as f:
+                        f.write(image_data)
+
+                    self._process_face_image(filepath, name)
+                fetched_count += len(faces_data)
+
+                next_cursor = response.headers.get("X-Next-Cursor")
+                if not next_cursor:
+                    break
+                params["cursor"] = next_cursor
+
+            if fetched_count:
+                self.embedding_cache.save()
                 print(
-                    f"Failed to fetch known faces from API. Status code: {response.status_code}"
+                    f"Successfully fetched and processed {fetched_count} faces from API"
                 )
 
         except Exception as e:
@@ -295,28 +1042,38 @@ class FaceRecognitionSystem:
                         name = os.path.splitext(filename)[0]
                         self._process_face_image(filepath, name)
 
+            self.embedding_cache.save()
             print(f"Processed directory listing from API")
         except Exception as e:
             print(f"Error processing directory listing: {e}")
 
+    def _encode_face_image(self, filepath):
+        with open(filepath, "rb") as f:
+            image_data = f.read()
+
+        content_hash = EmbeddingCache.content_hash(image_data)
+        if content_hash in self.embedding_cache:
+            return self.embedding_cache.get(content_hash), content_hash, True
+
+        image = face_recognition.load_image_file(BytesIO(image_data))
+        face_locations = face_recognition.face_locations(image, model="hog")
+
+        face_encoding = None
+        if face_locations:
+            face_encoding = face_recognition.face_encodings(image, face_locations)[0]
+
+        self.embedding_cache.put(content_hash, face_encoding)
+        return face_encoding, content_hash, False
+
     def _process_face_image(self, filepath, name):
         try:
-            image = face_recognition.load_image_file(filepath)
-            face_locations = face_recognition.face_locations(image, model="hog")
+            face_encoding, _, _ = self._encode_face_image(filepath)
 
-            if face_locations:
-                face_encoding = face_recognition.face_encodings(image, face_locations)[
-                    0
-                ]
-
-                if name in self.known_face_names:
-                    idx = self.known_face_names.index(name)
-                    self.known_face_encodings[idx] = face_encoding
-                    print(f"Updated existing face: {name}")
-                else:
-                    self.known_face_encodings.append(face_encoding)
-                    self.known_face_names.append(name)
+            if face_encoding is not None:
+                if self._set_known_face(name, face_encoding):
                     print(f"Added new face: {name}")
+                else:
+                    print(f"Updated existing face: {name}")
 
                 return True
             else:
@@ -326,38 +1083,28 @@ class FaceRecognitionSystem:
             print(f"Error processing face image {filepath}: {e}")
             return False
 
-    def upload_intruder_image(self, frame):
-        try:
-            _, img_encoded = cv2.imencode(".jpg", frame)
+    def _set_known_face(self, name, face_encoding):
+        return self.face_index.add(name, face_encoding)
 
-            img_base64 = base64.b64encode(img_encoded.tobytes()).decode("utf-8")
+    def _set_known_faces(self, names, face_encodings):
+        self.face_index.reset(names, face_encodings)
 
-            timestamp = get_ntp_time().strftime("%Y%m%d_%H%M%S")
-            formatted_time = get_ntp_time().strftime("%Y-%m-%d %H:%M:%S")
+    def remove_known_face(self, name):
+        if self.face_index.remove(name):
+            print(f"Removed face: {name}")
+            return True
+        return False
 
-            json_data = {
-                "image": img_base64,
-                "timestamp": timestamp,
-                "detected_at": formatted_time,
-            }
+    def match_faces(self, face_encodings):
+        names, distances = self.face_index.search(face_encodings)
+        names = [
+            name if distance <= self.tolerance else None
+            for name, distance in zip(names, distances)
+        ]
+        return names, distances
 
-            headers = {"Content-Type": "application/json"}
-            response = requests.post(
-                self.intruder_api_endpoint, json=json_data, headers=headers
-            )
-
-            if response.status_code == 200:
-                print(f"Intruder image successfully uploaded to API")
-                return True
-            else:
-                print(
-                    f"Failed to upload intruder image. Status code: {response.status_code}"
-                )
-                return False
-
-        except Exception as e:
-            print(f"Error uploading intruder image: {e}")
-            return False
+    def upload_intruder_image(self, frame):
+        return self.intruder_uploader.submit(self.intruder_api_endpoint, frame)
 
     def init_firebase(self):
         try:
@@ -371,59 +1118,68 @@ class FaceRecognitionSystem:
             print(f"Firebase connection error: {e}")
 
     def publish_to_firebase(self, status_code):
-        try:
-            ref = db.reference(self.firebase_topic)
-            timestamp = get_ntp_timestamp()
+        self.status_publisher.publish(
+            self.firebase_topic,
+            status_code,
+            self._send_firebase_status,
+            status_code,
+            get_ntp_timestamp(),
+        )
 
-            data = {"status": status_code, "timestamp": timestamp}
-            print(f"{timestamp}")
-            ref.set(data)
-            print(
-                f"Firebase status updated: {status_code} with WIB timestamp: {timestamp}"
-            )
+        if status_code == 1:
+            self.update_firebase_master_switch(True)
 
-            if status_code == 1:
-                self.update_firebase_master_switch(True)
-        except Exception as e:
-            print(f"Error sending to Firebase: {e}")
+    def _send_firebase_status(self, status_code, timestamp):
+        ref = db.reference(self.firebase_topic)
+        data = {"status": status_code, "timestamp": timestamp}
+        ref.set(data)
+        print(f"Firebase status updated: {status_code} with WIB timestamp: {timestamp}")
 
     def update_firebase_master_switch(self, is_known_user):
-        try:
-            if is_known_user:
-                timestamp = get_ntp_timestamp()
+        if is_known_user:
+            self.status_publisher.publish(
+                self.firebase_master_switch,
+                True,
+                self._send_firebase_master_switch,
+                get_ntp_timestamp(),
+                dedupe=False,
+            )
 
-                master_switch_ref = db.reference(self.firebase_master_switch)
-                master_switch_data = {"value": True, "timestamp": timestamp}
-                master_switch_ref.set(master_switch_data)
-                print(
-                    f"Firebase master switch updated: true (known user) with timestamp: {timestamp}"
-                )
-        except Exception as e:
-            print(f"Error updating Firebase master switch: {e}")
+    def _send_firebase_master_switch(self, timestamp):
+        master_switch_ref = db.reference(self.firebase_master_switch)
+        master_switch_data = {"value": True, "timestamp": timestamp}
+        master_switch_ref.set(master_switch_data)
+        print(
+            f"Firebase master switch updated: true (known user) with timestamp: {timestamp}"
+        )
 
     def init_mqtt(self):
-        try:
-            self.mqtt_client = mqtt.Client(client_id=self.mqtt_client_id)
-            self.mqtt_client.username_pw_set(self.mqtt_username, self.mqtt_password)
-            self.mqtt_client.connect(self.mqtt_broker, self.mqtt_port, 60)
-            self.mqtt_client.loop_start()
+        if not self.owns_mqtt_client:
+            return
 
-            print(f"MQTT client connected to {self.mqtt_broker}:{self.mqtt_port}")
-        except Exception as e:
-            print(f"MQTT connection error: {e}")
+        self.mqtt_client = connect_mqtt_client(
+            self.mqtt_broker,
+            self.mqtt_port,
+            self.mqtt_username,
+            self.mqtt_password,
+            self.mqtt_client_id,
+        )
 
     def publish_to_mqtt(self, is_known_user):
-        try:
-            if self.mqtt_client and is_known_user:
-                timestamp = get_ntp_timestamp()
-
-                mqtt_payload = f'{{"value": 1, "timestamp": {timestamp}}}'
+        if self.mqtt_client and is_known_user:
+            self.status_publisher.publish(
+                ("mqtt", self.mqtt_topic),
+                1,
+                self._send_mqtt_status,
+                get_ntp_timestamp(),
+                dedupe=False,
+            )
+            self.update_firebase_master_switch(is_known_user)
 
-                self.mqtt_client.publish(self.mqtt_topic, mqtt_payload)
-                print(f"MQTT status published: {mqtt_payload} (known user)")
-                self.update_firebase_master_switch(is_known_user)
-        except Exception as e:
-            print(f"Error sending to MQTT: {e}")
+    def _send_mqtt_status(self, timestamp):
+        mqtt_payload = f'{{"value": 1, "timestamp": {timestamp}}}'
+        self.mqtt_client.publish(self.mqtt_topic, mqtt_payload)
+        print(f"MQTT status published: {mqtt_payload} (known user)")
 
     def load_known_faces(self):
         start_time = time.time()
@@ -436,19 +1192,69 @@ class FaceRecognitionSystem:
             )
             return
 
-        count = 0
-        for filename in os.listdir(self.known_faces_dir):
+        name_indices = {}
+        encodings = []
+        content_hashes = []
+        encoded_count = 0
+
+        # Faces synced from the photo server follow the last applied manifest.
+        # Their encodings may come from the server's embedding store without
+        # a local photo, and a replaced photo may still be on disk.
+        _, synced_faces = self.known_faces_sync.load_state()
+        synced_hashes = {
+            os.path.splitext(filename)[0]: content_hash
+            for filename, content_hash in synced_faces.items()
+            if content_hash in self.embedding_cache
+        }
+
+        for filename in sorted(os.listdir(self.known_faces_dir)):
             if filename.endswith((".png", ".jpg", ".jpeg")):
 
                 name = os.path.splitext(filename)[0]
                 filepath = os.path.join(self.known_faces_dir, filename)
+                if name in synced_hashes:
+                    continue
+
+                try:
+                    face_encoding, content_hash, cached = self._encode_face_image(
+                        filepath
+                    )
+                except Exception as e:
+                    print(f"Error processing face image {filepath}: {e}")
+                    continue
+
+                content_hashes.append(content_hash)
+                if not cached:
+                    encoded_count += 1
 
-                if self._process_face_image(filepath, name):
-                    count += 1
+                if face_encoding is None:
+                    print(f"No face detected in {filepath}")
+                    continue
+
+                if name in name_indices:
+                    encodings[name_indices[name]] = face_encoding
+                else:
+                    name_indices[name] = len(encodings)
+                    encodings.append(face_encoding)
+
+        local_count = len(content_hashes)
+        synced_count = 0
+        for name, content_hash in synced_hashes.items():
+            content_hashes.append(content_hash)
+            face_encoding = self.embedding_cache.get(content_hash)
+            if face_encoding is not None:
+                name_indices[name] = len(encodings)
+                encodings.append(face_encoding)
+                synced_count += 1
+
+        self._set_known_faces(list(name_indices), encodings)
+        self.embedding_cache.save(keep_hashes=content_hashes)
 
         elapsed_time = time.time() - start_time
         print(
-            f"Successfully loaded {count} faces from local directory in {elapsed_time:.2f} seconds"
+            f"Successfully loaded {len(name_indices)} faces from local directory in {elapsed_time:.2f} seconds "
+            f"({encoded_count} encoded, {local_count - encoded_count} from cache, "
+            f"{synced_count} from synced encodings)"
         )
 
     def add_new_face(self, image_path, name):
@@ -467,6 +1273,7 @@ class FaceRecognitionSystem:
                     )
 
                 shutil.copy2(image_path, new_path)
+                self.embedding_cache.save()
                 print(f"Face {name} successfully added")
                 return True
             else:
@@ -475,17 +1282,174 @@ class FaceRecognitionSystem:
             print(f"Error adding new face: {e}")
             return False
 
-    def process_frame(self, frame):
+    def run_inference_batch(self, operation, rgb_small_frames, locations_batch=None):
+        if locations_batch is None:
+            locations_batch = [None] * len(rgb_small_frames)
+
+        # Hand every frame that fits a slot to the pool first so the batch runs
+        # in parallel, then collect the results in order.
+        futures = []
+        for frame, face_locations in zip(rgb_small_frames, locations_batch):
+            if operation == "encode" and not face_locations:
+                futures.append(None)
+            elif self.inference_pool is not None and self.inference_pool.fits(frame):
+                futures.append(
+                    self.inference_pool.submit(frame, operation, face_locations)
+                )
+            else:
+                futures.append(None)
+
+        results = []
+        for frame, face_locations, future in zip(
+            rgb_small_frames, locations_batch, futures
+        ):
+            if future is not None:
+                results.append(future.result(timeout=self.inference_pool.timeout))
+            elif operation == "encode" and not face_locations:
+                results.append(([], []))
+            else:
+                results.append(run_inference(frame, operation, face_locations))
+        return results
+
+    def detect_faces(self, frames, camera_ids, operation):
+        """Run ``operation`` on every frame at its camera's detection scale.
+
+        A frame that comes back without faces at a coarse scale is detected
+        once more at a finer one. Returns the resized RGB frames, the raw
+        ``(face_locations, face_encodings)`` results on them, and the face
+        locations mapped back to full-frame pixels.
+        """
+        scales = [
+            self.detection_scaler.scale_for(camera_id, frame.shape)
+            for frame, camera_id in zip(frames, camera_ids)
+        ]
+        rgb_small_frames = [
+            detection_frame(frame, scale) for frame, scale in zip(frames, scales)
+        ]
+        detections = self.run_inference_batch(operation, rgb_small_frames)
+
+        retry = []
+        for i, (face_locations, _) in enumerate(detections):
+            finer_scale = self.detection_scaler.finer_scale(scales[i])
+            if not face_locations and finer_scale is not None:
+                rgb_small_frames[i] = detection_frame(frames[i], finer_scale)
+                retry.append(i)
+        if retry:
+            retried = self.run_inference_batch(
+                operation, [rgb_small_frames[i] for i in retry]
+            )
+            for i, detection in zip(retry, retried):
+                detections[i] = detection
+
+        frame_locations = []
+        for frame, camera_id, rgb_small_frame, (face_locations, _) in zip(
+            frames, camera_ids, rgb_small_frames, detections
+        ):
+            locations = scale_face_locations(
+                face_locations, rgb_small_frame.shape, frame.shape
+            )
+            self.detection_scaler.observe(camera_id, locations)
+            frame_locations.append(locations)
+
+        return rgb_small_frames, detections, frame_locations
+
+    def detect_tracked_faces(self, frames, camera_ids, now):
+        rgb_small_frames, detections, frame_locations = self.detect_faces(
+            frames, camera_ids, "detect"
+        )
+
+        # Tracks live in full-frame pixels so they stay comparable when the
+        # camera's detection scale changes between frames.
+        assignments = []
+        locations_to_encode = []
+        for camera_id, (face_locations, _), locations in zip(
+            camera_ids, detections, frame_locations
+        ):
+            tracks = self.face_tracker.associate(camera_id, locations, now)
+            assignments.append(tracks)
+            locations_to_encode.append(
+                [
+                    location
+                    for location, track in zip(face_locations, tracks)
+                    if not self.face_tracker.is_reusable(track, now)
+                ]
+            )
+
+        fresh = self.run_inference_batch("encode", rgb_small_frames, locations_to_encode)
+
+        results = []
+        for locations, tracks, (_, fresh_encodings) in zip(
+            frame_locations, assignments, fresh
+        ):
+            fresh_encodings = iter(fresh_encodings)
+            face_encodings = []
+            for track in tracks:
+                if self.face_tracker.is_reusable(track, now):
+                    track.reuse()
+                else:
+                    track.verify(next(fresh_encodings), now)
+                face_encodings.append(track.encoding)
+            results.append((locations, face_encodings))
+        return results
+
+    def process_frame(self, frame, camera_id=None):
+        return self.process_frames([frame], [camera_id])[0]
+
+    def process_queued_frames(self, frames, keys):
+        return self.process_frames(frames, [camera_id for _, camera_id in keys])
+
+    def process_frames(self, frames, camera_ids=None):
+        if camera_ids is None:
+            camera_ids = [None] * len(frames)
+        camera_ids = [camera_id or self.vehicle_id for camera_id in camera_ids]
+
         try:
-            small_frame = cv2.resize(frame, (0, 0), fx=0.5, fy=0.5)
-            rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+            if self.face_tracker is not None:
+                detections = self.detect_tracked_faces(frames, camera_ids, time.time())
+            else:
+                _, detections, frame_locations = self.detect_faces(
+                    frames, camera_ids, "detect_and_encode"
+                )
+                detections = [
+                    (locations, face_encodings)
+                    for locations, (_, face_encodings) in zip(
+                        frame_locations, detections
+                    )
+                ]
 
+            # One gallery search for every face in every frame of the batch.
+            # Tracked faces are searched with their cached encoding, so a
+            # gallery update still changes their identity right away.
+            all_encodings = [
+                face_encoding
+                for _, face_encodings in detections
+                for face_encoding in face_encodings
+            ]
+            matched_names, match_distances = self.match_faces(all_encodings)
+        except Exception as e:
+            print(f"Error processing frame: {e}")
+            return [(frame, "error") for frame in frames]
+
+        results = []
+        offset = 0
+        for frame, (face_locations, _) in zip(frames, detections):
+            count = len(face_locations)
+            results.append(
+                self._handle_detections(
+                    frame,
+                    face_locations,
+                    matched_names[offset : offset + count],
+                    match_distances[offset : offset + count],
+                )
+            )
+            offset += count
+        return results
+
+    def _handle_detections(self, frame, face_locations, matched_names, match_distances):
+        try:
             with self.lock:
                 self.current_frame = frame.copy()
 
-            face_locations = face_recognition.face_locations(
-                rgb_small_frame, model="hog"
-            )
             processed_frame = frame.copy()
 
             if not face_locations:
@@ -493,93 +1457,50 @@ class FaceRecognitionSystem:
                 self.publish_to_firebase(0)
                 return processed_frame, "no face"
 
-            face_encodings = face_recognition.face_encodings(
-                rgb_small_frame, face_locations
-            )
-
             detection_result = None
             known_user_detected = False
             intruder_detected = False
+            empty_database = len(self.face_index) == 0
 
-            for (top, right, bottom, left), face_encoding in zip(
-                face_locations, face_encodings
+            for (top, right, bottom, left), name, distance in zip(
+                face_locations, matched_names, match_distances
             ):
-                top *= 2
-                right *= 2
-                bottom *= 2
-                left *= 2
-
-                if len(self.known_face_encodings) > 0:
-                    matches = face_recognition.compare_faces(
-                        self.known_face_encodings,
-                        face_encoding,
-                        tolerance=self.tolerance,
+                if name is not None:
+                    cv2.rectangle(
+                        processed_frame,
+                        (left, top),
+                        (right, bottom),
+                        (0, 255, 0),
+                        2,
+                    )
+                    cv2.rectangle(
+                        processed_frame,
+                        (left, bottom - 35),
+                        (right, bottom),
+                        (0, 255, 0),
+                        cv2.FILLED,
+                    )
+                    cv2.putText(
+                        processed_frame,
+                        name,
+                        (left + 6, bottom - 6),
+                        cv2.FONT_HERSHEY_DUPLEX,
+                        1.0,
+                        (255, 255, 255),
+                        1,
                     )
 
-                    if True in matches:
-                        match_index = matches.index(True)
-                        name = self.known_face_names[match_index]
-
-                        cv2.rectangle(
-                            processed_frame,
-                            (left, top),
-                            (right, bottom),
-                            (0, 255, 0),
-                            2,
-                        )
-                        cv2.rectangle(
-                            processed_frame,
-                            (left, bottom - 35),
-                            (right, bottom),
-                            (0, 255, 0),
-                            cv2.FILLED,
-                        )
-                        cv2.putText(
-                            processed_frame,
-                            name,
-                            (left + 6, bottom - 6),
-                            cv2.FONT_HERSHEY_DUPLEX,
-                            1.0,
-                            (255, 255, 255),
-                            1,
-                        )
-
-                        print(f"Face detected: {name}")
-                        self.publish_to_firebase(1)
-                        known_user_detected = True
-                        detection_result = name
-                    else:
-                        cv2.rectangle(
-                            processed_frame,
-                            (left, top),
-                            (right, bottom),
-                            (0, 0, 255),
-                            2,
-                        )
-                        cv2.rectangle(
-                            processed_frame,
-                            (left, bottom - 35),
-                            (right, bottom),
-                            (0, 0, 255),
-                            cv2.FILLED,
-                        )
-                        cv2.putText(
-                            processed_frame,
-                            "Unknown",
-                            (left + 6, bottom - 6),
-                            cv2.FONT_HERSHEY_DUPLEX,
-                            1.0,
-                            (255, 255, 255),
-                            1,
-                        )
-
-                        print("Face detected: intruder")
-                        self.publish_to_firebase(2)
-                        detection_result = "intruder"
-                        intruder_detected = True
+                    print(f"Face detected: {name} (distance: {distance:.3f})")
+                    self.publish_to_firebase(1)
+                    known_user_detected = True
+                    detection_result = name
                 else:
                     cv2.rectangle(
-                        processed_frame, (left, top), (right, bottom), (0, 0, 255), 2
+                        processed_frame,
+                        (left, top),
+                        (right, bottom),
+                        (0, 0, 255),
+                        2,
                     )
                     cv2.rectangle(
                         processed_frame,
@@ -598,15 +1519,18 @@ class FaceRecognitionSystem:
                         1,
                     )
 
-                    print("Face detected: intruder (empty database)")
+                    if empty_database:
+                        print("Face detected: intruder (empty database)")
+                    else:
+                        print(
+                            f"Face detected: intruder (nearest distance: {distance:.3f})"
+                        )
                     self.publish_to_firebase(2)
                     detection_result = "intruder"
                     intruder_detected = True
 
             if intruder_detected:
-                threading.Thread(
-                    target=self.upload_intruder_image, args=(frame,), daemon=True
-                ).start()
+                self.upload_intruder_image(frame)
 
             self.publish_to_mqtt(known_user_detected)
 
@@ -619,94 +1543,624 @@ class FaceRecognitionSystem:
             print(f"Error processing frame: {e}")
             return frame, "error"
 
-    def process_rest_image(self, image_data):
+    def check_scene(self, image_data, camera_id=None):
+        return self.scene_gate.check(camera_id or self.vehicle_id, image_data)
+
+    def process_rest_image(
+        self, image_data, camera_id=None, wait=True, timeout=None, scene_signature=None
+    ):
         try:
+            camera_id = camera_id or self.vehicle_id
+            current_time = time.time()
+            with self.lock:
+                last_detection_time = self.last_detection_times.get(camera_id, 0)
+                due = current_time - last_detection_time >= self.detection_interval
+                if due:
+                    self.last_detection_times[camera_id] = current_time
+
+            if not due:
+                return False, "skipped"
+
             nparr = np.frombuffer(image_data, np.uint8)
             frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            if frame is None:
+                return False, "error: failed to decode image"
 
-            current_time = time.time()
-            if current_time - self.last_detection_time >= self.detection_interval:
-                self.last_detection_time = current_time
-                processed_frame, result = self.process_frame(frame)
-                return True, result
-            else:
-                return False, "skipped"
+            future = self.frame_queue.submit((self.vehicle_id, camera_id), frame)
+
+            if scene_signature is not None:
+                # Only a frame that actually went through detection becomes the
+                # reference that later unchanged frames reuse the result of.
+                def commit_scene(done):
+                    processed, result = done.result()
+                    if processed and result != "error":
+                        self.scene_gate.commit(camera_id, scene_signature, result)
+
+                future.add_done_callback(commit_scene)
+
+            if not wait:
+                return False, "accepted"
+
+            if timeout is None:
+                timeout = self.frame_result_timeout
+            try:
+                return future.result(timeout=timeout)
+            except FutureTimeoutError:
+                return False, "pending"
 
         except Exception as e:
             print(f"Error processing REST image: {e}")
             return False, f"error: {str(e)}"
 
+    def memory_usage(self):
+        usage = self.face_index.nbytes
+        with self.lock:
+            for frame in (self.current_frame, self.latest_processed_frame):
+                if frame is not None:
+                    usage += frame.nbytes
+        return usage
+
     def cleanup(self):
-        if self.mqtt_client:
+        if self.owns_frame_queue:
+            self.frame_queue.stop()
+
+        if self.owns_status_publisher:
+            self.status_publisher.stop()
+        if self.owns_intruder_uploader:
+            self.intruder_uploader.stop()
+
+        if self.mqtt_client and self.owns_mqtt_client:
             self.mqtt_client.loop_stop()
             self.mqtt_client.disconnect()
             print("MQTT client disconnected")
 
 
-def limit_images():
-    image_files = [
-        f for f in os.listdir(UPLOAD_FOLDER) if f.endswith(".jpg") and f != LATEST_IMAGE
-    ]
-    image_files.sort()
-
-    if len(image_files) > MAX_IMAGES:
-        for file_to_delete in image_files[: len(image_files) - MAX_IMAGES]:
-            os.remove(os.path.join(UPLOAD_FOLDER, file_to_delete))
-            print(f"Deleted old image: {file_to_delete}")
-
-
-face_system = FaceRecognitionSystem(
-    known_faces_dir=KNOWN_FACES_DIR,
-    detection_interval=1.0,
-    firebase_cred_path=FIREBASE_CRED_PATH,
-    firebase_database_url=FIREBASE_DATABASE_URL,
-    firebase_topic=FIREBASE_TOPIC,
-    firebase_master_switch=FIREBASE_MASTER_SWITCH,
-    mqtt_broker=MQTT_BROKER,
-    mqtt_port=MQTT_PORT,
-    mqtt_username=MQTT_USERNAME,
-    mqtt_password=MQTT_PASSWORD,
-    mqtt_topic=MQTT_TOPIC,
-    mqtt_client_id=MQTT_CLIENT_ID,
-    intruder_api_endpoint=INTRUDER_API_ENDPOINT,
-    known_faces_api_endpoint=KNOWN_FACES_API_ENDPOINT,
-    tolerance=0.6,
+class FaceSystemRegistry:
+    """Per-vehicle FaceRecognitionSystem instances, created on first use.
+
+    Systems are kept in least-recently-used order and evicted once the
+    registry holds more than ``max_systems`` vehicles or their combined
+    ``memory_usage()`` exceeds ``memory_budget`` bytes. The most recently
+    used vehicle is never evicted.
+
+    Every system shares the registry's FrameQueue, which is given to
+    ``factory(vehicle_id, frame_queue)``. A vehicle only sends about one
+    frame per ``detection_interval``, so batches fill up with frames from
+    different vehicles; each vehicle's frames go to its own system and the
+    vehicles of one batch are processed concurrently. The queue keeps as many
+    batches in flight as it takes to fill ``inference_pool``.
+    """
+
+    def __init__(
+        self,
+        factory,
+        memory_budget,
+        max_systems,
+        frame_queue_depth=FRAME_QUEUE_DEPTH,
+        frame_batch_size=FRAME_BATCH_SIZE,
+        inference_pool=None,
+    ):
+        self.factory = factory
+        self.memory_budget = memory_budget
+        self.max_systems = max_systems
+
+        self.systems = OrderedDict()
+        self.loading_locks = {}
+        self.lock = threading.Lock()
+
+        batches = frame_batches_in_flight(inference_pool, frame_batch_size)
+        self.batch_executor = ThreadPoolExecutor(
+            max_workers=max(1, frame_batch_size) * batches,
+            thread_name_prefix="frame-batch",
+        )
+        self.frame_queue = FrameQueue(
+            self.process_batch,
+            max_depth=frame_queue_depth,
+            batch_size=frame_batch_size,
+            max_in_flight=batches,
+        )
+
+    def __len__(self):
+        with self.lock:
+            return len(self.systems)
+
+    def peek(self, vehicle_id):
+        with self.lock:
+            return self.systems.get(vehicle_id)
+
+    def get(self, vehicle_id):
+        with self.lock:
+            system = self.systems.get(vehicle_id)
+            if system is not None:
+                self.systems.move_to_end(vehicle_id)
+                return system
+            loading_lock = self.loading_locks.setdefault(vehicle_id, threading.Lock())
+
+        # Only requests for the same vehicle wait on each other while its
+        # gallery loads; other vehicles keep being served.
+        with loading_lock:
+            system = self.peek(vehicle_id)
+            if system is not None:
+                return system
+
+            print(f"Loading face recognition system for vehicle {vehicle_id}")
+            system = self.factory(vehicle_id, self.frame_queue)
+
+            with self.lock:
+                self.systems[vehicle_id] = system
+                self.loading_locks.pop(vehicle_id, None)
+                evicted = self._evict()
+
+        for evicted_id, evicted_system in evicted:
+            print(f"Evicted face recognition system for vehicle {evicted_id}")
+            evicted_system.cleanup()
+
+        return system
+
+    def memory_usage(self):
+        with self.lock:
+            systems = list(self.systems.values())
+        return sum(system.memory_usage() for system in systems)
+
+    def process_batch(self, frames, keys):
+        """FrameQueue consumer for frames keyed by ``(vehicle_id, camera_id)``."""
+        groups = OrderedDict()
+        for i, (vehicle_id, _) in enumerate(keys):
+            groups.setdefault(vehicle_id, []).append(i)
+
+        def process_group(vehicle_id, indices):
+            system = self.peek(vehicle_id)
+            group_frames = [frames[i] for i in indices]
+            if system is None:
+                # Evicted while its frames were waiting in the queue
+                return [(frame, "error") for frame in group_frames]
+            return system.process_frames(group_frames, [keys[i][1] for i in indices])
+
+        if len(groups) == 1:
+            vehicle_id, indices = next(iter(groups.items()))
+            return process_group(vehicle_id, indices)
+
+        futures = [
+            (indices, self.batch_executor.submit(process_group, vehicle_id, indices))
+            for vehicle_id, indices in groups.items()
+        ]
+        results = [None] * len(frames)
+        for indices, future in futures:
+            for i, result in zip(indices, future.result()):
+                results[i] = result
+        return results
+
+    def _evict(self):
+        evicted = []
+        usage = sum(system.memory_usage() for system in self.systems.values())
+
+        while len(self.systems) > 1 and (
+            len(self.systems) > self.max_systems or usage > self.memory_budget
+        ):
+            vehicle_id, system = self.systems.popitem(last=False)
+            usage -= system.memory_usage()
+            evicted.append((vehicle_id, system))
+
+        return evicted
+
+    def cleanup(self):
+        self.frame_queue.stop()
+
+        with self.lock:
+            systems = list(self.systems.values())
+            self.systems.clear()
+
+        for system in systems:
+            system.cleanup()
+        self.batch_executor.shutdown(wait=False)
+
+
+class UploadedFrame:
+    __slots__ = (
+        "sequence",
+        "vehicle_id",
+        "camera_id",
+        "filename",
+        "data",
+        "received_at",
+        "previews",
+    )
+
+    def __init__(self, sequence, vehicle_id, camera_id, filename, data):
+        self.sequence = sequence
+        self.vehicle_id = vehicle_id
+        self.camera_id = camera_id
+        self.filename = filename
+        self.data = data
+        self.received_at = time.time()
+        self.previews = {}
+
+    @property
+    def etag(self):
+        return f"{self.sequence:x}-{int(self.received_at * 1000):x}"
+
+
+class UploadRing:
+    """Bounded in-memory history of the most recent uploads per vehicle.
+
+    ``add`` only appends the JPEG bytes to the vehicle's ring; nothing touches
+    the filesystem on the request path. With ``spill`` enabled a background
+    thread writes queued frames to ``uploads/<vehicle_id>/`` every
+    ``spill_interval`` seconds or once ``spill_batch_size`` frames are
+    waiting, refreshes ``latest.jpg`` once per vehicle per batch and keeps
+    at most ``disk_limit`` timestamped files per vehicle. Frames that have
+    not been written yet when the spill queue is full are dropped from the
+    archive but remain in memory.
+
+    Readers can block in ``wait_for_frame`` until a newer frame arrives, and
+    ``preview`` encodes a downscaled copy of a frame once per width; every
+    later caller gets the cached bytes.
+    """
+
+    def __init__(
+        self,
+        capacity=UPLOAD_RING_SIZE,
+        max_vehicles=FACE_SYSTEM_MAX_VEHICLES,
+        spill=UPLOAD_SPILL_TO_DISK,
+        spill_interval=UPLOAD_SPILL_INTERVAL,
+        spill_batch_size=UPLOAD_SPILL_BATCH_SIZE,
+        disk_limit=MAX_IMAGES,
+    ):
+        self.capacity = capacity
+        self.max_vehicles = max_vehicles
+        self.spill = spill
+        self.spill_interval = spill_interval
+        self.spill_batch_size = spill_batch_size
+        self.disk_limit = disk_limit
+
+        self.frames = OrderedDict()
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        self.frame_added = threading.Condition(self.lock)
+        self.preview_lock = threading.Lock()
+        self.last_sequence = 0
+        self.spill_queue = []
+        self.spill_dropped = 0
+        self.spilled_files = {}
+        self.is_running = True
+
+        self.spill_thread = None
+        if self.spill:
+            self.spill_thread = threading.Thread(target=self._spill_loop, daemon=True)
+            self.spill_thread.start()
+
+    def add(self, vehicle_id, image_data, camera_id=None, timestamp=None):
+        if timestamp is None:
+            timestamp = get_ntp_time().strftime("%Y%m%d_%H%M%S")
+
+        with self.condition:
+            self.last_sequence += 1
+            frame = UploadedFrame(
+                self.last_sequence,
+                vehicle_id,
+                camera_id,
+                f"{timestamp}.jpg",
+                image_data,
+            )
+
+            frames = self.frames.pop(vehicle_id, None)
+            if frames is None:
+                frames = deque(maxlen=self.capacity)
+            frames.append(frame)
+            self.frames[vehicle_id] = frames
+            while len(self.frames) > self.max_vehicles:
+                self.frames.popitem(last=False)
+            self.frame_added.notify_all()
+
+            if self.spill and self.is_running:
+                if len(self.spill_queue) >= self.spill_batch_size * 4:
+                    self.spill_queue.pop(0)
+                    self.spill_dropped += 1
+                self.spill_queue.append(frame)
+                if len(self.spill_queue) >= self.spill_batch_size:
+                    self.condition.notify()
+
+        return frame
+
+    def latest(self, vehicle_id):
+        with self.condition:
+            frames = self.frames.get(vehicle_id)
+            return frames[-1] if frames else None
+
+    def recent(self, vehicle_id):
+        with self.condition:
+            return list(self.frames.get(vehicle_id, ()))
+
+    def wait_for_frame(self, vehicle_id, after_sequence=0, timeout=None):
+        """Return the vehicle's latest frame once it is newer than
+        ``after_sequence``, or whatever is latest (possibly ``None``) after
+        ``timeout`` seconds or when the ring is stopped."""
+        deadline = None if timeout is None else time.time() + timeout
+
+        with self.frame_added:
+            while True:
+                frames = self.frames.get(vehicle_id)
+                latest = frames[-1] if frames else None
+                if latest is not None and latest.sequence > after_sequence:
+                    return latest
+                if not self.is_running:
+                    return latest
+
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return latest
+                self.frame_added.wait(remaining)
+
+    def preview(self, frame, width):
+        if not width:
+            return frame.data
+
+        with self.preview_lock:
+            data = frame.previews.get(width)
+            if data is not None:
+                return data
+
+            image = cv2.imdecode(np.frombuffer(frame.data, np.uint8), cv2.IMREAD_COLOR)
+            if image is None or image.shape[1] <= width:
+                data = frame.data
+            else:
+                height = max(1, round(image.shape[0] * width / image.shape[1]))
+                image = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+                _, encoded = cv2.imencode(
+                    ".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, PREVIEW_JPEG_QUALITY]
+                )
+                data = encoded.tobytes()
+
+            frame.previews[width] = data
+            return data
+
+    def memory_usage(self):
+        with self.condition:
+            return sum(
+                len(frame.data) + sum(len(data) for data in frame.previews.values())
+                for frames in self.frames.values()
+                for frame in frames
+            )
+
+    def _spill_loop(self):
+        while True:
+            with self.condition:
+                if self.is_running and len(self.spill_queue) < self.spill_batch_size:
+                    self.condition.wait(timeout=self.spill_interval)
+                batch = self.spill_queue
+                self.spill_queue = []
+                is_running = self.is_running
+
+            if batch:
+                self._write_batch(batch)
+            if not is_running:
+                break
+
+    def _disk_files(self, vehicle_id, upload_folder):
+        files = self.spilled_files.get(vehicle_id)
+        if files is None:
+            # Seed from whatever a previous run left behind, once per vehicle
+            files = deque(
+                sorted(
+                    f
+                    for f in os.listdir(upload_folder)
+                    if f.endswith(".jpg") and f != LATEST_IMAGE
+                )
+            )
+            self.spilled_files[vehicle_id] = files
+        return files
+
+    def _write_batch(self, batch):
+        latest_frames = {}
+
+        for frame in batch:
+            try:
+                upload_folder = vehicle_upload_folder(frame.vehicle_id)
+                with open(os.path.join(upload_folder, frame.filename), "wb") as f:
+                    f.write(frame.data)
+
+                files = self._disk_files(frame.vehicle_id, upload_folder)
+                if not files or files[-1] != frame.filename:
+                    files.append(frame.filename)
+                latest_frames[frame.vehicle_id] = frame
+            except Exception as e:
+                print(f"Error writing upload {frame.filename}: {e}")
+
+        for vehicle_id, frame in latest_frames.items():
+            upload_folder = vehicle_upload_folder(vehicle_id)
+            try:
+                tmp_path = os.path.join(upload_folder, f".{LATEST_IMAGE}.tmp")
+                with open(tmp_path, "wb") as f:
+                    f.write(frame.data)
+                os.replace(tmp_path, os.path.join(upload_folder, LATEST_IMAGE))
+            except Exception as e:
+                print(f"Error writing latest image for {vehicle_id}: {e}")
+
+            files = self.spilled_files[vehicle_id]
+            while len(files) > self.disk_limit:
+                file_to_delete = files.popleft()
+                try:
+                    os.remove(os.path.join(upload_folder, file_to_delete))
+                except FileNotFoundError:
+                    pass
+
+        print(f"Wrote {len(batch)} buffered uploads to disk")
+
+    def stop(self, timeout=5):
+        # Frames still queued are written before the spill thread exits
+        with self.condition:
+            self.is_running = False
+            self.condition.notify_all()
+            self.frame_added.notify_all()
+        if self.spill_thread is not None:
+            self.spill_thread.join(timeout=timeout)
+
+
+def vehicle_upload_folder(vehicle_id):
+    upload_folder = os.path.join(UPLOAD_FOLDER, vehicle_id)
+    os.makedirs(upload_folder, exist_ok=True)
+    return upload_folder
+
+
+def resolve_vehicle_id(vehicle_id=None, data=None):
+    if not vehicle_id and isinstance(data, dict):
+        vehicle_id = data.get("vehicle_id")
+    if not vehicle_id:
+        vehicle_id = request.args.get("vehicle_id", VEHICLE_ID)
+
+    if not isinstance(vehicle_id, str) or not VEHICLE_ID_PATTERN.match(vehicle_id):
+        return None
+    return vehicle_id
+
+
+def read_upload_image():
+    """Return the uploaded image bytes and the request options.
+
+    Accepts a raw ``image/*`` or ``application/octet-stream`` body, a
+    ``multipart/form-data`` upload with an ``image`` file part, or the JSON
+    ``{"image": "<base64>"}`` body. Options come from the JSON body or the
+    form fields; ``request_option`` falls back to the query string for raw
+    bodies. The image is ``None`` when the request carries none.
+    """
+    mimetype = request.mimetype
+
+    if mimetype == "multipart/form-data":
+        data = request.form.to_dict()
+        image_file = request.files.get("image")
+        if image_file is None:
+            return None, data
+        return image_file.read() or None, data
+
+    if mimetype.startswith("image/") or mimetype == "application/octet-stream":
+        return request.get_data(cache=False) or None, {}
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or "image" not in data:
+        return None, data
+    return base64.b64decode(data["image"]), data
+
+
+def request_option(data, name, default=None):
+    if isinstance(data, dict) and name in data:
+        return data[name]
+    return request.args.get(name, default)
+
+
+def parse_preview_width():
+    width = request.args.get("width", type=int)
+    if not width:
+        return None
+    # Snap to 16px steps so viewers asking for similar sizes share one encode
+    width = min(max(width, PREVIEW_MIN_WIDTH), PREVIEW_MAX_WIDTH)
+    return width - width % 16
+
+
+def parse_wait_options(data):
+    wait = request_option(data, "wait", True)
+    if isinstance(wait, str):
+        wait = wait.lower() not in ("0", "false", "no")
+
+    deadline = request_option(data, "deadline")
+    if deadline is not None:
+        deadline = max(0.0, float(deadline))
+
+    return bool(wait), deadline
+
+
+shared_mqtt_client = connect_mqtt_client(
+    MQTT_BROKER, MQTT_PORT, MQTT_USERNAME, MQTT_PASSWORD, MQTT_CLIENT_ID
+)
+status_publisher = StatusPublisher()
+intruder_uploader = create_intruder_uploader()
+upload_ring = UploadRing()
+
+
+def create_face_system(vehicle_id, frame_queue=None):
+    return FaceRecognitionSystem(
+        detection_interval=1.0,
+        firebase_cred_path=FIREBASE_CRED_PATH,
+        firebase_database_url=FIREBASE_DATABASE_URL,
+        mqtt_broker=MQTT_BROKER,
+        mqtt_port=MQTT_PORT,
+        mqtt_username=MQTT_USERNAME,
+        mqtt_password=MQTT_PASSWORD,
+        mqtt_client_id=MQTT_CLIENT_ID,
+        tolerance=0.6,
+        face_index_type=FACE_INDEX_TYPE,
+        face_index_nprobe=FACE_INDEX_NPROBE,
+        vehicle_id=vehicle_id,
+        mqtt_client=shared_mqtt_client,
+        inference_pool=inference_pool,
+        status_publisher=status_publisher,
+        intruder_uploader=intruder_uploader,
+        frame_queue=frame_queue,
+        **vehicle_settings(vehicle_id),
+    )
+
+
+face_systems = FaceSystemRegistry(
+    create_face_system,
+    memory_budget=FACE_SYSTEM_MEMORY_BUDGET_MB * 1024 * 1024,
+    max_systems=FACE_SYSTEM_MAX_VEHICLES,
+    inference_pool=inference_pool,
 )
 
 
 @app.route("/upload", methods=["POST"])
-def upload_image():
+@app.route("/<vehicle_id>/upload", methods=["POST"])
+def upload_image(vehicle_id=None):
     try:
-        data = request.get_json()
+        image_data, data = read_upload_image()
 
-        if not data or "image" not in data:
+        if not image_data:
             return jsonify({"error": "No image data received"}), 400
 
-        base64_image = data["image"]
-        image_data = base64.b64decode(base64_image)
+        vehicle_id = resolve_vehicle_id(vehicle_id, data)
+        if vehicle_id is None:
+            return jsonify({"error": "Invalid vehicle id"}), 400
 
-        timestamp = get_ntp_time().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}.jpg"
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
+        camera_id = str(request_option(data, "camera_id", vehicle_id))
+        face_system = face_systems.get(vehicle_id)
 
-        with open(filepath, "wb") as f:
-            f.write(image_data)
-
-        latest_path = os.path.join(UPLOAD_FOLDER, LATEST_IMAGE)
-        with open(latest_path, "wb") as f:
-            f.write(image_data)
+        # Unchanged frames are still stored so /latest_image and /stream stay live
+        timestamp = get_ntp_time().strftime("%Y%m%d_%H%M%S")
+        uploaded_frame = upload_ring.add(vehicle_id, image_data, camera_id, timestamp)
+        filename = uploaded_frame.filename
 
-        print(f"Image saved as {filepath}")
+        unchanged, previous_result, scene_signature = face_system.check_scene(
+            image_data, camera_id
+        )
+        if unchanged:
+            return jsonify(
+                {
+                    "success": True,
+                    "vehicle_id": vehicle_id,
+                    "message": "Scene unchanged, previous result reused",
+                    "filename": filename,
+                    "processed": False,
+                    "scene_changed": False,
+                    "result": previous_result,
+                    "timestamp": timestamp,
+                }
+            )
 
-        limit_images()
+        wait, deadline = parse_wait_options(data)
 
-        processed, result = face_system.process_rest_image(image_data)
+        processed, result = face_system.process_rest_image(
+            image_data,
+            camera_id=camera_id,
+            wait=wait,
+            timeout=deadline,
+            scene_signature=scene_signature,
+        )
 
         response_data = {
             "success": True,
+            "vehicle_id": vehicle_id,
             "message": "Image received and saved",
             "filename": filename,
             "processed": processed,
+            "scene_changed": True,
             "result": result,
             "timestamp": timestamp,
         }
@@ -734,6 +2188,12 @@ def health_check():
                     if timestamp_manager.is_synchronized
                     else "unknown"
                 ),
+                "vehicles_loaded": len(face_systems),
+                "memory_usage_mb": round(face_systems.memory_usage() / 1024 / 1024, 2),
+                "upload_buffer_mb": round(upload_ring.memory_usage() / 1024 / 1024, 2),
+                "status_updates_sent": status_publisher.sent_count,
+                "status_updates_suppressed": status_publisher.suppressed_count,
+                "intruder_uploads": intruder_uploader.metrics(),
             }
         ),
         200,
@@ -741,25 +2201,93 @@ def health_check():
 
 
 @app.route("/latest_image", methods=["GET"])
-def get_latest_image():
+@app.route("/<vehicle_id>/latest_image", methods=["GET"])
+def get_latest_image(vehicle_id=None):
     try:
-        latest_path = os.path.join(UPLOAD_FOLDER, LATEST_IMAGE)
+        vehicle_id = resolve_vehicle_id(vehicle_id)
+        if vehicle_id is None:
+            return jsonify({"error": "Invalid vehicle id"}), 400
+
+        width = parse_preview_width()
+        latest_frame = upload_ring.latest(vehicle_id)
+        if latest_frame is not None:
+            response = Response(
+                upload_ring.preview(latest_frame, width), mimetype="image/jpeg"
+            )
+            response.set_etag(
+                f"{latest_frame.etag}-{width}" if width else latest_frame.etag
+            )
+            response.last_modified = datetime.fromtimestamp(
+                latest_frame.received_at, pytz.utc
+            )
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+
+        # Nothing uploaded since the last restart, fall back to the spilled copy
+        latest_path = os.path.join(UPLOAD_FOLDER, vehicle_id, LATEST_IMAGE)
         if os.path.exists(latest_path):
-            with open(latest_path, "rb") as f:
-                image_data = f.read()
-            return Response(image_data, mimetype="image/jpeg")
+            response = send_file(latest_path, mimetype="image/jpeg", conditional=True)
+            response.cache_control.no_cache = True
+            return response
         else:
             return jsonify({"error": "No latest image available"}), 404
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+@app.route("/stream", methods=["GET"])
+@app.route("/<vehicle_id>/stream", methods=["GET"])
+def stream_latest_images(vehicle_id=None):
+    vehicle_id = resolve_vehicle_id(vehicle_id)
+    if vehicle_id is None:
+        return jsonify({"error": "Invalid vehicle id"}), 400
+
+    width = parse_preview_width()
+
+    def generate():
+        sequence = 0
+        while upload_ring.is_running:
+            frame = upload_ring.wait_for_frame(
+                vehicle_id, sequence, timeout=MJPEG_KEEPALIVE_INTERVAL
+            )
+            if frame is None:
+                continue
+
+            # On timeout the same frame is sent again, which also lets the
+            # server notice viewers that have gone away
+            sequence = frame.sequence
+            image_data = upload_ring.preview(frame, width)
+            yield (
+                f"--{MJPEG_BOUNDARY}\r\n"
+                f"Content-Type: image/jpeg\r\n"
+                f"Content-Length: {len(image_data)}\r\n\r\n"
+            ).encode() + image_data + b"\r\n"
+
+    response = Response(
+        generate(), mimetype=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}"
+    )
+    response.cache_control.no_cache = True
+    return response
+
+
 @app.route("/refresh_faces", methods=["GET"])
-def refresh_known_faces():
+@app.route("/<vehicle_id>/refresh_faces", methods=["GET"])
+def refresh_known_faces(vehicle_id=None):
     try:
-        threading.Thread(
-            target=face_system.fetch_known_faces_from_api, daemon=True
-        ).start()
+        vehicle_id = resolve_vehicle_id(vehicle_id)
+        if vehicle_id is None:
+            return jsonify({"error": "Invalid vehicle id"}), 400
+
+        face_system = face_systems.peek(vehicle_id)
+        if face_system is None:
+            # Loading the vehicle fetches its known faces anyway.
+            threading.Thread(
+                target=face_systems.get, args=(vehicle_id,), daemon=True
+            ).start()
+        else:
+            threading.Thread(
+                target=face_system.sync_known_faces_from_api, daemon=True
+            ).start()
         return jsonify(
             {
                 "status": "success",
@@ -793,11 +2321,19 @@ def main():
         print("Starting integrated Flask server with face recognition...")
         app.run(host="0.0.0.0", port=5001, debug=False, threaded=True)
     except KeyboardInterrupt:
-        face_system.cleanup()
+        face_systems.cleanup()
         timestamp_manager.stop()
         print("Server stopped.")
     finally:
-        face_system.cleanup()
+        face_systems.cleanup()
+        status_publisher.stop()
+        intruder_uploader.stop()
+        upload_ring.stop()
+        if shared_mqtt_client:
+            shared_mqtt_client.loop_stop()
+            shared_mqtt_client.disconnect()
+        if inference_pool is not None:
+            inference_pool.close()
         timestamp_manager.stop()
 
 
@@ -0,0 +1,390 @@
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+from multiprocessing.connection import Connection, wait
+
+import numpy as np
+
+from face_detectors import get_face_detector
+from face_index import FACE_ENCODING_DIM
+
+
+def run_inference(frame, operation="detect_and_encode", face_locations=None):
+    """Run one inference step on an RGB frame.
+
+    ``operation`` is ``"detect"`` (locations only), ``"encode"`` (encodings for
+    the given ``face_locations``) or ``"detect_and_encode"``. Detection uses
+    the process's configured detector (see ``configure_face_detector``).
+    """
+    import face_recognition
+
+    if operation != "encode":
+        face_locations = get_face_detector().detect(frame)
+
+    face_encodings = []
+    if operation != "detect" and face_locations:
+        face_encodings = face_recognition.face_encodings(frame, face_locations)
+
+    return (
+        [tuple(location) for location in face_locations],
+        np.array(face_encodings, dtype=np.float32).reshape(-1, FACE_ENCODING_DIM),
+    )
+
+
+def _worker_main(conn):
+    slots = {}
+
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            # The server closed its end or exited
+            break
+        if task is None:
+            break
+
+        job_id, slot_name, shape, operation, face_locations = task
+        try:
+            if slot_name not in slots:
+                slots[slot_name] = shared_memory.SharedMemory(name=slot_name)
+
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot_name].buf)
+            face_locations, face_encodings = run_inference(
+                frame, operation, face_locations
+            )
+            result = (job_id, face_locations, face_encodings, None)
+        except Exception as e:
+            result = (job_id, None, None, f"{type(e).__name__}: {e}")
+        conn.send(result)
+
+    for slot in slots.values():
+        slot.close()
+
+
+def _spawner_main(control, server_control):
+    """Fork a worker for every connection the pool sends over ``control``.
+
+    Replies with the worker's pid and exits when the pool closes its end.
+    """
+    server_control.close()
+    # Exited workers are reaped by the kernel; the pool notices them through
+    # their closed connection instead.
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    while True:
+        try:
+            _, fds, _, _ = socket.recv_fds(control, 1, 1)
+        except OSError:
+            break
+        if not fds:
+            break
+
+        pid = os.fork()
+        if pid == 0:
+            control.close()
+            code = 1
+            try:
+                _worker_main(Connection(fds[0]))
+                code = 0
+            finally:
+                os._exit(code)
+
+        os.close(fds[0])
+        control.sendall(pid.to_bytes(4, "little"))
+
+
+def _wait_for_exit(conn, timeout):
+    """Wait until the worker behind ``conn`` closes it, skipping late results."""
+    deadline = time.monotonic() + timeout
+    try:
+        while conn.poll(max(0.0, deadline - time.monotonic())):
+            conn.recv()
+    except (EOFError, OSError):
+        return True
+    return False
+
+
+def _kill(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+class InferencePool:
+    """Pre-started worker processes running HOG detection and face encoding.
+
+    Every worker imports face_recognition (and with it the dlib models) once.
+    Frames are copied into fixed shared-memory slots instead of being pickled;
+    only the slot name and frame shape travel over the worker's own
+    connection, and the small location/encoding results come back over it to
+    a collector thread that resolves them into futures. Each job goes to the
+    worker with the fewest jobs in flight.
+
+    The number of slots bounds how many frames can be in flight; when every
+    slot is busy ``submit`` runs the inference in the calling process
+    instead. A worker whose connection closes has died: its jobs fail and it
+    is replaced. The collector also checks every ``check_interval`` seconds
+    for jobs still unanswered after ``timeout`` seconds; their worker is
+    killed and replaced and its jobs fail with ``TimeoutError``. Since no
+    other worker shares the connection, killing one mid-send cannot corrupt
+    the results of the others.
+    """
+
+    def __init__(
+        self, workers, slot_bytes, slots_per_worker=2, timeout=30.0, check_interval=1.0
+    ):
+        self.slot_bytes = slot_bytes
+        self.timeout = timeout
+        self.check_interval = check_interval
+
+        self.slots = [
+            shared_memory.SharedMemory(create=True, size=slot_bytes)
+            for _ in range(workers * slots_per_worker)
+        ]
+        self.free_slots = queue.Queue()
+        for slot in self.slots:
+            self.free_slots.put(slot)
+
+        self.pending = {}
+        self.job_ids = itertools.count()
+        self.lock = threading.Lock()
+        self.is_running = True
+        self.restarted_workers = 0
+        self.local_runs = 0
+
+        # Workers are forked so they inherit the already imported dlib models
+        # copy-on-write instead of re-running the server module, which spawn
+        # and forkserver would do. They are forked by a spawner process that
+        # is itself forked here, before the server starts any other thread,
+        # so workers restarted later never fork the multi-threaded server.
+        self.control, spawner_control = socket.socketpair()
+        self.spawner = mp.get_context("fork").Process(
+            target=_spawner_main, args=(spawner_control, self.control), daemon=True
+        )
+        self.spawner.start()
+        spawner_control.close()
+
+        self.connections = [None] * workers
+        self.pids = [None] * workers
+        self.in_flight = [0] * workers
+        for worker in range(workers):
+            self._start_worker(worker)
+
+        self.collector = threading.Thread(target=self._collect_results, daemon=True)
+        self.collector.start()
+
+        print(
+            f"Inference pool started with {workers} workers and "
+            f"{len(self.slots)} shared-memory slots of {slot_bytes / 1024 / 1024:.1f} MB"
+        )
+
+    def _start_worker(self, worker):
+        """Have the spawner fork a worker for slot ``worker`` of the pool."""
+        conn, worker_conn = mp.Pipe()
+        try:
+            socket.send_fds(self.control, [b"w"], [worker_conn.fileno()])
+            reply = self.control.recv(4, socket.MSG_WAITALL)
+        except OSError:
+            reply = b""
+        finally:
+            worker_conn.close()
+
+        if len(reply) != 4:
+            conn.close()
+            print("Cannot start an inference worker: the spawner has exited")
+            return False
+
+        pid = int.from_bytes(reply, "little")
+        with self.lock:
+            if self.is_running:
+                self.connections[worker] = conn
+                self.pids[worker] = pid
+                return True
+        conn.close()
+        _kill(pid)
+        return False
+
+    def fits(self, frame):
+        return frame.dtype == np.uint8 and frame.nbytes <= self.slot_bytes
+
+    def submit(self, frame, operation="detect_and_encode", face_locations=None):
+        frame = np.ascontiguousarray(frame)
+        if not self.fits(frame):
+            raise ValueError(
+                f"Frame of {frame.nbytes} bytes does not fit a {self.slot_bytes} byte slot"
+            )
+
+        future = Future()
+        try:
+            slot = self.free_slots.get_nowait()
+        except queue.Empty:
+            # Every slot is in flight; waiting for one would only add latency
+            slot = None
+
+        if slot is not None:
+            np.ndarray(frame.shape, dtype=np.uint8, buffer=slot.buf)[...] = frame
+            task = (
+                next(self.job_ids),
+                slot.name,
+                frame.shape,
+                operation,
+                face_locations,
+            )
+            with self.lock:
+                if self._dispatch(future, slot, task):
+                    return future
+            self.free_slots.put(slot)
+
+        self.local_runs += 1
+        try:
+            future.set_result(run_inference(frame, operation, face_locations))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _dispatch(self, future, slot, task):
+        """Send ``task`` to the least busy worker; the caller holds the lock."""
+        workers = [w for w, conn in enumerate(self.connections) if conn is not None]
+        if not self.is_running or not workers:
+            return False
+
+        worker = min(workers, key=self.in_flight.__getitem__)
+        try:
+            self.connections[worker].send(task)
+        except OSError:
+            # The collector sees the closed connection and replaces the worker
+            return False
+
+        self.in_flight[worker] += 1
+        deadline = time.monotonic() + self.timeout
+        self.pending[task[0]] = (future, slot, worker, deadline)
+        return True
+
+    def run(self, frame, operation="detect_and_encode", face_locations=None):
+        return self.submit(frame, operation, face_locations).result(
+            timeout=self.timeout
+        )
+
+    def _release(self, job_id):
+        """Forget ``job_id`` and free its slot; the caller holds the lock."""
+        entry = self.pending.pop(job_id, None)
+        if entry is None:
+            return None
+        future, slot, worker, _ = entry
+        self.in_flight[worker] -= 1
+        self.free_slots.put(slot)
+        return future
+
+    def _collect_results(self):
+        next_check = time.monotonic() + self.check_interval
+        while True:
+            with self.lock:
+                if not self.is_running:
+                    break
+                connections = [conn for conn in self.connections if conn is not None]
+
+            for conn in wait(connections, timeout=self.check_interval):
+                try:
+                    job_id, face_locations, face_encodings, error = conn.recv()
+                except (EOFError, OSError):
+                    worker = self.connections.index(conn)
+                    print(f"Inference worker {self.pids[worker]} exited, restarting")
+                    self._replace_worker(worker, RuntimeError("Inference worker died"))
+                    continue
+
+                with self.lock:
+                    future = self._release(job_id)
+                # A job that already failed or timed out has no future left
+                if future is not None:
+                    if error is not None:
+                        future.set_exception(RuntimeError(error))
+                    else:
+                        future.set_result((face_locations, face_encodings))
+
+            if time.monotonic() >= next_check:
+                self._check_workers()
+                next_check = time.monotonic() + self.check_interval
+
+    def _replace_worker(self, worker, error):
+        """Kill ``worker``, fail its jobs with ``error`` and fork a new one."""
+        with self.lock:
+            if not self.is_running:
+                return
+            conn, pid = self.connections[worker], self.pids[worker]
+            self.connections[worker] = None
+            failed = [
+                self._release(job_id)
+                for job_id, (_, _, job_worker, _) in list(self.pending.items())
+                if job_worker == worker
+            ]
+
+        _kill(pid)
+        conn.close()
+        for future in failed:
+            future.set_exception(error)
+
+        if self._start_worker(worker):
+            self.restarted_workers += 1
+
+    def _check_workers(self):
+        now = time.monotonic()
+        with self.lock:
+            missing = [w for w, conn in enumerate(self.connections) if conn is None]
+            stuck = {
+                worker
+                for _, _, worker, deadline in self.pending.values()
+                if deadline <= now
+            }
+
+        for worker in stuck:
+            # A worker that sits on a job this long is stuck
+            print(f"Inference worker {self.pids[worker]} timed out, restarting")
+            self._replace_worker(
+                worker,
+                FutureTimeoutError(f"Inference job timed out after {self.timeout} s"),
+            )
+
+        # Workers the spawner could not start before
+        if missing and self.spawner.is_alive():
+            for worker in missing:
+                self._start_worker(worker)
+
+    def close(self):
+        with self.lock:
+            self.is_running = False
+        self.collector.join(timeout=self.check_interval + 5)
+
+        for conn, pid in zip(self.connections, self.pids):
+            if conn is None:
+                continue
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            if not _wait_for_exit(conn, 5):
+                _kill(pid)
+            conn.close()
+
+        # Closing the control socket stops the spawner
+        self.control.close()
+        self.spawner.join(timeout=5)
+        if self.spawner.is_alive():
+            self.spawner.terminate()
+
+        with self.lock:
+            futures = [self._release(job_id) for job_id in list(self.pending)]
+        for future in futures:
+            future.set_exception(RuntimeError("Inference pool stopped"))
+
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        print("Inference pool stopped")
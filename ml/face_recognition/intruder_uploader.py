@@ -0,0 +1,140 @@
+import base64
+import threading
+from collections import deque
+from datetime import datetime
+
+import cv2
+import requests
+
+
+class IntruderUploader:
+    """Fixed pool of worker threads posting intruder snapshots to the photo server.
+
+    ``submit`` only appends the frame to a bounded queue; when the queue is
+    full the oldest waiting snapshot is dropped so a loitering intruder
+    cannot pile up work. Each worker JPEG-encodes the frame and posts it
+    through its own keep-alive ``requests.Session`` with a timeout. Timeouts,
+    connection errors and 5xx responses are retried with exponential
+    backoff; other failures are not. Snapshots are timestamped with
+    ``clock()``.
+    """
+
+    def __init__(
+        self,
+        workers=2,
+        max_queue=8,
+        timeout=10.0,
+        max_retries=3,
+        backoff=1.0,
+        max_backoff=30.0,
+        clock=datetime.now,
+    ):
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.stats = {
+            "queued": 0,
+            "uploaded": 0,
+            "failed": 0,
+            "dropped": 0,
+            "retries": 0,
+        }
+
+        self.workers = [
+            threading.Thread(target=self._run, daemon=True) for _ in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, endpoint, frame):
+        now = self.clock()
+        job = (
+            endpoint,
+            frame,
+            now.strftime("%Y%m%d_%H%M%S"),
+            now.strftime("%Y-%m-%d %H:%M:%S"),
+        )
+
+        with self.condition:
+            if self.stop_event.is_set():
+                return False
+
+            if len(self.pending) >= self.max_queue:
+                self.pending.popleft()
+                self.stats["dropped"] += 1
+            self.pending.append(job)
+            self.stats["queued"] += 1
+            self.condition.notify()
+        return True
+
+    def metrics(self):
+        with self.condition:
+            return dict(self.stats, pending=len(self.pending))
+
+    def _run(self):
+        session = requests.Session()
+
+        while True:
+            with self.condition:
+                while not self.pending and not self.stop_event.is_set():
+                    self.condition.wait()
+                if not self.pending:
+                    break
+                job = self.pending.popleft()
+
+            uploaded = self._upload(session, *job)
+            with self.condition:
+                self.stats["uploaded" if uploaded else "failed"] += 1
+
+        session.close()
+
+    def _upload(self, session, endpoint, frame, timestamp, formatted_time):
+        _, img_encoded = cv2.imencode(".jpg", frame)
+        json_data = {
+            "image": base64.b64encode(img_encoded.tobytes()).decode("utf-8"),
+            "timestamp": timestamp,
+            "detected_at": formatted_time,
+        }
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self.condition:
+                    self.stats["retries"] += 1
+                delay = min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+                if self.stop_event.wait(delay):
+                    return False
+
+            try:
+                response = session.post(endpoint, json=json_data, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                print(f"Error uploading intruder image (attempt {attempt + 1}): {e}")
+                continue
+
+            if response.status_code == 200:
+                print(f"Intruder image successfully uploaded to API")
+                return True
+
+            print(
+                f"Failed to upload intruder image. Status code: {response.status_code}"
+            )
+            if response.status_code < 500:
+                return False
+
+        return False
+
+    def stop(self, timeout=5):
+        # Snapshots still queued are dropped, retries in progress give up
+        with self.condition:
+            self.stats["dropped"] += len(self.pending)
+            self.pending.clear()
+            self.stop_event.set()
+            self.condition.notify_all()
+        for worker in self.workers:
+            worker.join(timeout=timeout)
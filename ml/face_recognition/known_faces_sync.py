@@ -0,0 +1,302 @@
+import base64
+import json
+import os
+import threading
+from urllib.parse import urljoin
+
+import numpy as np
+import requests
+
+from embedding_cache import EmbeddingCache
+
+KNOWN_FACES_MANIFEST_STATE_FILE = ".known_faces_manifest.json"
+
+
+class KnownFacesSync:
+    """Apply only what changed on the photo server since the last sync.
+
+    The manifest lists every photo with its SHA-256. Photos whose hash
+    matches the last applied manifest are skipped. For new or replaced ones
+    the encoding is taken from the local embedding cache or from the
+    server's embedding store, and only photos the server has not encoded yet
+    are downloaded, encoded here through ``process_face_image(filepath,
+    name)`` and their encodings posted back. Photos that disappeared from
+    the manifest are removed from ``face_index`` and the local directory.
+    ``fallback`` is called when the server has no manifest endpoint.
+    """
+
+    def __init__(
+        self,
+        manifest_endpoint,
+        known_faces_dir,
+        face_index,
+        embedding_cache,
+        process_face_image,
+        fallback,
+        timeout=30.0,
+        embedding_dtype="float32",
+    ):
+        self.manifest_endpoint = manifest_endpoint
+        self.known_faces_dir = known_faces_dir
+        self.face_index = face_index
+        self.embedding_cache = embedding_cache
+        self.process_face_image = process_face_image
+        self.fallback = fallback
+        self.timeout = timeout
+        self.embedding_dtype = embedding_dtype
+        self.lock = threading.Lock()
+
+    @property
+    def state_path(self):
+        return os.path.join(self.known_faces_dir, KNOWN_FACES_MANIFEST_STATE_FILE)
+
+    def load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                state = json.load(f)
+            return state.get("etag"), dict(state.get("faces", {}))
+        except FileNotFoundError:
+            return None, {}
+        except Exception as e:
+            print(f"Ignoring unreadable manifest state {self.state_path}: {e}")
+            return None, {}
+
+    def save_state(self, etag, faces):
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"etag": etag, "faces": faces}, f)
+        os.replace(tmp_path, self.state_path)
+
+    def sync(self):
+        with self.lock:
+            try:
+                self._sync()
+            except Exception as e:
+                print(f"Error syncing known faces from API: {e}")
+
+    def _sync(self):
+        etag, synced_faces = self.load_state()
+        headers = {}
+        if etag and all(
+            self.is_applied(filename, content_hash)
+            for filename, content_hash in synced_faces.items()
+        ):
+            headers["If-None-Match"] = etag
+
+        print(f"Syncing known faces from manifest: {self.manifest_endpoint}")
+        session = requests.Session()
+        response = session.get(
+            self.manifest_endpoint, headers=headers, timeout=self.timeout
+        )
+
+        if response.status_code == 304:
+            print("Known faces are up to date")
+            return
+        if response.status_code == 404:
+            print("Photo server has no manifest, fetching all known faces")
+            self.fallback()
+            return
+        if response.status_code != 200:
+            print(
+                f"Failed to fetch known faces manifest. Status code: {response.status_code}"
+            )
+            return
+
+        manifest = response.json()
+        embeddings_url = manifest.get("embeddings_url")
+        if embeddings_url:
+            embeddings_url = urljoin(self.manifest_endpoint, embeddings_url)
+        server_embeddings = None
+
+        faces = {}
+        changed = 0
+        downloaded = 0
+        failed = set()
+        encoded_here = []
+        for entry in manifest.get("faces", []):
+            filename = os.path.basename(entry["filename"])
+            name = os.path.splitext(filename)[0]
+            content_hash = entry["sha256"]
+
+            if synced_faces.get(filename) == content_hash and self.is_applied(
+                filename, content_hash
+            ):
+                faces[filename] = content_hash
+                continue
+
+            if content_hash not in self.embedding_cache and embeddings_url:
+                if server_embeddings is None:
+                    server_embeddings = self._fetch_server_embeddings(
+                        session, embeddings_url
+                    )
+                if content_hash in server_embeddings:
+                    self.embedding_cache.put(
+                        content_hash, server_embeddings[content_hash]
+                    )
+
+            if content_hash in self.embedding_cache:
+                self._apply_cached_face(name, content_hash)
+            else:
+                filepath = os.path.join(self.known_faces_dir, f"{name}.jpg")
+                if not self._download_face(
+                    session, entry, name, filepath, content_hash
+                ):
+                    # Keep whatever was applied before; the next sync retries
+                    failed.add(name)
+                    if filename in synced_faces:
+                        faces[filename] = synced_faces[filename]
+                    continue
+                downloaded += 1
+                encoded_here.append(content_hash)
+
+            faces[filename] = content_hash
+            changed += 1
+
+        removed = 0
+        for filename in synced_faces.keys() - faces.keys():
+            name = os.path.splitext(filename)[0]
+            if name in failed or any(os.path.splitext(f)[0] == name for f in faces):
+                continue
+            self._remove_face(name)
+            filepath = os.path.join(self.known_faces_dir, f"{name}.jpg")
+            if os.path.exists(filepath):
+                os.remove(filepath)
+            removed += 1
+
+        self.embedding_cache.save()
+        # Without the ETag a sync that skipped failed downloads is retried in
+        # full on the next refresh.
+        self.save_state(None if failed else response.headers.get("ETag"), faces)
+        print(
+            f"Known faces synced: {changed} added or updated "
+            f"({downloaded} photos downloaded), {removed} removed, "
+            f"{len(faces) - changed} unchanged, {len(failed)} failed"
+        )
+
+        if encoded_here and embeddings_url:
+            self._post_server_embeddings(session, embeddings_url, encoded_here)
+
+    def is_applied(self, filename, content_hash):
+        name = os.path.splitext(filename)[0]
+        if name in self.face_index:
+            return True
+        # Photos without a face are never in the index
+        return (
+            content_hash in self.embedding_cache
+            and self.embedding_cache.get(content_hash) is None
+        )
+
+    def _remove_face(self, name):
+        if self.face_index.remove(name):
+            print(f"Removed face: {name}")
+
+    def _remove_stale_photo(self, name, content_hash):
+        filepath = os.path.join(self.known_faces_dir, f"{name}.jpg")
+        try:
+            with open(filepath, "rb") as f:
+                if EmbeddingCache.content_hash(f.read()) == content_hash:
+                    return
+            os.remove(filepath)
+            print(f"Removed outdated photo {filepath}")
+        except FileNotFoundError:
+            pass
+
+    def _apply_cached_face(self, name, content_hash):
+        # The new photo is not downloaded, so the old one must not outlive it
+        self._remove_stale_photo(name, content_hash)
+
+        face_encoding = self.embedding_cache.get(content_hash)
+        if face_encoding is None:
+            print(f"No face detected in known face {name}")
+            self._remove_face(name)
+            return False
+
+        if self.face_index.add(name, face_encoding):
+            print(f"Added new face: {name}")
+        else:
+            print(f"Updated existing face: {name}")
+        return True
+
+    def _fetch_server_embeddings(self, session, embeddings_url):
+        try:
+            response = session.get(
+                embeddings_url,
+                params={"dtype": self.embedding_dtype},
+                timeout=self.timeout,
+            )
+            if response.status_code != 200:
+                print(
+                    f"Failed to fetch known face encodings. Status code: {response.status_code}"
+                )
+                return {}
+
+            data = response.json()
+            dtype = np.dtype(data.get("dtype", "float32")).newbyteorder("<")
+            embeddings = {}
+            for face in data.get("faces", []):
+                if face.get("status") == "ready":
+                    embeddings[face["sha256"]] = np.frombuffer(
+                        base64.b64decode(face["embedding"]), dtype=dtype
+                    ).astype(np.float32)
+                elif face.get("status") == "no_face":
+                    embeddings[face["sha256"]] = None
+            return embeddings
+        except Exception as e:
+            print(f"Error fetching known face encodings: {e}")
+            return {}
+
+    def _post_server_embeddings(self, session, embeddings_url, content_hashes):
+        faces = []
+        for content_hash in content_hashes:
+            face_encoding = self.embedding_cache.get(content_hash)
+            faces.append(
+                {
+                    "sha256": content_hash,
+                    "embedding": (
+                        None if face_encoding is None else face_encoding.tolist()
+                    ),
+                }
+            )
+
+        try:
+            response = session.post(
+                embeddings_url, json={"faces": faces}, timeout=self.timeout
+            )
+            if response.status_code == 200:
+                print(
+                    f"Shared {response.json().get('stored', 0)} face encodings with the photo server"
+                )
+            else:
+                print(
+                    f"Failed to share face encodings. Status code: {response.status_code}"
+                )
+        except Exception as e:
+            print(f"Error sharing face encodings: {e}")
+
+    def _download_face(self, session, entry, name, filepath, content_hash):
+        image_url = urljoin(self.manifest_endpoint, entry["url"])
+        try:
+            response = session.get(image_url, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"Failed to download {image_url}: {e}")
+            return False
+        if response.status_code != 200:
+            print(
+                f"Failed to download {image_url}. Status code: {response.status_code}"
+            )
+            return False
+
+        image_data = response.content
+        if EmbeddingCache.content_hash(image_data) != content_hash:
+            print(f"Downloaded {image_url} does not match its manifest hash")
+            return False
+
+        tmp_path = f"{filepath}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(image_data)
+        os.replace(tmp_path, filepath)
+
+        if not self.process_face_image(filepath, name):
+            # A photo without a face is still part of the synced state
+            self._remove_face(name)
+        return True
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from embedding_cache import EmbeddingCache
+from face_index import FACE_ENCODING_DIM
+
+
+def encoding(seed):
+    return np.random.default_rng(seed).normal(size=FACE_ENCODING_DIM)
+
+
+def test_content_hash_is_sha256():
+    assert EmbeddingCache.content_hash(b"photo") == hashlib.sha256(b"photo").hexdigest()
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("a", encoding(1))
+    cache.put("b", encoding(2))
+
+    # Pending encodings are visible before they are saved
+    assert "a" in cache
+    np.testing.assert_allclose(cache.get("a"), encoding(1).astype(np.float32))
+
+    cache.save()
+    assert not cache.dirty
+
+    loaded = EmbeddingCache(str(tmp_path))
+    assert "a" in loaded and "b" in loaded
+    np.testing.assert_allclose(loaded.get("a"), encoding(1).astype(np.float32))
+    np.testing.assert_allclose(loaded.get("b"), encoding(2).astype(np.float32))
+    assert loaded.get("missing") is None
+    assert "missing" not in loaded
+
+
+def test_photos_without_a_face_are_cached(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("no_face", None)
+    cache.put("face", encoding(1))
+    cache.save()
+
+    with open(cache.index_path) as f:
+        assert json.load(f)["no_face"] == -1
+    assert np.load(cache.matrix_path).shape == (1, FACE_ENCODING_DIM)
+
+    loaded = EmbeddingCache(str(tmp_path))
+    assert "no_face" in loaded
+    assert loaded.get("no_face") is None
+
+
+def test_put_replaces_a_saved_encoding(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("a", encoding(1))
+    cache.save()
+
+    cache.put("a", None)
+    assert cache.get("a") is None
+    cache.save()
+    assert EmbeddingCache(str(tmp_path)).get("a") is None
+
+
+def test_save_drops_photos_that_are_gone(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    for i, key in enumerate("abcd"):
+        cache.put(key, encoding(i))
+    cache.put("e", None)
+    cache.save()
+
+    cache.save(keep_hashes=["b", "d", "e"])
+    loaded = EmbeddingCache(str(tmp_path))
+    assert set(loaded.rows) == {"b", "d", "e"}
+    assert len(loaded.matrix) == 2
+    np.testing.assert_allclose(loaded.get("d"), encoding(3).astype(np.float32))
+    assert loaded.get("e") is None
+
+
+def test_save_without_changes_does_not_rewrite(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("a", encoding(1))
+    cache.save()
+    mtime = os.stat(cache.matrix_path).st_mtime_ns
+
+    cache.save()
+    cache.save(keep_hashes=["a", "other"])
+    assert os.stat(cache.matrix_path).st_mtime_ns == mtime
+
+
+def test_unreadable_cache_is_ignored(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("a", encoding(1))
+    cache.save()
+
+    # An index pointing past the matrix is treated as no cache at all
+    with open(cache.index_path, "w") as f:
+        json.dump({"a": 5}, f)
+    loaded = EmbeddingCache(str(tmp_path))
+    assert "a" not in loaded
+    assert len(loaded.matrix) == 0
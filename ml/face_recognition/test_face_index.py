@@ -0,0 +1,151 @@
+import numpy as np
+import pytest
+
+from face_index import (
+    FACE_ENCODING_DIM,
+    BruteForceIndex,
+    IVFIndex,
+    create_face_index,
+)
+
+
+def make_vectors(count, seed=0, clusters=32):
+    # Identities spread around a few cluster centres, like face encodings
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, FACE_ENCODING_DIM))
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centres[labels] + 0.3 * rng.normal(size=(count, FACE_ENCODING_DIM))
+    return vectors.astype(np.float32)
+
+
+def exact_search(keys, vectors, queries):
+    distances = np.linalg.norm(queries[:, None, :] - vectors[None, :, :], axis=2)
+    best = np.argmin(distances, axis=1)
+    return [keys[i] for i in best], distances[np.arange(len(queries)), best]
+
+
+def build(index, keys, vectors):
+    for key, vector in zip(keys, vectors):
+        index.add(key, vector)
+    return index
+
+
+@pytest.mark.parametrize("index_type", ["brute", "ivf"])
+def test_empty_index_returns_no_match(index_type):
+    index = create_face_index(index_type)
+    keys, distances = index.search(make_vectors(3))
+    assert keys == [None, None, None]
+    assert np.all(np.isinf(distances))
+
+
+def test_unknown_index_type():
+    with pytest.raises(ValueError):
+        create_face_index("lsh")
+
+
+def test_brute_force_matches_exact_search():
+    vectors = make_vectors(300)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+    queries = make_vectors(50, seed=1)
+
+    found, distances = build(BruteForceIndex(), keys, vectors).search(queries)
+    expected, expected_distances = exact_search(keys, vectors, queries)
+
+    assert found == expected
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-4)
+
+
+def test_untrained_ivf_is_exact():
+    vectors = make_vectors(200)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+    queries = make_vectors(50, seed=1)
+
+    ivf = build(IVFIndex(min_train_size=1024), keys, vectors)
+    brute = build(BruteForceIndex(), keys, vectors)
+
+    assert len(ivf.centroids) == 0
+    assert ivf.search(queries)[0] == brute.search(queries)[0]
+
+
+def test_trained_ivf_probing_every_list_matches_brute_force():
+    vectors = make_vectors(600)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+    queries = make_vectors(100, seed=1)
+
+    ivf = IVFIndex(n_lists=16, n_probe=16, min_train_size=256)
+    ivf.reset(keys, vectors)
+    brute = BruteForceIndex()
+    brute.reset(keys, vectors)
+
+    assert len(ivf.centroids) == 16
+    ivf_keys, ivf_distances = ivf.search(queries)
+    brute_keys, brute_distances = brute.search(queries)
+    assert ivf_keys == brute_keys
+    np.testing.assert_allclose(ivf_distances, brute_distances, rtol=1e-4, atol=1e-4)
+
+
+def test_trained_ivf_finds_stored_vectors_with_few_probes():
+    vectors = make_vectors(2000)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+
+    ivf = build(IVFIndex(n_probe=4, min_train_size=512), keys, vectors)
+
+    assert len(ivf) == len(keys)
+    assert len(ivf.centroids) > 1
+    # A stored vector is in the list of its own nearest centroid
+    found, distances = ivf.search(vectors[:200])
+    assert found == keys[:200]
+    np.testing.assert_allclose(distances, 0.0, atol=1e-2)
+
+
+@pytest.mark.parametrize(
+    "make_index",
+    [
+        BruteForceIndex,
+        lambda: IVFIndex(min_train_size=1024),
+        lambda: IVFIndex(n_lists=8, n_probe=8, min_train_size=64),
+    ],
+)
+def test_replacing_and_removing_keys(make_index):
+    vectors = make_vectors(300)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+    index = build(make_index(), keys, vectors)
+    brute = build(BruteForceIndex(), keys, vectors)
+
+    # Replacing a key moves it; the old vector must not match it any more
+    replacement = make_vectors(1, seed=7)[0] * 3.0
+    assert index.add("face_0", replacement) is False
+    brute.add("face_0", replacement)
+    assert len(index) == len(keys)
+    np.testing.assert_allclose(index.get("face_0"), replacement)
+
+    found, distances = index.search(replacement[None, :])
+    assert found == ["face_0"]
+    assert distances[0] == pytest.approx(0.0, abs=1e-2)
+    assert index.search(vectors[:1])[0] != ["face_0"]
+
+    removed = keys[1:50]
+    for key in removed:
+        assert index.remove(key) is True
+        brute.remove(key)
+    assert index.remove("face_1") is False
+    assert len(index) == len(keys) - len(removed)
+    assert "face_1" not in index
+    assert index.get("face_1") is None
+
+    queries = make_vectors(100, seed=2)
+    found = index.search(queries)[0]
+    assert not set(found) & set(removed)
+    assert found == brute.search(queries)[0]
+
+
+def test_reset_replaces_contents():
+    index = IVFIndex(min_train_size=64, n_lists=4, n_probe=4)
+    index.reset(["a", "b"], make_vectors(2))
+    vectors = make_vectors(100, seed=3)
+    keys = [f"face_{i}" for i in range(len(vectors))]
+    index.reset(keys, vectors)
+
+    assert sorted(index.keys()) == sorted(keys)
+    assert "a" not in index
+    assert index.search(vectors[:10])[0] == keys[:10]
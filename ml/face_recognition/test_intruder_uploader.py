@@ -0,0 +1,145 @@
+import base64
+import json
+import socket
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+import pytest
+
+from intruder_uploader import IntruderUploader
+
+FRAME = np.full((48, 64, 3), 128, dtype=np.uint8)
+
+
+class PhotoServer:
+    """Local photo API answering with the scripted status codes in order."""
+
+    def __init__(self, statuses):
+        self.statuses = list(statuses)
+        self.requests = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                server.requests.append(json.loads(body))
+                status = server.statuses.pop(0) if server.statuses else 200
+                self.send_response(status)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.endpoint = (
+            f"http://127.0.0.1:{self.httpd.server_address[1]}/v1/upload_intruder/"
+        )
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def uploader():
+    uploader = IntruderUploader(
+        workers=1, max_queue=4, timeout=2, max_retries=2, backoff=0.01
+    )
+    yield uploader
+    uploader.stop()
+
+
+def wait_for(uploader, count, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        metrics = uploader.metrics()
+        if metrics["uploaded"] + metrics["failed"] >= count:
+            return metrics
+        time.sleep(0.01)
+    raise AssertionError(f"uploads did not finish: {uploader.metrics()}")
+
+
+def test_upload_posts_a_jpeg(uploader):
+    server = PhotoServer([200])
+    try:
+        assert uploader.submit(server.endpoint, FRAME)
+        metrics = wait_for(uploader, 1)
+    finally:
+        server.close()
+
+    assert metrics["uploaded"] == 1 and metrics["retries"] == 0
+    (payload,) = server.requests
+    image = cv2.imdecode(
+        np.frombuffer(base64.b64decode(payload["image"]), np.uint8), cv2.IMREAD_COLOR
+    )
+    assert image.shape == FRAME.shape
+    assert payload["timestamp"] and payload["detected_at"]
+
+
+def test_snapshots_use_the_given_clock():
+    uploader = IntruderUploader(workers=0, clock=lambda: datetime(2024, 5, 6, 7, 8, 9))
+    uploader.submit("http://127.0.0.1:9/", FRAME)
+
+    _, _, timestamp, formatted_time = uploader.pending[0]
+    assert timestamp == "20240506_070809"
+    assert formatted_time == "2024-05-06 07:08:09"
+    uploader.stop()
+
+
+def test_server_errors_are_retried(uploader):
+    server = PhotoServer([503, 500, 200])
+    try:
+        uploader.submit(server.endpoint, FRAME)
+        metrics = wait_for(uploader, 1)
+    finally:
+        server.close()
+
+    assert metrics["uploaded"] == 1
+    assert metrics["retries"] == 2
+    assert len(server.requests) == 3
+
+
+def test_client_errors_are_not_retried(uploader):
+    server = PhotoServer([400])
+    try:
+        uploader.submit(server.endpoint, FRAME)
+        metrics = wait_for(uploader, 1)
+    finally:
+        server.close()
+
+    assert metrics["failed"] == 1
+    assert metrics["retries"] == 0
+    assert len(server.requests) == 1
+
+
+def test_connection_errors_give_up_after_max_retries(uploader):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    uploader.submit(f"http://127.0.0.1:{port}/v1/upload_intruder/", FRAME)
+    metrics = wait_for(uploader, 1)
+    assert metrics["failed"] == 1
+    assert metrics["retries"] == 2
+
+
+def test_full_queue_drops_the_oldest_snapshot():
+    # Without workers nothing leaves the queue
+    uploader = IntruderUploader(workers=0, max_queue=3)
+    frames = [np.full((8, 8, 3), i, dtype=np.uint8) for i in range(5)]
+    for frame in frames:
+        assert uploader.submit("http://127.0.0.1:9/", frame)
+
+    metrics = uploader.metrics()
+    assert metrics["dropped"] == 2
+    assert metrics["pending"] == 3
+    assert [job[1][0, 0, 0] for job in uploader.pending] == [2, 3, 4]
+
+    uploader.stop()
+    assert uploader.metrics()["dropped"] == 5
+    assert not uploader.submit("http://127.0.0.1:9/", frames[0])
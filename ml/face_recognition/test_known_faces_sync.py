@@ -0,0 +1,220 @@
+import base64
+import json
+import os
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache
+from face_index import FACE_ENCODING_DIM, BruteForceIndex
+from known_faces_sync import KnownFacesSync
+
+PHOTOS = {
+    "alice-v1": b"alice photo 1",
+    "alice-v2": b"alice photo 2",
+    "bob": b"bob photo",
+}
+
+
+def encoding(photo):
+    seed = sorted(PHOTOS.values()).index(photo)
+    return np.random.default_rng(seed).normal(size=FACE_ENCODING_DIM).astype(np.float32)
+
+
+def sha256(photo):
+    return EmbeddingCache.content_hash(photo)
+
+
+class PhotoServer:
+    """Local photo server answering GETs from a mutable route table."""
+
+    def __init__(self):
+        self.routes = {}
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                status, body = server.routes.get(path, (404, b""))
+                self.send_response(status)
+                if path == "/manifest/":
+                    self.send_header("ETag", f'"{len(body)}"')
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def publish(self, photos, status=None, urls=None, encoded=()):
+        """Serve a manifest listing ``photos`` (name -> PHOTOS key).
+
+        The embedding store holds the encodings of the ``encoded`` PHOTOS keys.
+        """
+        status, urls = status or {}, urls or {}
+        faces = []
+        for name, key in photos.items():
+            path = f"/photos/{name}.jpg"
+            self.routes[path] = (status.get(name, 200), PHOTOS[key])
+            faces.append(
+                {
+                    "filename": f"{name}.jpg",
+                    "url": urls.get(name, path),
+                    "sha256": sha256(PHOTOS[key]),
+                }
+            )
+        manifest = {"faces": faces, "embeddings_url": "/embeddings/"}
+        self.routes["/manifest/"] = (200, json.dumps(manifest).encode())
+
+        embeddings = [
+            {
+                "sha256": sha256(PHOTOS[key]),
+                "status": "ready",
+                "embedding": base64.b64encode(
+                    encoding(PHOTOS[key]).astype("<f4").tobytes()
+                ).decode(),
+            }
+            for key in encoded
+        ]
+        self.routes["/embeddings/"] = (
+            200,
+            json.dumps({"dtype": "float32", "faces": embeddings}).encode(),
+        )
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = PhotoServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sync(tmp_path, server):
+    face_index = BruteForceIndex()
+    embedding_cache = EmbeddingCache(str(tmp_path))
+
+    def process_face_image(filepath, name):
+        with open(filepath, "rb") as f:
+            photo = f.read()
+        embedding_cache.put(sha256(photo), encoding(photo))
+        face_index.add(name, encoding(photo))
+        return True
+
+    def fallback():
+        raise AssertionError("the manifest endpoint exists")
+
+    return KnownFacesSync(
+        f"{server.url}/manifest/",
+        str(tmp_path),
+        face_index,
+        embedding_cache,
+        process_face_image,
+        fallback,
+        timeout=5,
+    )
+
+
+def read_photo(sync, name):
+    with open(os.path.join(sync.known_faces_dir, f"{name}.jpg"), "rb") as f:
+        return f.read()
+
+
+def test_sync_adds_and_removes_faces(sync, server):
+    server.publish({"alice": "alice-v1", "bob": "bob"})
+    sync.sync()
+
+    assert set(sync.face_index.keys()) == {"alice", "bob"}
+    etag, faces = sync.load_state()
+    assert etag is not None
+    assert faces == {
+        "alice.jpg": sha256(PHOTOS["alice-v1"]),
+        "bob.jpg": sha256(PHOTOS["bob"]),
+    }
+
+    server.publish({"alice": "alice-v1"})
+    sync.sync()
+
+    assert list(sync.face_index.keys()) == ["alice"]
+    assert not os.path.exists(os.path.join(sync.known_faces_dir, "bob.jpg"))
+    assert sync.load_state()[1] == {"alice.jpg": sha256(PHOTOS["alice-v1"])}
+
+
+@pytest.mark.parametrize("failure", ["status", "hash", "connection"])
+def test_failed_update_keeps_the_previous_photo(sync, server, failure):
+    server.publish({"alice": "alice-v1", "bob": "bob"})
+    sync.sync()
+
+    status, urls = {}, {}
+    if failure == "status":
+        status["alice"] = 500
+    elif failure == "hash":
+        urls["alice"] = "/photos/bob.jpg"
+    else:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            urls["alice"] = f"http://127.0.0.1:{s.getsockname()[1]}/alice.jpg"
+    server.publish({"alice": "alice-v2", "bob": "bob"}, status=status, urls=urls)
+    sync.sync()
+
+    # The rider keeps their old photo until the new one can be downloaded
+    assert set(sync.face_index.keys()) == {"alice", "bob"}
+    np.testing.assert_allclose(
+        sync.face_index.get("alice"), encoding(PHOTOS["alice-v1"])
+    )
+    assert read_photo(sync, "alice") == PHOTOS["alice-v1"]
+    etag, faces = sync.load_state()
+    assert etag is None
+    assert faces["alice.jpg"] == sha256(PHOTOS["alice-v1"])
+
+    server.publish({"alice": "alice-v2", "bob": "bob"})
+    sync.sync()
+
+    np.testing.assert_allclose(
+        sync.face_index.get("alice"), encoding(PHOTOS["alice-v2"])
+    )
+    assert read_photo(sync, "alice") == PHOTOS["alice-v2"]
+    etag, faces = sync.load_state()
+    assert etag is not None
+    assert faces["alice.jpg"] == sha256(PHOTOS["alice-v2"])
+
+
+def test_failed_new_face_is_retried(sync, server):
+    server.publish({"alice": "alice-v1", "bob": "bob"}, status={"bob": 503})
+    sync.sync()
+
+    assert list(sync.face_index.keys()) == ["alice"]
+    etag, faces = sync.load_state()
+    assert etag is None
+    assert "bob.jpg" not in faces
+
+    server.publish({"alice": "alice-v1", "bob": "bob"})
+    sync.sync()
+    assert set(sync.face_index.keys()) == {"alice", "bob"}
+
+
+def test_synced_encoding_replaces_the_local_photo(sync, server):
+    server.publish({"alice": "alice-v1"})
+    sync.sync()
+    assert read_photo(sync, "alice") == PHOTOS["alice-v1"]
+
+    server.publish({"alice": "alice-v2"}, encoded=["alice-v2"])
+    sync.sync()
+
+    np.testing.assert_allclose(
+        sync.face_index.get("alice"), encoding(PHOTOS["alice-v2"])
+    )
+    # The old photo would otherwise be encoded again on the next startup
+    assert not os.path.exists(os.path.join(sync.known_faces_dir, "alice.jpg"))
+    assert sync.load_state()[1] == {"alice.jpg": sha256(PHOTOS["alice-v2"])}